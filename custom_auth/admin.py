@@ -1,9 +1,20 @@
 from django.contrib import admin
 
-from custom_auth.models import User
+from custom_auth.models import User, ApiToken
 
 
 class UserAdmin(admin.ModelAdmin):
     exclude = ['password']
 
 admin.site.register(User, UserAdmin)
+
+
+class ApiTokenAdmin(admin.ModelAdmin):
+    """ Tokens are created by create_api_token command, here revoked. """
+    list_display = ['user', 'timestamp']
+    exclude = ['key_digest']
+
+    def has_add_permission(self, request):
+        return False
+
+admin.site.register(ApiToken, ApiTokenAdmin)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_auth.models import User, ApiToken
+
+
+class Command(BaseCommand):
+    help = ('Creates API token of the user and prints its key, which '
+            'is sent in the "Authorization: Token <key>" header.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError('User does not exist.')
+
+        _, key = ApiToken.create_for(user)
+        self.stdout.write(key)
@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
@@ -19,3 +22,35 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def __str__(self):
         return self.username
+
+
+class ApiToken(models.Model):
+    """
+    Token authenticating the user in the API, e.g. for the scripts which
+    don't log in. Only the digest of the key is stored, the key itself
+    is shown once, when the token is created.
+    """
+    key_digest = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='api_tokens')
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def create_for(cls, user):
+        """
+        Creates new token of the user.
+        :return: Tuple of the token and its key.
+        """
+        key = secrets.token_hex(32)
+        return cls.objects.create(key_digest=cls.digest(key), user=user), key
+
+    @classmethod
+    def user_for(cls, key):
+        """ Returns user of the token with the key, None if there is none. """
+        token = cls.objects.select_related('user').filter(
+            key_digest=cls.digest(key)).first()
+        return token.user if token is not None else None
@@ -1,9 +1,12 @@
+from io import StringIO
+
+from django.core.management import call_command, CommandError
 from django.test import TestCase, TransactionTestCase
 from django.shortcuts import reverse
 
 from projektPZ import status
 
-from custom_auth.models import User
+from custom_auth.models import User, ApiToken
 
 
 class RegisterUserTestCase(TransactionTestCase):
@@ -234,3 +237,17 @@ class LogoutUserTestCase(TestCase):
         response = self.client.get('/logout/')
 
         self.assertRedirects(response, reverse('index'))
+
+
+class CreateApiTokenTestCase(TestCase):
+    def test_created_key_authenticates_the_user(self):
+        user = User.objects.create_user('username', 'password')
+        stdout = StringIO()
+
+        call_command('create_api_token', 'username', stdout=stdout)
+
+        self.assertEqual(ApiToken.user_for(stdout.getvalue().strip()), user)
+
+    def test_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command('create_api_token', 'username', stdout=StringIO())
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from device.models import Device, Version
+from device.models import Device, Version, Rollout
 
 
 admin.site.register(Device)
 admin.site.register(Version)
+admin.site.register(Rollout)
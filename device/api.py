@@ -0,0 +1,494 @@
+"""
+JSON API of the devices, groups and their versions.
+
+Bulk endpoints take arrays of objects, which are all validated before
+anything is written. They are then written in one transaction, with one
+query per API_BATCH_SIZE objects instead of one query per object. New
+versions are uploaded with the chunked upload endpoints.
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, F
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import reverse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from projektPZ import status
+
+from custom_auth.models import ApiToken
+
+from device.forms import (DeviceApiForm, DeviceApiUpdateForm,
+                          DeviceGroupApiForm, DeviceGroupApiUpdateForm,
+                          DeviceGroupDeviceForm, DeviceGroupDevicesForm)
+from device.models import Device, DeviceGroup, Version, SearchEntry
+from device.pagination import paginate
+from device.search import search
+from device.utils import batches, invalidate_check_in
+
+
+def device_data(device):
+    return {
+        'uuid': device.uuid,
+        'name': device.name,
+        'ip_address': device.ip_address,
+        'is_active': device.is_active,
+        'timestamp': device.timestamp,
+        'last_updated': device.last_updated,
+        'version': device.version.uuid if device.version_id else None,
+        'is_up_to_date': device.is_up_to_date,
+        'versions_behind': device.versions_behind,
+    }
+
+
+def group_data(group):
+    return {
+        'uuid': group.uuid,
+        'name': group.name,
+        'timestamp': group.timestamp,
+        'last_updated': group.last_updated,
+        'version': group.version.uuid if group._version_id else None,
+    }
+
+
+def version_data(version):
+    return {
+        'uuid': version.uuid,
+        'name': version.name,
+        'timestamp': version.timestamp,
+        'checksum': bytes(version.file_checksum).hex(),
+        'sequence': version.sequence,
+        'is_rolled_back': version.is_rolled_back,
+        'download_url': reverse('version_download',
+                                kwargs={'version_uuid': version.uuid}),
+    }
+
+
+def search_result_data(entry):
+    url_names = {
+        SearchEntry.DEVICE: ('device_details', 'device_uuid'),
+        SearchEntry.GROUP: ('group_details', 'group_uuid'),
+        SearchEntry.VERSION: ('version_download', 'version_uuid'),
+    }
+    url_name, url_kwarg = url_names[entry.kind]
+    entry_uuid = uuid.UUID(entry.uuid)
+
+    return {
+        'kind': entry.kind,
+        'uuid': entry_uuid,
+        'name': entry.name,
+        'ip_address': entry.ip_address or None,
+        'url': reverse(url_name, kwargs={url_kwarg: entry_uuid}),
+    }
+
+
+class InvalidRequest(Exception):
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class CsrfCheck(CsrfViewMiddleware):
+    """ CSRF check returning the reason of the rejection, if any. """
+
+    def _reject(self, request, reason):
+        return reason
+
+
+class ApiView(View):
+    """
+    Base of the API views. Users are authenticated by the API token sent
+    in the `Authorization: Token <key>` header or by the session, which
+    must then pass the CSRF check. Errors of the authentication are JSON
+    responses instead of the redirect to the login page or the CSRF
+    failure page.
+    """
+    TOKEN_KEYWORD = 'Token'
+    AUTHENTICATION_MESSAGE = 'Authentication credentials were not provided.'
+    INVALID_TOKEN_MESSAGE = 'Invalid token.'
+    CSRF_MESSAGE = 'CSRF check failed: {}'
+    INVALID_JSON_MESSAGE = 'Request body must be valid JSON.'
+    NOT_LIST_MESSAGE = 'Request body must be an array.'
+    TOO_MANY_MESSAGE = 'Too many objects in the request.'
+    NOT_FOUND_MESSAGE = 'Object does not exist.'
+    FORBIDDEN_MESSAGE = 'You do not have permission to access this object.'
+    DUPLICATED_MESSAGE = 'Every object may be updated once per request.'
+    MISSING_MESSAGE = 'Some of the objects do not exist.'
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            self.authenticate(request)
+            return super().dispatch(request, *args, **kwargs)
+        except InvalidRequest as error:
+            return error.response
+
+    def authenticate(self, request):
+        """
+        Sets the user of the token given in the request, otherwise checks
+        the user of the session and the CSRF token of the request.
+        """
+        keyword, _, key = request.META.get(
+            'HTTP_AUTHORIZATION', '').partition(' ')
+
+        if keyword == self.TOKEN_KEYWORD:
+            user = ApiToken.user_for(key.strip())
+            if user is None or not user.is_active:
+                raise InvalidRequest(self.error_response(
+                    self.INVALID_TOKEN_MESSAGE, status.HTTP_401_UNAUTHORIZED))
+            request.user = user
+            return
+
+        if not request.user.is_authenticated:
+            raise InvalidRequest(self.error_response(
+                self.AUTHENTICATION_MESSAGE, status.HTTP_401_UNAUTHORIZED))
+
+        reason = CsrfCheck().process_view(request, None, (), {})
+        if reason is not None:
+            raise InvalidRequest(self.error_response(
+                self.CSRF_MESSAGE.format(reason), status.HTTP_403_FORBIDDEN))
+
+    @staticmethod
+    def error_response(message, status_code):
+        data = {
+            'errors': {
+                'data': [{
+                    'message': message
+                }]
+            }
+        }
+        return JsonResponse(data=data, status=status_code)
+
+    def parse_list(self, request):
+        """ Returns array sent in the request body. """
+        try:
+            items = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            raise InvalidRequest(self.error_response(
+                self.INVALID_JSON_MESSAGE, status.HTTP_400_BAD_REQUEST))
+
+        if not isinstance(items, list):
+            raise InvalidRequest(self.error_response(
+                self.NOT_LIST_MESSAGE, status.HTTP_400_BAD_REQUEST))
+
+        if len(items) > settings.API_MAX_BULK_SIZE:
+            raise InvalidRequest(self.error_response(
+                self.TOO_MANY_MESSAGE, status.HTTP_400_BAD_REQUEST))
+
+        return items
+
+    def validate_list(self, request, form_class):
+        """
+        Validates every object of the array sent in the request body.
+        :return: List of cleaned data of the objects.
+        """
+        items = [item if isinstance(item, dict) else {}
+                 for item in self.parse_list(request)]
+        return self.validate_items(items, form_class)
+
+    def validate_uuids(self, request):
+        """ Returns list of uuids sent as array in the request body. """
+        items = [{'device_uuid': item} for item in self.parse_list(request)]
+        return [data['device_uuid']
+                for data in self.validate_items(items, DeviceGroupDeviceForm)]
+
+    @staticmethod
+    def validate_items(items, form_class):
+        forms = [form_class(data=item) for item in items]
+
+        errors = {str(index): json.loads(form.errors.as_json())
+                  for index, form in enumerate(forms)
+                  if not form.is_valid()}
+        if errors:
+            raise InvalidRequest(JsonResponse(
+                data={'errors': errors}, status=status.HTTP_400_BAD_REQUEST))
+
+        return [form.cleaned_data for form in forms]
+
+    def get_owned(self, queryset, object_uuid):
+        owned_object = queryset.filter(uuid=object_uuid,
+                                       is_active=True).first()
+
+        if owned_object is None:
+            raise InvalidRequest(self.error_response(
+                self.NOT_FOUND_MESSAGE, status.HTTP_404_NOT_FOUND))
+
+        if owned_object.owner_id != self.request.user.id:
+            raise InvalidRequest(self.error_response(
+                self.FORBIDDEN_MESSAGE, status.HTTP_403_FORBIDDEN))
+
+        return owned_object
+
+    def bulk_update(self, request, queryset, form_class, field_names, index):
+        """
+        Updates the objects of the queryset given by the array of their
+        uuids and changed fields, with one query per batch. Nothing is
+        changed unless all the objects are found.
+        :param field_names: Names of the fields which may be changed.
+        :param index: Method of SearchEntry indexing the updated objects.
+        :return: Number of updated objects.
+        """
+        updates = self.validate_list(request, form_class)
+
+        object_uuids = [data['uuid'] for data in updates]
+        if len(set(object_uuids)) != len(object_uuids):
+            raise InvalidRequest(self.error_response(
+                self.DUPLICATED_MESSAGE, status.HTTP_400_BAD_REQUEST))
+
+        with transaction.atomic():
+            updated_count = 0
+            for batch in batches(updates):
+                updated_count += self.update_batch(queryset, batch,
+                                                   field_names)
+                index(queryset.filter(
+                    uuid__in=[data['uuid'] for data in batch]))
+
+            if updated_count != len(updates):
+                raise InvalidRequest(self.error_response(
+                    self.MISSING_MESSAGE, status.HTTP_404_NOT_FOUND))
+
+        return updated_count
+
+    @staticmethod
+    def update_batch(queryset, updates, field_names):
+        """ Updates batch of the objects with a single query. """
+        model = queryset.model
+        changes = {}
+        for field_name in field_names:
+            whens = [When(uuid=data['uuid'], then=Value(data[field_name]))
+                     for data in updates if data.get(field_name)]
+            if whens:
+                changes[field_name] = Case(
+                    *whens, default=F(field_name),
+                    output_field=model._meta.get_field(field_name))
+
+        return queryset.filter(
+            uuid__in=[data['uuid'] for data in updates]
+        ).update(last_edited=timezone.now(), **changes)
+
+    @staticmethod
+    def page_response(request, queryset, serialize, descending=False):
+        page = paginate(request, queryset, descending=descending)
+        return JsonResponse({
+            'results': [serialize(obj) for obj in page],
+            'next': page.next_cursor if page.has_next() else None,
+            'previous': page.previous_cursor if page.has_previous() else None,
+        })
+
+
+class DeviceCollectionApiView(ApiView):
+    """ Lists devices, creates and updates them in bulk. """
+    UPDATED_FIELDS = ('name', 'ip_address')
+    DUPLICATED_MESSAGE = 'Every device may be updated once per request.'
+    MISSING_MESSAGE = 'Some of the devices do not exist.'
+
+    def get(self, request):
+        devices = Device.objects.filter(
+            owner=request.user, is_active=True
+        ).select_related('version').with_update_status()
+        return self.page_response(request, devices, device_data)
+
+    def post(self, request):
+        devices = [Device(owner=request.user, **data)
+                   for data in self.validate_list(request, DeviceApiForm)]
+
+        with transaction.atomic():
+            for batch in batches(devices):
+                Device.objects.bulk_create(batch)
+                SearchEntry.index_devices(Device.objects.filter(
+                    uuid__in=[device.uuid for device in batch]))
+
+        return JsonResponse({'results': [device_data(device)
+                                         for device in devices]},
+                            status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        devices = Device.objects.filter(owner=request.user, is_active=True)
+        updated_count = self.bulk_update(request, devices, DeviceApiUpdateForm,
+                                         self.UPDATED_FIELDS,
+                                         SearchEntry.index_devices)
+        return JsonResponse({'updated': updated_count})
+
+
+class DeviceDeactivateApiView(ApiView):
+    """ Deactivates devices in bulk. """
+
+    def post(self, request):
+        device_uuids = self.validate_uuids(request)
+
+        with transaction.atomic():
+            deactivated_count = 0
+            for batch in batches(device_uuids):
+                devices = Device.objects.filter(owner=request.user,
+                                                uuid__in=batch)
+                deactivated_count += devices.filter(is_active=True).update(
+                    is_active=False, last_edited=timezone.now())
+                SearchEntry.remove_objects(SearchEntry.DEVICE,
+                                           devices.values('pk'))
+
+            invalidate_check_in(device_uuids)
+
+        return JsonResponse({'deactivated': deactivated_count})
+
+
+class DeviceApiView(ApiView):
+
+    def get(self, request, device_uuid):
+        device = self.get_owned(
+            Device.objects.select_related('version').with_update_status(),
+            device_uuid)
+        return JsonResponse(device_data(device))
+
+
+class DeviceVersionsApiView(ApiView):
+
+    def get(self, request, device_uuid):
+        device = self.get_owned(Device.objects.all(), device_uuid)
+        return self.page_response(request, Version.objects.for_object(device),
+                                  version_data, descending=True)
+
+
+class GroupCollectionApiView(ApiView):
+    """ Lists groups, creates and updates them in bulk. """
+    UPDATED_FIELDS = ('name',)
+    DUPLICATED_MESSAGE = 'Every group may be updated once per request.'
+    MISSING_MESSAGE = 'Some of the groups do not exist.'
+
+    def get(self, request):
+        groups = DeviceGroup.objects.filter(
+            owner=request.user, is_active=True).select_related('_version')
+        return self.page_response(request, groups, group_data)
+
+    def post(self, request):
+        groups = [DeviceGroup(owner=request.user, **data)
+                  for data in self.validate_list(request, DeviceGroupApiForm)]
+
+        with transaction.atomic():
+            for batch in batches(groups):
+                DeviceGroup.objects.bulk_create(batch)
+                SearchEntry.index_groups(DeviceGroup.objects.filter(
+                    uuid__in=[group.uuid for group in batch]))
+
+        return JsonResponse({'results': [group_data(group)
+                                         for group in groups]},
+                            status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        groups = DeviceGroup.objects.filter(owner=request.user,
+                                            is_active=True)
+        updated_count = self.bulk_update(request, groups,
+                                         DeviceGroupApiUpdateForm,
+                                         self.UPDATED_FIELDS,
+                                         SearchEntry.index_groups)
+        return JsonResponse({'updated': updated_count})
+
+
+class GroupDeactivateApiView(ApiView):
+    """ Deactivates groups in bulk. """
+
+    def post(self, request):
+        group_uuids = self.validate_uuids(request)
+
+        with transaction.atomic():
+            deactivated_count = 0
+            for batch in batches(group_uuids):
+                groups = DeviceGroup.objects.filter(owner=request.user,
+                                                    uuid__in=batch)
+                deactivated_count += groups.filter(is_active=True).update(
+                    is_active=False, last_edited=timezone.now())
+                SearchEntry.remove_objects(SearchEntry.GROUP,
+                                           groups.values('pk'))
+
+        return JsonResponse({'deactivated': deactivated_count})
+
+
+class GroupApiView(ApiView):
+
+    def get(self, request, group_uuid):
+        group = self.get_owned(DeviceGroup.objects.select_related('_version'),
+                               group_uuid)
+        return JsonResponse(group_data(group))
+
+
+class GroupVersionsApiView(ApiView):
+
+    def get(self, request, group_uuid):
+        group = self.get_owned(DeviceGroup.objects.all(), group_uuid)
+        return self.page_response(request, Version.objects.for_object(group),
+                                  version_data, descending=True)
+
+
+class GroupDevicesApiView(ApiView):
+    """ Lists members of the group, adds and removes them in bulk. """
+
+    def get(self, request, group_uuid):
+        group = self.get_owned(DeviceGroup.objects.all(), group_uuid)
+        devices = group.devices.filter(
+            is_active=True).select_related('version').with_update_status()
+        return self.page_response(request, devices, device_data,
+                                  descending=True)
+
+    def post(self, request, group_uuid):
+        return JsonResponse({'added': self.change_membership(
+            request, group_uuid, DeviceGroup.add_devices)})
+
+    def delete(self, request, group_uuid):
+        return JsonResponse({'removed': self.change_membership(
+            request, group_uuid, DeviceGroup.remove_devices)})
+
+    def change_membership(self, request, group_uuid, change):
+        """
+        Adds or removes devices given as array of uuids or chosen by
+        the object with `q` or `all`, like DeviceGroupDevicesForm.
+        Devices of the other users are skipped.
+        :return: Number of added or removed devices.
+        """
+        group = self.get_owned(DeviceGroup.objects.all(), group_uuid)
+        form = DeviceGroupDevicesForm(data=self.parse_selection(request))
+        if not form.is_valid():
+            raise InvalidRequest(JsonResponse(
+                data={'errors': json.loads(form.errors.as_json())},
+                status=status.HTTP_400_BAD_REQUEST))
+
+        owned_devices = Device.objects.filter(owner=request.user,
+                                              is_active=True)
+
+        with transaction.atomic():
+            return sum(change(group, devices)
+                       for devices in form.select_devices(owned_devices))
+
+    def parse_selection(self, request):
+        """ Returns form data of the array or the object in the body. """
+        try:
+            selection = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            raise InvalidRequest(self.error_response(
+                self.INVALID_JSON_MESSAGE, status.HTTP_400_BAD_REQUEST))
+
+        if isinstance(selection, dict):
+            return selection
+        return {'device_uuid': self.parse_list(request)}
+
+
+class SearchApiView(ApiView):
+    """
+    Finds devices, groups and versions of the user by the prefixes
+    of the words of their names, uuids and ip addresses given in `q`.
+    """
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', settings.SEARCH_RESULTS))
+        except ValueError:
+            limit = settings.SEARCH_RESULTS
+        limit = min(max(limit, 1), settings.MAX_PAGE_SIZE)
+
+        entries = search(request.GET.get('q', ''), request.user, limit)
+        return JsonResponse({'results': [search_result_data(entry)
+                                         for entry in entries]})
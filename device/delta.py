@@ -0,0 +1,283 @@
+"""
+Binary deltas between consecutive versions of the same file.
+
+Delta is a zlib compressed stream of operations which rebuild the new
+file from the old one:
+    COPY   - copy `length` bytes found at `offset` of the old file,
+    INSERT - insert `length` bytes stored in the delta itself.
+Old file is split into blocks which are indexed by their adler32
+checksum, the new file is then scanned for these blocks at every
+offset, so blocks shifted by inserted or removed data are still found.
+The checksum is rolled along the new file, a byte at a time, so every
+offset costs a few arithmetic operations, not a checksum of a block.
+"""
+import mmap
+import os
+import struct
+import zlib
+
+
+MAGIC = b'PZDELTA1'
+
+BLOCK_SIZE = 4096
+ADLER_MODULUS = 65521
+MAX_LITERAL_RATIO = 0.5
+COPY_BUFFER_SIZE = 1024 * 1024
+
+COPY = b'C'
+INSERT = b'I'
+
+COPY_FORMAT = struct.Struct('>QQ')
+INSERT_FORMAT = struct.Struct('>Q')
+
+
+class DeltaTooLarge(Exception):
+    """ Raised when the delta would not be much smaller than the file. """
+
+
+class _DeltaWriter:
+    """ Writes operations of the delta, merging adjacent copies. """
+
+    def __init__(self, output):
+        self.output = output
+        self.compressor = zlib.compressobj(9)
+        self.copy_offset = None
+        self.copy_length = 0
+
+        output.write(MAGIC)
+
+    def _write(self, data):
+        self.output.write(self.compressor.compress(data))
+
+    def _flush_copy(self):
+        if self.copy_length:
+            self._write(COPY + COPY_FORMAT.pack(self.copy_offset,
+                                                self.copy_length))
+        self.copy_offset = None
+        self.copy_length = 0
+
+    def copy(self, offset, length):
+        if self.copy_length and self.copy_offset + self.copy_length == offset:
+            self.copy_length += length
+            return
+
+        self._flush_copy()
+        self.copy_offset = offset
+        self.copy_length = length
+
+    def insert(self, data):
+        if not data:
+            return
+
+        self._flush_copy()
+        self._write(INSERT + INSERT_FORMAT.pack(len(data)))
+        self._write(data)
+
+    def close(self):
+        self._flush_copy()
+        self.output.write(self.compressor.flush())
+
+
+def _map(file):
+    """ Maps file to memory, empty files can not be mapped. """
+    if os.fstat(file.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _index_blocks(base, block_size):
+    index = {}
+    for offset in range(0, len(base) - block_size + 1, block_size):
+        block_checksum = zlib.adler32(base[offset:offset + block_size])
+        index.setdefault(block_checksum, offset)
+    return index
+
+
+def _match_length(base, base_offset, target, target_offset, block_size):
+    """ Returns length of the common data starting at given offsets. """
+    length = 0
+    while True:
+        base_chunk = base[base_offset + length:base_offset + length + block_size]
+        target_chunk = target[target_offset + length:
+                              target_offset + length + block_size]
+
+        if not base_chunk or not target_chunk:
+            return length
+
+        if base_chunk == target_chunk:
+            length += len(base_chunk)
+            continue
+
+        return length + len(os.path.commonprefix([base_chunk, target_chunk]))
+
+
+def generate_delta(base_file_name, target_file_name, output,
+                   block_size=BLOCK_SIZE, max_literal_ratio=MAX_LITERAL_RATIO):
+    """
+    Generates delta which rebuilds target file from the base file.
+    :param base_file_name: Name of the old file.
+    :param target_file_name: Name of the new file.
+    :param output: Binary file object the delta is written to.
+    :param block_size: Size of the blocks of the old file looked for.
+    :param max_literal_ratio: Part of the new file which may be stored
+    in the delta itself before generating it is abandoned.
+    :raises DeltaTooLarge: If the delta is not worth storing.
+    """
+    with open(base_file_name, 'rb') as base_file, \
+            open(target_file_name, 'rb') as target_file:
+        base = _map(base_file)
+        target = _map(target_file)
+
+        try:
+            _write_delta(base, target, output, block_size,
+                         int(len(target) * max_literal_ratio))
+        finally:
+            for mapped_file in (base, target):
+                if isinstance(mapped_file, mmap.mmap):
+                    mapped_file.close()
+
+
+def _write_delta(base, target, output, block_size, max_literal_length):
+    index = _index_blocks(base, block_size)
+    literal_length = 0
+
+    writer = _DeltaWriter(output)
+    literal_start = position = 0
+    target_length = len(target)
+
+    # Adler32 of the block at the position, split into its two sums,
+    # rolled by a byte on every miss instead of being computed again.
+    weak_sum = None
+
+    while position + block_size <= target_length:
+        if weak_sum is None:
+            checksum = zlib.adler32(target[position:position + block_size])
+            weak_sum, prefix_sum = checksum & 0xffff, checksum >> 16
+        else:
+            checksum = (prefix_sum << 16) | weak_sum
+
+        offset = index.get(checksum)
+
+        if offset is None or (base[offset:offset + block_size] !=
+                              target[position:position + block_size]):
+            if position + block_size < target_length:
+                removed = target[position]
+                weak_sum = (weak_sum - removed +
+                            target[position + block_size]) % ADLER_MODULUS
+                prefix_sum = (prefix_sum - block_size * removed +
+                              weak_sum - 1) % ADLER_MODULUS
+            position += 1
+
+            if literal_length + position - literal_start > max_literal_length:
+                raise DeltaTooLarge()
+            continue
+
+        # Data preceding the match often matches as well when
+        # the block has been found after shifting.
+        while (position > literal_start and offset > 0 and
+               target[position - 1] == base[offset - 1]):
+            position -= 1
+            offset -= 1
+
+        length = _match_length(base, offset, target, position, block_size)
+
+        literal_length += position - literal_start
+        if literal_length > max_literal_length:
+            raise DeltaTooLarge()
+
+        writer.insert(target[literal_start:position])
+        writer.copy(offset, length)
+
+        position += length
+        literal_start = position
+        weak_sum = None
+
+    literal_length += len(target) - literal_start
+    if literal_length > max_literal_length:
+        raise DeltaTooLarge()
+
+    writer.insert(target[literal_start:])
+    writer.close()
+
+
+def _decompressed(delta):
+    decompressor = zlib.decompressobj()
+    data = b''
+
+    while True:
+        if not data:
+            data = delta.read(COPY_BUFFER_SIZE)
+            if not data:
+                break
+
+        # Output is bounded, so highly compressed data can not exhaust memory.
+        yield decompressor.decompress(data, COPY_BUFFER_SIZE)
+        data = decompressor.unconsumed_tail
+
+    yield decompressor.flush()
+
+
+class _Reader:
+    """ Reads exact number of bytes from the decompressed delta. """
+
+    def __init__(self, delta):
+        self.chunks = _decompressed(delta)
+        self.buffer = b''
+        self.position = 0
+
+    def read(self, size):
+        while len(self.buffer) - self.position < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer = self.buffer[self.position:] + chunk
+            self.position = 0
+
+        data = self.buffer[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+
+def apply_delta(base_file_name, delta, output):
+    """
+    Rebuilds the new file from the old file and the delta.
+    :param base_file_name: Name of the old file.
+    :param delta: Binary file object with the delta.
+    :param output: Binary file object the new file is written to.
+    :raises ValueError: If the delta is malformed.
+    """
+    if delta.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a delta file.')
+
+    reader = _Reader(delta)
+
+    with open(base_file_name, 'rb') as base_file:
+        while True:
+            operation = reader.read(1)
+
+            if not operation:
+                return
+
+            if operation == COPY:
+                offset, length = COPY_FORMAT.unpack(
+                    reader.read(COPY_FORMAT.size))
+                base_file.seek(offset)
+                while length:
+                    data = base_file.read(min(length, COPY_BUFFER_SIZE))
+                    if not data:
+                        raise ValueError('Delta does not match the file.')
+                    output.write(data)
+                    length -= len(data)
+
+            elif operation == INSERT:
+                length, = INSERT_FORMAT.unpack(
+                    reader.read(INSERT_FORMAT.size))
+                while length:
+                    data = reader.read(min(length, COPY_BUFFER_SIZE))
+                    if not data:
+                        raise ValueError('Delta is truncated.')
+                    output.write(data)
+                    length -= len(data)
+
+            else:
+                raise ValueError('Unknown delta operation.')
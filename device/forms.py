@@ -1,6 +1,9 @@
+from datetime import timedelta
+
 from django import forms
 
 from device.models import Device, Version, DeviceGroup
+from device.utils import batches
 
 
 class DeviceForm(forms.ModelForm):
@@ -12,7 +15,7 @@ class DeviceForm(forms.ModelForm):
 
     class Meta:
         model = Device
-        exclude = ['id']
+        fields = ['name', 'ip_address']
 
 
 class DeviceEditForm(forms.ModelForm):
@@ -25,7 +28,7 @@ class DeviceEditForm(forms.ModelForm):
 
     class Meta:
         model = Device
-        exclude = ['id']
+        fields = ['name', 'ip_address']
 
 
 class VersionForm(forms.ModelForm):
@@ -38,7 +41,7 @@ class VersionForm(forms.ModelForm):
 
     class Meta:
         model = Version
-        exclude = ['id', 'versioned_object', 'object_id', 'content_type']
+        fields = ['name', 'file']
 
 
 class DeviceGroupForm(forms.ModelForm):
@@ -50,8 +53,175 @@ class DeviceGroupForm(forms.ModelForm):
 
     class Meta:
         model = DeviceGroup
-        exclude = ['id']
+        fields = ['name']
 
 
 class DeviceGroupDeviceForm(forms.Form):
     device_uuid = forms.UUIDField()
+
+
+class MultipleUUIDField(forms.Field):
+    """ Field of the uuids given as repeated values of the parameter. """
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+
+        uuid_field = forms.UUIDField()
+        return [uuid_field.clean(item) for item in value]
+
+
+class DeviceGroupDevicesForm(forms.Form):
+    """
+    Devices added to or removed from the group, chosen by their uuids,
+    by the prefix of their name or ip address (`q`, like the search
+    of the lists) or all of them, which must be chosen explicitly.
+    """
+    device_uuid = MultipleUUIDField(required=False)
+    q = forms.CharField(max_length=50, required=False)
+    all = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not (cleaned_data.get('device_uuid') or cleaned_data.get('q') or
+                cleaned_data.get('all')):
+            raise forms.ValidationError('Devices must be chosen by uuids, '
+                                        'search query or all of them.')
+        return cleaned_data
+
+    def select_devices(self, devices):
+        """
+        Yields querysets of the chosen devices out of the given ones.
+        Uuids are split into batches, so that every query fits into
+        the limit of the query parameters.
+        """
+        query = self.cleaned_data['q']
+        if query:
+            devices = devices.search(query)
+
+        device_uuids = self.cleaned_data['device_uuid']
+        if not device_uuids:
+            yield devices
+            return
+
+        for batch in batches(device_uuids):
+            yield devices.filter(uuid__in=batch)
+
+
+class VersionUploadForm(forms.Form):
+    name = forms.CharField(max_length=50)
+    size = forms.IntegerField(min_value=0)
+
+
+class RolloutForm(forms.Form):
+    """
+    Optional waves of the rollout of the group version given as increasing
+    percentages of the members, e.g. "1,10,50,100". Delay (in minutes)
+    and success threshold are given for every wave the same way, e.g.
+    "5,30,60,0", or as a single value shared by all of the waves.
+    """
+    waves = forms.CharField(max_length=100, required=False)
+    wave_delay = forms.CharField(max_length=100, required=False)
+    success_threshold = forms.CharField(max_length=100, required=False)
+
+    DEFAULT_WAVE_DELAY = 60
+    DEFAULT_SUCCESS_THRESHOLD = 0
+
+    def clean_waves(self):
+        waves = self.cleaned_data['waves'].strip()
+        if not waves:
+            return []
+
+        try:
+            percentages = [int(wave) for wave in waves.split(',')]
+        except ValueError:
+            raise forms.ValidationError('Waves must be comma separated '
+                                        'percentages.')
+
+        if percentages != sorted(set(percentages)) or percentages[0] < 1:
+            raise forms.ValidationError('Waves must be increasing '
+                                        'percentages.')
+
+        if percentages[-1] != 100:
+            raise forms.ValidationError('Last wave must reach 100 percent '
+                                        'of the devices.')
+
+        return percentages
+
+    def clean_wave_delay(self):
+        return self.clean_wave_values(
+            'wave_delay', int, lambda delay: delay >= 0,
+            'Delays must be comma separated numbers of minutes.')
+
+    def clean_success_threshold(self):
+        return self.clean_wave_values(
+            'success_threshold', float, lambda threshold: 0 <= threshold <= 1,
+            'Success thresholds must be comma separated numbers '
+            'between 0 and 1.')
+
+    def clean_wave_values(self, field_name, convert, is_valid, message):
+        """ Parses comma separated values of the waves. """
+        values = self.cleaned_data[field_name].strip()
+        if not values:
+            return []
+
+        try:
+            values = [convert(value) for value in values.split(',')]
+        except ValueError:
+            raise forms.ValidationError(message)
+
+        if not all(is_valid(value) for value in values):
+            raise forms.ValidationError(message)
+
+        return values
+
+    def clean(self):
+        cleaned_data = super().clean()
+        wave_count = len(cleaned_data.get('waves') or [])
+
+        for field_name in ('wave_delay', 'success_threshold'):
+            values = cleaned_data.get(field_name) or []
+            if len(values) > 1 and len(values) != wave_count:
+                self.add_error(field_name, 'Give a single value or one value '
+                                           'per wave.')
+
+        return cleaned_data
+
+    def get_waves(self):
+        """ List of waves to be passed to Version.publish. """
+        percentages = self.cleaned_data['waves']
+        delays = self.wave_values('wave_delay', self.DEFAULT_WAVE_DELAY)
+        success_thresholds = self.wave_values('success_threshold',
+                                              self.DEFAULT_SUCCESS_THRESHOLD)
+
+        return [(percentage, timedelta(minutes=delay), success_threshold)
+                for percentage, delay, success_threshold
+                in zip(percentages, delays, success_thresholds)]
+
+    def wave_values(self, field_name, default):
+        """ Values of the field for every wave, single value repeated. """
+        values = self.cleaned_data[field_name] or [default]
+        if len(values) == 1:
+            return values * len(self.cleaned_data['waves'])
+        return values
+
+
+class DeviceApiForm(forms.Form):
+    name = forms.CharField(max_length=50)
+    ip_address = forms.GenericIPAddressField()
+
+
+class DeviceApiUpdateForm(forms.Form):
+    uuid = forms.UUIDField()
+    name = forms.CharField(max_length=50, required=False)
+    ip_address = forms.GenericIPAddressField(required=False)
+
+
+class DeviceGroupApiForm(forms.Form):
+    name = forms.CharField(max_length=50)
+
+
+class DeviceGroupApiUpdateForm(forms.Form):
+    uuid = forms.UUIDField()
+    name = forms.CharField(max_length=50)
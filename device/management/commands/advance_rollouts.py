@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from device.models import Rollout
+
+
+class Command(BaseCommand):
+    help = ('Starts the next waves of the group version rollouts whose '
+            'delay has passed, or halts them if too few of the updated '
+            'devices have reported running the version.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep advancing rollouts until interrupted.')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Seconds between the checks, used with '
+                                 '--loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            self.advance_rollouts()
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def advance_rollouts(self):
+        rollouts = Rollout.objects.filter(
+            status=Rollout.IN_PROGRESS,
+            next_wave_at__lte=timezone.now()
+        ).order_by('next_wave_at').values_list('pk', flat=True)
+
+        for rollout_pk in list(rollouts):
+            with transaction.atomic():
+                # Rollout is locked, so concurrent schedulers
+                # do not start the same wave twice.
+                rollout = Rollout.objects.select_for_update().select_related(
+                    'group', 'version').get(pk=rollout_pk)
+
+                if (rollout.next_wave_at is None or
+                        rollout.next_wave_at > timezone.now()):
+                    continue
+
+                assigned_count = rollout.advance()
+
+            if assigned_count is None:
+                self.stderr.write(f'Rollout {rollout.uuid} has been halted.')
+            else:
+                self.stdout.write(f'Rollout {rollout.uuid}: version assigned '
+                                  f'to {assigned_count} devices.')
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from device.utils import checksum, checksum_files, hashing_function
+
+
+def chunked_checksum(file_name, chunk_size=4096):
+    """ Previous implementation, hashing small chunks read in a loop. """
+    file_checksum = hashing_function()
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            file_checksum.update(chunk)
+
+    return file_checksum
+
+
+class Command(BaseCommand):
+    help = ('Compares throughput of the checksum engine with hashing '
+            'the files in 4 KiB chunks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=256,
+                            help='Size of every test file in MB.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes and test files.')
+
+    def handle(self, *args, **options):
+        size = options['size']
+        workers = options['workers']
+
+        directory = tempfile.mkdtemp()
+        try:
+            file_names = []
+            for number in range(workers):
+                file_name = os.path.join(directory, str(number))
+                with open(file_name, 'wb') as file:
+                    for _ in range(size):
+                        file.write(os.urandom(1024 * 1024))
+                file_names.append(file_name)
+
+            # Files are read once, so all measurements use the page cache.
+            checksum(file_names[0])
+
+            self.report('4 KiB chunks', size, 1,
+                        lambda: chunked_checksum(file_names[0]))
+            self.report('memory mapped', size, 1,
+                        lambda: checksum(file_names[0]))
+            self.report(f'{workers} processes', size * workers, workers,
+                        lambda: list(checksum_files(file_names, workers)))
+        finally:
+            shutil.rmtree(directory)
+
+    def report(self, name, size, cores, function):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'{name}: {size / elapsed:.1f} MB/s, '
+                          f'{size / elapsed / cores:.1f} MB/s per core')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from device.models import Version
+
+
+class Command(BaseCommand):
+    help = ('Builds deltas from the previous versions for all versions '
+            'which have not been processed yet.')
+
+    def handle(self, *args, **options):
+        versions = Version.objects.filter(
+            previous__isnull=False,
+            delta_base_checksum__isnull=True
+        ).exclude(
+            file=''
+        ).exclude(
+            file=None
+        ).exclude(
+            previous__file=''
+        ).exclude(
+            previous__file=None
+        ).select_related('previous')
+
+        built = skipped = 0
+        for version in versions.iterator():
+            if version.build_delta():
+                built += 1
+            else:
+                skipped += 1
+
+        self.stdout.write(f'Built {built} deltas, '
+                          f'{skipped} versions have no delta worth serving.')
@@ -0,0 +1,127 @@
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from device.models import Version, VersionUpload
+from device.storage import UPLOADS_DIRECTORY
+
+
+QUARANTINE_DIRECTORY = '.quarantine'
+
+
+def walk_files(directory):
+    """
+    Yields paths of all files under the directory, relative to it.
+    Directories are scanned one at a time, so memory does not depend
+    on the number of stored files. Hidden entries are skipped.
+    """
+    pending = ['']
+    while pending:
+        relative_directory = pending.pop()
+        with os.scandir(os.path.join(directory, relative_directory)) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+
+                relative_path = os.path.join(relative_directory, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(relative_path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield relative_path, entry.stat(follow_symlinks=False)
+
+
+class Command(BaseCommand):
+    help = ('Deletes or quarantines media files which are not referenced '
+            'by any version or unfinished upload. Uploads not finished '
+            'in time are deleted first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-period', type=float, default=24,
+                            help='Hours after which unreferenced file '
+                                 'is collected.')
+        parser.add_argument('--upload-max-age', type=float, default=7 * 24,
+                            help='Hours after which unfinished upload '
+                                 'is deleted.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of files checked with one query.')
+        parser.add_argument('--quarantine', action='store_true',
+                            help=f'Move files to {QUARANTINE_DIRECTORY} '
+                                 f'instead of deleting them.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list files which would be collected.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.collected = 0
+
+        expired_uploads = VersionUpload.objects.filter(
+            timestamp__lt=timezone.now() - timedelta(hours=options['upload_max_age'])
+        )
+        if not options['dry_run']:
+            expired_uploads.delete()
+
+        modified_before = time.time() - options['grace_period'] * 60 * 60
+
+        batch = []
+        for name, stat in walk_files(settings.MEDIA_ROOT):
+            # Files being written right now are never collected.
+            if stat.st_mtime >= modified_before:
+                continue
+
+            batch.append(name.replace(os.sep, '/'))
+            if len(batch) >= options['batch_size']:
+                self.sweep(batch)
+                batch = []
+
+        if batch:
+            self.sweep(batch)
+
+        self.stdout.write(f'Collected {self.collected} files.')
+
+    def sweep(self, names):
+        # Blobs are shared by many versions, so every referenced name
+        # is loaded once instead of once per version.
+        referenced = set()
+        for field_name in ('file', 'delta'):
+            referenced.update(Version.objects.filter(
+                **{f'{field_name}__in': names}
+            ).order_by().values_list(field_name, flat=True).distinct())
+
+        upload_uuids = {}
+        for name in names:
+            directory, _, file_name = name.partition('/')
+            upload_uuid, extension = os.path.splitext(file_name)
+            if directory == UPLOADS_DIRECTORY and extension == '.part':
+                try:
+                    upload_uuids[uuid.UUID(upload_uuid)] = name
+                except ValueError:
+                    pass
+
+        uploads = VersionUpload.objects.filter(uuid__in=upload_uuids)
+        for upload_uuid in uploads.values_list('uuid', flat=True):
+            referenced.add(upload_uuids[upload_uuid])
+
+        for name in names:
+            if name not in referenced:
+                self.collect(name)
+
+    def collect(self, name):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        self.collected += 1
+
+        if self.options['dry_run']:
+            self.stdout.write(name)
+            return
+
+        if self.options['quarantine']:
+            quarantine_path = os.path.join(settings.MEDIA_ROOT,
+                                           QUARANTINE_DIRECTORY, name)
+            os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+            os.replace(path, quarantine_path)
+        else:
+            os.remove(path)
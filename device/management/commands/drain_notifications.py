@@ -0,0 +1,113 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from device.models import Notification
+from device.utils import update_devices, update_device_group
+
+
+class Command(BaseCommand):
+    help = ('Sends queued notifications to the devices and groups in '
+            'batches. Delivered notifications are deleted, the other ones '
+            'are sent again later.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of notifications sent at a time.')
+        parser.add_argument('--lease', type=float, default=300,
+                            help='Seconds after which notifications taken '
+                                 'by a worker which has not finished them '
+                                 'are sent again.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep sending notifications until '
+                                 'interrupted.')
+        parser.add_argument('--interval', type=float, default=1,
+                            help='Seconds to wait when no notification is '
+                                 'queued, used with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent_count = self.drain(options['batch_size'], options['lease'])
+
+            if sent_count < options['batch_size']:
+                if not options['loop']:
+                    return
+                time.sleep(options['interval'])
+
+    def drain(self, batch_size, lease):
+        """
+        Sends a batch of due notifications.
+        :return: Number of notifications in the batch.
+        """
+        now = timezone.now()
+
+        notifications = self.lease(self.due_notification_pks(now, batch_size),
+                                   now, lease)
+
+        if not notifications:
+            return 0
+
+        # Device is notified once, however many notifications are queued.
+        ip_addresses = {notification.device.ip_address
+                        for notification in notifications
+                        if notification.device is not None}
+        failed_ip_addresses = set(update_devices(ip_addresses))
+
+        for group_uuid in {notification.group.uuid
+                           for notification in notifications
+                           if notification.group is not None}:
+            update_device_group(group_uuid)
+
+        delivered = []
+        failed = []
+        for notification in notifications:
+            if (notification.device is not None and
+                    notification.device.ip_address in failed_ip_addresses):
+                failed.append(notification)
+            else:
+                delivered.append(notification.pk)
+
+        Notification.objects.filter(pk__in=delivered).delete()
+
+        for notification in failed:
+            delay = min(settings.NOTIFICATION_RETRY_DELAY *
+                        2 ** notification.attempts,
+                        settings.NOTIFICATION_MAX_RETRY_DELAY)
+            notification.attempts += 1
+            notification.next_attempt_at = now + timedelta(seconds=delay)
+            notification.save(update_fields=['attempts', 'next_attempt_at'])
+
+        if failed_ip_addresses:
+            self.stderr.write(f'{len(failed_ip_addresses)} devices could not '
+                              f'be notified.')
+
+        return len(notifications)
+
+    def due_notification_pks(self, now, batch_size):
+        return list(Notification.objects.filter(
+            next_attempt_at__lte=now
+        ).values_list('pk', flat=True)[:batch_size])
+
+    def lease(self, notification_pks, now, lease):
+        """
+        Takes the notifications which are still due, so other workers
+        don't send them at the same time, and they are sent again if this
+        one is stopped. Notifications are taken by a single UPDATE, which
+        skips the ones another worker has taken since they were selected,
+        and are then found by the token of this lease.
+        :return: List of the leased notifications.
+        """
+        lease_token = uuid.uuid4()
+
+        Notification.objects.filter(
+            pk__in=notification_pks, next_attempt_at__lte=now
+        ).update(next_attempt_at=now + timedelta(seconds=lease),
+                 lease_token=lease_token)
+
+        return list(Notification.objects.filter(
+            pk__in=notification_pks, lease_token=lease_token
+        ).select_related('device', 'group'))
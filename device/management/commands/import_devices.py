@@ -0,0 +1,206 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from custom_auth.models import User
+from device.forms import DeviceApiForm
+from device.models import Device, DeviceGroup, SearchEntry
+
+
+class Command(BaseCommand):
+    help = ('Imports devices from CSV file with name and ip_address columns '
+            'or from JSON Lines file with one device object per line. '
+            'The file is read row by row and devices are inserted in '
+            'batches, so the memory used does not depend on its size.')
+
+    FORMATS = ('csv', 'jsonl')
+
+    # Devices are looked up by their uuids after the insert, which must
+    # fit into SQLite's limit of the query parameters.
+    LOOKUP_CHUNK_SIZE = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help='Path of the file or "-" for the standard '
+                                 'input.')
+        parser.add_argument('--format', choices=self.FORMATS, default=None,
+                            help='Format of the file, by default guessed '
+                                 'from its extension.')
+        parser.add_argument('--owner', default=None,
+                            help='Username of the owner of the devices.')
+        parser.add_argument('--group', action='append', default=[],
+                            dest='groups',
+                            help='Uuid of the group the devices are added '
+                                 'to. May be given multiple times.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of devices inserted at a time.')
+
+    def handle(self, *args, **options):
+        self.invalid_count = 0
+
+        if options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive.')
+
+        owner = self.get_owner(options['owner'])
+        groups = self.get_groups(options['groups'], owner)
+        file_format = self.get_format(options['path'], options['format'])
+
+        if options['path'] == '-':
+            self.import_file(sys.stdin, file_format, owner, groups,
+                             options['batch_size'], options['verbosity'])
+        else:
+            try:
+                with open(options['path'], newline='',
+                          encoding='utf-8') as file:
+                    self.import_file(file, file_format, owner, groups,
+                                     options['batch_size'],
+                                     options['verbosity'])
+            except OSError as error:
+                raise CommandError(f'Cannot read {options["path"]}: {error}')
+
+    @staticmethod
+    def get_owner(username):
+        if username is None:
+            return None
+
+        owner = User.objects.filter(username=username).first()
+        if owner is None:
+            raise CommandError(f'User {username} does not exist.')
+        return owner
+
+    @staticmethod
+    def get_groups(group_uuids, owner):
+        groups = []
+        for group_uuid in group_uuids:
+            try:
+                group = DeviceGroup.objects.filter(uuid=group_uuid,
+                                                   is_active=True).first()
+            except ValueError:
+                group = None
+
+            if group is None:
+                raise CommandError(f'Group {group_uuid} does not exist.')
+            if owner is not None and group.owner_id != owner.id:
+                raise CommandError(f'Group {group_uuid} does not belong '
+                                   f'to {owner.username}.')
+            groups.append(group)
+        return groups
+
+    def get_format(self, path, file_format):
+        if file_format is not None:
+            return file_format
+
+        extension = path.rsplit('.', 1)[-1].lower()
+        if extension in self.FORMATS:
+            return extension
+        if extension in ('json', 'ndjson'):
+            return 'jsonl'
+        raise CommandError('Format of the file cannot be guessed, '
+                           'use --format.')
+
+    def import_file(self, file, file_format, owner, groups, batch_size,
+                    verbosity):
+        started_at = time.monotonic()
+        imported = 0
+
+        devices = self.validate_rows(self.read_rows(file, file_format), owner)
+
+        while True:
+            batch = list(islice(devices, batch_size))
+            if not batch:
+                break
+
+            self.insert_batch(batch, groups)
+            imported += len(batch)
+
+            if verbosity >= 2:
+                self.write_progress(imported, started_at)
+
+        self.write_progress(imported, started_at)
+        if self.invalid_count:
+            self.stderr.write(f'Skipped {self.invalid_count} invalid rows.')
+
+    def read_rows(self, file, file_format):
+        """
+        Yields (line number, row) of the file. Rows which are not objects
+        are yielded as None.
+        """
+        if file_format == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+    def validate_rows(self, rows, owner):
+        """
+        Yields devices built from the valid rows. Errors of the invalid
+        rows are written to stderr. No query is made here.
+        """
+        # Fields of the form are built once instead of once per row.
+        fields = DeviceApiForm.base_fields
+
+        for line_number, row in rows:
+            if row is None:
+                self.report_invalid(line_number, 'Row is not an object.')
+                continue
+
+            cleaned_data = {}
+            errors = []
+            for name, field in fields.items():
+                try:
+                    cleaned_data[name] = field.clean(row.get(name))
+                except ValidationError as error:
+                    errors.append(f'{name}: {" ".join(error.messages)}')
+
+            if errors:
+                self.report_invalid(line_number, '; '.join(errors))
+                continue
+
+            yield Device(owner=owner, **cleaned_data)
+
+    def report_invalid(self, line_number, message):
+        self.invalid_count += 1
+        self.stderr.write(f'Line {line_number}: {message}')
+
+    def insert_batch(self, devices, groups):
+        with transaction.atomic():
+            Device.objects.bulk_create(devices)
+
+            # SQLite doesn't return primary keys of the inserted rows,
+            # so devices are looked up by the uuids generated beforehand.
+            device_pks = []
+            for start in range(0, len(devices), self.LOOKUP_CHUNK_SIZE):
+                chunk = devices[start:start + self.LOOKUP_CHUNK_SIZE]
+                inserted = Device.objects.filter(
+                    uuid__in=[device.uuid for device in chunk])
+
+                SearchEntry.index_devices(inserted)
+                if groups:
+                    device_pks.extend(inserted.values_list('pk', flat=True))
+
+            Membership = DeviceGroup.devices.through
+            Membership.objects.bulk_create([
+                Membership(devicegroup_id=group.pk, device_id=device_pk)
+                for group in groups
+                for device_pk in device_pks
+            ])
+
+    def write_progress(self, imported, started_at):
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.stdout.write(f'Imported {imported} devices in {elapsed:.2f} s '
+                          f'({imported / elapsed:.0f} devices/s).')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from device.search import install_fts
+
+
+class Command(BaseCommand):
+    help = ('Creates FTS5 index of the search entries again, e.g. once '
+            'the database supports FTS5. Search falls back to prefixes '
+            'of the values until the index exists.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not install_fts(connection):
+                raise CommandError('Database does not support FTS5.')
+
+        self.stdout.write('Search index has been rebuilt.')
@@ -0,0 +1,125 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from device.models import Version
+from device.utils import checksum
+
+
+class Command(BaseCommand):
+    help = ('Re-hashes stored version files and deltas with limited '
+            'bandwidth, starting with those verified least recently, and '
+            'records when every one has been verified. Corrupted files are '
+            'marked, so they are no longer served, corrupted deltas are '
+            'dropped, so they are built again. Files without checksum are '
+            'skipped until verify_checksums --backfill computes it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of files verified in one batch.')
+        parser.add_argument('--bandwidth', type=float, default=50,
+                            help='Maximum reading speed in MB/s.')
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Hours after which file is verified again.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep verifying files until interrupted.')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Seconds to wait when no file needs '
+                                 'verifying, used with --loop.')
+
+    def handle(self, *args, **options):
+        max_bytes_per_second = options['bandwidth'] * 1024 * 1024
+
+        while True:
+            verified_before = timezone.now() - timedelta(hours=options['min_age'])
+            files = self.stale_files('file', verified_before,
+                                     options['batch_size'])
+            deltas = self.stale_files('delta', verified_before,
+                                      options['batch_size'])
+
+            for name, file_checksum in files:
+                self.scrub_file(name, file_checksum, max_bytes_per_second)
+
+            for name, delta_checksum in deltas:
+                self.scrub_delta(name, delta_checksum, max_bytes_per_second)
+
+            if max(len(files), len(deltas)) < options['batch_size']:
+                if not options['loop']:
+                    return
+                time.sleep(options['interval'])
+
+    @staticmethod
+    def stale_files(field_name, verified_before, batch_size):
+        """
+        Returns names and checksums of the files verified least recently.
+        Progress is stored with the files, so scrubbing resumes where
+        it has stopped.
+        :param field_name: 'file' or 'delta', the names of the checksum
+        and verification time fields are derived from it.
+        """
+        versions = Version.objects.exclude(
+            **{field_name: ''}
+        ).exclude(
+            **{field_name: None}
+        ).exclude(
+            **{f'{field_name}_verified_at__gte': verified_before}
+        ).filter(
+            Command.has_checksum(field_name)
+        ).order_by(
+            F(f'{field_name}_verified_at').asc(nulls_first=True), 'id'
+        ).values_list(field_name, f'{field_name}_checksum')
+
+        files = {}
+        for name, file_checksum in versions.iterator():
+            files.setdefault(name, bytes(file_checksum))
+            if len(files) >= batch_size:
+                break
+
+        return list(files.items())
+
+    @staticmethod
+    def has_checksum(field_name):
+        """ Condition of the versions whose file can be verified. """
+        return ~Q(**{f'{field_name}_checksum': b''}) & Q(
+            **{f'{field_name}_checksum__isnull': False})
+
+    @staticmethod
+    def digest(name, max_bytes_per_second):
+        """ Digest of the stored file or None if it can't be read. """
+        storage = Version._meta.get_field('file').storage
+
+        try:
+            return checksum(storage.path(name),
+                            chunk_size=1024 * 1024,
+                            max_bytes_per_second=max_bytes_per_second).digest()
+        except OSError:
+            return None
+
+    def scrub_file(self, name, file_checksum, max_bytes_per_second):
+        versions = Version.objects.filter(self.has_checksum('file'), file=name)
+
+        is_corrupted = (self.digest(name, max_bytes_per_second) !=
+                        file_checksum)
+        if is_corrupted:
+            self.stderr.write(f'File {name} is missing or does not match '
+                              f'its checksum.')
+
+        versions.update(file_verified_at=timezone.now(),
+                        file_is_corrupted=is_corrupted)
+
+    def scrub_delta(self, name, delta_checksum, max_bytes_per_second):
+        versions = Version.objects.filter(delta=name)
+
+        if self.digest(name, max_bytes_per_second) == delta_checksum:
+            versions.update(delta_verified_at=timezone.now())
+            return
+
+        # Versions without the delta and its base are processed again
+        # by build_deltas, which replaces the corrupted blob.
+        self.stderr.write(f'Delta {name} is missing or does not match '
+                          f'its checksum, it is dropped.')
+        versions.update(delta=None, delta_checksum=None,
+                        delta_base_checksum=None, delta_verified_at=None)
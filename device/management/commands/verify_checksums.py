@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from device.models import Version
+from device.utils import checksum_files
+
+
+class Command(BaseCommand):
+    help = ('Verifies checksums of all stored version files, or generates '
+            'missing checksums with --backfill. Every distinct file is '
+            'hashed once, using all CPUs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='Only generate checksums which are missing.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes hashing the files.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of files hashed in one batch.')
+
+    def handle(self, *args, **options):
+        storage = Version._meta.get_field('file').storage
+
+        versions = Version.objects.exclude(file='').exclude(file=None)
+        if options['backfill']:
+            versions = versions.filter(file_checksum=b'')
+
+        files = versions.order_by('file').values_list(
+            'file', 'file_checksum'
+        ).distinct()
+
+        verified = updated = 0
+        failures = []
+
+        batch = []
+        for name, file_checksum in files.iterator():
+            batch.append((name, bytes(file_checksum)))
+
+            if len(batch) >= options['batch_size']:
+                verified, updated = self.process_batch(
+                    batch, storage, options, failures, verified, updated)
+                batch = []
+
+        if batch:
+            verified, updated = self.process_batch(
+                batch, storage, options, failures, verified, updated)
+
+        self.stdout.write(f'Verified {verified} files, '
+                          f'generated {updated} checksums.')
+
+        if failures:
+            raise CommandError(f'{len(failures)} files are missing or '
+                               f'do not match their checksums.')
+
+    def process_batch(self, batch, storage, options, failures,
+                      verified, updated):
+        paths = [storage.path(name) for name, _ in batch]
+        digests = checksum_files(paths, options['workers'])
+
+        for (name, expected), (_, digest) in zip(batch, digests):
+            if digest is None:
+                self.stderr.write(f'File {name} can not be read.')
+                failures.append(name)
+
+            elif not expected:
+                Version.objects.filter(file=name, file_checksum=b'').update(
+                    file_checksum=digest)
+                updated += 1
+
+            elif digest != expected:
+                self.stderr.write(f'File {name} does not match its checksum.')
+                failures.append(name)
+
+            else:
+                verified += 1
+
+        return verified, updated
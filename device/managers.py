@@ -0,0 +1,218 @@
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, models
+from django.db.models import (Exists, OuterRef, Subquery, Max, Q, F, Case,
+                              When, Value, Count, BooleanField,
+                              IntegerField)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from device.utils import invalidate_check_in
+
+
+class VersionQuerySet(models.QuerySet):
+    def for_object(self, versioned_object):
+        """ Versions of the device or group. """
+        content_type = ContentType.objects.get_for_model(versioned_object)
+        return self.filter(content_type=content_type,
+                           object_id=versioned_object.pk)
+
+    def history(self):
+        """ Versions in the order of publishing, newest first. """
+        return self.exclude(sequence=None).order_by('-sequence')
+
+    def head(self):
+        """ Newest published version, which has not been rolled back. """
+        return self.history().filter(is_rolled_back=False).first()
+
+    def next_sequence(self):
+        """ Sequence number of the next version to be published. """
+        sequence = self.aggregate(Max('sequence'))['sequence__max']
+        return (sequence or 0) + 1
+
+
+def up_to_date_condition(prefix=''):
+    """
+    Condition of the device being up to date (see Device.is_up_to_date),
+    which is met if no version has been published after its version.
+    :param prefix: Path to the device, e.g. 'devices__' for the groups.
+    """
+    return (Q(**{f'{prefix}version__isnull': True}) |
+            Q(**{f'{prefix}version__next__isnull': True}) |
+            Q(**{f'{prefix}version__next': F(f'{prefix}version')}))
+
+
+class DeviceQuerySet(models.QuerySet):
+    ASSIGN_CHUNK_SIZE = 500
+
+    # Greatest character, so every string starting with the prefix sorts
+    # between the prefix and the prefix followed by this character.
+    PREFIX_UPPER_BOUND = '\U0010ffff'
+
+    def with_update_status(self):
+        """
+        Annotates `is_up_to_date` and `versions_behind` of the devices,
+        so they are loaded by the query of the devices instead of two
+        queries per device.
+        """
+        Version = self.model._meta.get_field('version').related_model
+        device_content_type = ContentType.objects.get_for_model(self.model)
+
+        newer_versions = Version.objects.filter(
+            content_type=device_content_type,
+            object_id=OuterRef('pk'),
+            sequence__gt=OuterRef('version__sequence'),
+            is_rolled_back=False
+        ).order_by().values('object_id').annotate(
+            count=Count('pk')
+        ).values('count')
+
+        return self.annotate(
+            is_up_to_date=Case(When(up_to_date_condition(), then=Value(True)),
+                               default=Value(False),
+                               output_field=BooleanField()),
+            versions_behind=Coalesce(Subquery(newer_versions,
+                                              output_field=IntegerField()),
+                                     0)
+        )
+
+    def outside_group(self, group):
+        """
+        Devices which are not members of the group. Members are excluded
+        with NOT EXISTS, which looks every device up in the index
+        of the memberships, instead of NOT IN list of all the members.
+        """
+        Membership = self.model.groups.through
+        return self.annotate(is_member=Exists(Membership.objects.filter(
+            devicegroup_id=group.pk, device_id=OuterRef('pk')
+        ))).filter(is_member=False)
+
+    def search(self, prefix):
+        """
+        Devices whose name or ip address starts with the prefix (case
+        sensitive). Prefix is compared as a range instead of LIKE, which
+        SQLite doesn't look up in the indexes of the owner's devices.
+        """
+        upper_bound = prefix + self.PREFIX_UPPER_BOUND
+        return self.filter(
+            Q(name__gte=prefix, name__lt=upper_bound) |
+            Q(ip_address__gte=prefix, ip_address__lt=upper_bound)
+        )
+
+    def assign_chunk_size(self, *inserted_models):
+        """
+        Returns the largest number of rows of the models inserted by
+        a single query, e.g. limited by the number of query parameters
+        on SQLite, but at most ASSIGN_CHUNK_SIZE.
+        """
+        operations = connections[self.db].ops
+        objects = [None] * self.ASSIGN_CHUNK_SIZE
+
+        return min(
+            [self.ASSIGN_CHUNK_SIZE] +
+            [operations.bulk_batch_size(
+                [field for field in model._meta.concrete_fields
+                 if not isinstance(field, models.AutoField)], objects)
+             for model in inserted_models]
+        )
+
+    def assign_version(self, version, chunk_size=None):
+        """
+        Assigns a copy of the version to every device of the queryset,
+        e.g. all members of the group the version has been published for.
+        Devices are processed in chunks with at most five queries per
+        chunk, regardless of the number of devices in it.
+        :param version: Version copied to the devices.
+        :param chunk_size: Number of devices processed at a time, by default
+        the most which are inserted by a single query (see
+        assign_chunk_size).
+        :return: Number of updated devices.
+        """
+        Version = self.model._meta.get_field('version').related_model
+        Notification = self.model._meta.get_field(
+            'notifications').related_model
+        device_content_type = ContentType.objects.get_for_model(self.model)
+
+        if chunk_size is None:
+            chunk_size = self.assign_chunk_size(Version, Notification)
+
+        updated_count = 0
+        last_pk = 0
+
+        while True:
+            devices = list(self.filter(pk__gt=last_pk).order_by('pk').annotate(
+                last_sequence=Subquery(Version.objects.filter(
+                    content_type=device_content_type,
+                    object_id=OuterRef('pk')
+                ).history().values('sequence')[:1])
+            ).values_list(
+                'pk', 'uuid', 'version_id', 'last_sequence'
+            )[:chunk_size])
+
+            if not devices:
+                return updated_count
+
+            last_pk = devices[-1][0]
+            device_pks = [pk for pk, _, _, _ in devices]
+            old_version_pks = [version_pk for _, _, version_pk, _ in devices
+                               if version_pk is not None]
+
+            Version.objects.bulk_create([
+                Version(uuid=uuid.uuid4(),
+                        name=version.name,
+                        file=version.file.name,
+                        file_checksum=version.file_checksum,
+                        file_verified_at=version.file_verified_at,
+                        file_is_corrupted=version.file_is_corrupted,
+                        source=version,
+                        previous_id=old_version_pk,
+                        sequence=(last_sequence or 0) + 1,
+                        content_type=device_content_type,
+                        object_id=device_pk)
+                for device_pk, _, old_version_pk, last_sequence in devices
+            ])
+
+            # Copies are found by their source, so their primary keys
+            # don't have to be fetched.
+            copies = Version.objects.filter(source=version,
+                                            content_type=device_content_type)
+
+            self.model.objects.filter(pk__in=device_pks).update(
+                version=Subquery(copies.filter(
+                    object_id=OuterRef('pk')
+                ).order_by('-pk').values('pk')[:1]),
+                last_updated=timezone.now()
+            )
+
+            Version.objects.filter(pk__in=old_version_pks).update(
+                next=Subquery(copies.filter(
+                    previous=OuterRef('pk')
+                ).order_by('-pk').values('pk')[:1])
+            )
+
+            invalidate_check_in([device_uuid
+                                 for _, device_uuid, _, _ in devices])
+
+            Notification.objects.bulk_create([
+                Notification(device_id=device_pk)
+                for device_pk, _, _, _ in devices
+            ])
+
+            updated_count += len(devices)
+
+
+class DeviceGroupQuerySet(models.QuerySet):
+    def with_update_counts(self):
+        """
+        Annotates numbers of the active members of the groups, which are
+        up to date and outdated, counted by a single aggregate query.
+        """
+        active = Q(devices__is_active=True)
+        return self.annotate(
+            device_count=Count('devices', filter=active),
+            up_to_date_count=Count('devices', filter=active & (
+                up_to_date_condition('devices__')))
+        ).annotate(
+            outdated_count=F('device_count') - F('up_to_date_count')
+        )
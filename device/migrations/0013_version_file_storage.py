@@ -0,0 +1,20 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:10
+
+import device.storage
+import device.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0012_auto_20180606_1417'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='version',
+            name='file',
+            field=models.FileField(max_length=255, null=True, storage=device.storage.ContentAddressedStorage(), upload_to=device.utils.uploaded_file_path),
+        ),
+    ]
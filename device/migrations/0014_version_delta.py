@@ -0,0 +1,30 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:13
+
+import device.storage
+import device.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0013_version_file_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='delta',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=device.storage.ContentAddressedStorage(), upload_to=device.utils.uploaded_delta_path),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='delta_base_checksum',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='delta_checksum',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
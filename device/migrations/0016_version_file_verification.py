@@ -0,0 +1,23 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0015_version_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='file_is_corrupted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='file_verified_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
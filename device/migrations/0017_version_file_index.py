@@ -0,0 +1,25 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:21
+
+import device.storage
+import device.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0016_version_file_verification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='version',
+            name='delta',
+            field=models.FileField(blank=True, db_index=True, max_length=255, null=True, storage=device.storage.ContentAddressedStorage(), upload_to=device.utils.uploaded_delta_path),
+        ),
+        migrations.AlterField(
+            model_name='version',
+            name='file',
+            field=models.FileField(db_index=True, max_length=255, null=True, storage=device.storage.ContentAddressedStorage(), upload_to=device.utils.uploaded_file_path),
+        ),
+    ]
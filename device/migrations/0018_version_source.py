@@ -0,0 +1,19 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0017_version_file_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='source',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copies', to='device.Version'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0018_version_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rollout',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, unique=True)),
+                ('status', models.CharField(choices=[('in_progress', 'In progress'), ('completed', 'Completed'), ('halted', 'Halted')], default='in_progress', max_length=20)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('started_waves', models.PositiveIntegerField(default=0)),
+                ('next_wave_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollouts', to='device.DeviceGroup')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollouts', to='device.Version')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RolloutWave',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('percentage', models.PositiveSmallIntegerField()),
+                ('delay', models.DurationField()),
+                ('success_threshold', models.FloatField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('device_count', models.PositiveIntegerField(default=0)),
+                ('rollout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waves', to='device.Rollout')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='reported_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='device.Version'),
+        ),
+    ]
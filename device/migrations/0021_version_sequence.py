@@ -0,0 +1,36 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+# Versions are created in the order of publishing, so existing versions
+# are numbered in the order of their ids.
+BACKFILL_SEQUENCE = '''
+    UPDATE device_version SET sequence = (
+        SELECT COUNT(*) FROM device_version AS older
+        WHERE older.content_type_id = device_version.content_type_id
+        AND older.object_id = device_version.object_id
+        AND older.id <= device_version.id
+    )
+    WHERE object_id IS NOT NULL
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0020_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='sequence',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='version',
+            index=models.Index(fields=['content_type', 'object_id', 'sequence'], name='device_version_history_idx'),
+        ),
+        migrations.RunSQL([BACKFILL_SEQUENCE], migrations.RunSQL.noop),
+    ]
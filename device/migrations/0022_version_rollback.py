@@ -0,0 +1,18 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0021_version_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='is_rolled_back',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0022_version_rollback'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['owner', 'is_active', 'timestamp'], name='device_device_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicegroup',
+            index=models.Index(fields=['owner', 'is_active', 'timestamp'], name='device_group_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='version',
+            index=models.Index(fields=['content_type', 'object_id', 'timestamp'], name='device_version_object_idx'),
+        ),
+    ]
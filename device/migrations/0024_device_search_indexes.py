@@ -0,0 +1,21 @@
+# Generated by Django 2.1.9 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0023_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['owner', 'is_active', 'name'], name='device_device_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['owner', 'is_active', 'ip_address'], name='device_device_ip_address_idx'),
+        ),
+    ]
@@ -0,0 +1,155 @@
+# Generated by Django 2.1.9 on 2026-10-18 09:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Entries of the active devices and groups and the versions published
+# for them, without the copies of the group versions.
+POPULATE_ENTRIES = [
+    '''
+    INSERT INTO device_searchentry (kind, object_id, owner_id, name, uuid,
+                                    ip_address)
+    SELECT 'device', id, owner_id, name, uuid, ip_address
+    FROM device_device WHERE is_active = 1
+    ''',
+    '''
+    INSERT INTO device_searchentry (kind, object_id, owner_id, name, uuid,
+                                    ip_address)
+    SELECT 'group', id, owner_id, name, uuid, ''
+    FROM device_devicegroup WHERE is_active = 1
+    ''',
+    '''
+    INSERT INTO device_searchentry (kind, object_id, owner_id, name, uuid,
+                                    ip_address)
+    SELECT 'version', device_version.id, owner.owner_id, device_version.name,
+           device_version.uuid, ''
+    FROM device_version
+    JOIN django_content_type
+        ON django_content_type.id = device_version.content_type_id
+    JOIN (
+        SELECT 'device' AS model, id, owner_id FROM device_device
+        WHERE is_active = 1
+        UNION ALL
+        SELECT 'devicegroup', id, owner_id FROM device_devicegroup
+        WHERE is_active = 1
+    ) AS owner
+        ON owner.model = django_content_type.model
+        AND owner.id = device_version.object_id
+    WHERE django_content_type.app_label = 'device'
+    AND device_version.source_id IS NULL
+    ''',
+]
+
+
+# FTS5 index of the entries as created by this migration, kept here,
+# so the migration doesn't depend on the current device.search.
+FTS_COLUMNS = 'rowid, name, uuid, ip_address, owner'
+
+
+def fts_values(row):
+    return (f"{row}.id, {row}.name, {row}.uuid, {row}.ip_address, "
+            f"'u' || coalesce({row}.owner_id, '')")
+
+
+INSTALL_FTS = [
+    "CREATE VIRTUAL TABLE device_searchentry_fts USING fts5("
+    "name, uuid, ip_address, owner, content='')",
+
+    f"CREATE TRIGGER device_searchentry_fts_insert AFTER INSERT "
+    f"ON device_searchentry BEGIN "
+    f"INSERT INTO device_searchentry_fts ({FTS_COLUMNS}) "
+    f"VALUES ({fts_values('new')}); END",
+
+    f"CREATE TRIGGER device_searchentry_fts_delete AFTER DELETE "
+    f"ON device_searchentry BEGIN "
+    f"INSERT INTO device_searchentry_fts (device_searchentry_fts, "
+    f"{FTS_COLUMNS}) VALUES ('delete', {fts_values('old')}); END",
+
+    f"CREATE TRIGGER device_searchentry_fts_update AFTER UPDATE "
+    f"ON device_searchentry BEGIN "
+    f"INSERT INTO device_searchentry_fts (device_searchentry_fts, "
+    f"{FTS_COLUMNS}) VALUES ('delete', {fts_values('old')}); "
+    f"INSERT INTO device_searchentry_fts ({FTS_COLUMNS}) "
+    f"VALUES ({fts_values('new')}); END",
+
+    f"INSERT INTO device_searchentry_fts ({FTS_COLUMNS}) "
+    f"SELECT {fts_values('device_searchentry')} FROM device_searchentry",
+]
+
+UNINSTALL_FTS = [
+    'DROP TRIGGER IF EXISTS device_searchentry_fts_insert',
+    'DROP TRIGGER IF EXISTS device_searchentry_fts_delete',
+    'DROP TRIGGER IF EXISTS device_searchentry_fts_update',
+    'DROP TABLE IF EXISTS device_searchentry_fts',
+]
+
+
+def fts_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+def create_fts_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if not fts_supported(connection):
+        return
+
+    with connection.cursor() as cursor:
+        for statement in UNINSTALL_FTS + INSTALL_FTS:
+            cursor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for statement in UNINSTALL_FTS:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('device', '0024_device_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('device', 'Device'), ('group', 'Group'), ('version', 'Version')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=50)),
+                ('uuid', models.CharField(max_length=32)),
+                ('ip_address', models.CharField(blank=True, max_length=39)),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchentry',
+            index=models.Index(fields=['owner', 'name'], name='device_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchentry',
+            index=models.Index(fields=['owner', 'uuid'], name='device_search_uuid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchentry',
+            index=models.Index(fields=['owner', 'ip_address'], name='device_search_ip_address_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchentry',
+            unique_together={('kind', 'object_id')},
+        ),
+        migrations.RunSQL(POPULATE_ENTRIES, migrations.RunSQL.noop),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.9 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0025_search_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='lease_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.1.9 on 2026-10-18 09:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('device', '0026_notification_lease_token'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='version',
+            unique_together={('content_type', 'object_id', 'sequence')},
+        ),
+        migrations.RemoveIndex(
+            model_name='version',
+            name='device_version_history_idx',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.9 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0027_version_sequence_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='delta_verified_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
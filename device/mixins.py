@@ -1,44 +1,110 @@
+from functools import wraps
+
 from django.shortcuts import render
 
 from device.models import Device, DeviceGroup
+from device.utils import batches
 
 from projektPZ import TEMPLATE_404, TEMPLATE_403
 from projektPZ import status
 
 
-class DevicePermissionMixin:
+def get_owned_object(model, request, object_uuid):
     """
-    Mixin which implements method to check if device exists and if so
-    if user should be allowed to see it.
+    Loads active object and checks if user should be allowed to see it.
+    Owner is compared by id, so the user is not loaded again.
+    :param model: Model of the object (Device or DeviceGroup).
+    :param request: Request of the user.
+    :param object_uuid: Uuid of the object.
+    :return: Tuple of the object and None or None and the error response.
     """
+    owned_object = model.objects.filter(uuid=object_uuid,
+                                        is_active=True).first()
+
+    if owned_object is None:
+        return None, render(request, TEMPLATE_404,
+                            status=status.HTTP_404_NOT_FOUND)
 
-    @staticmethod
-    def validate_user_for_device(request, device_uuid):
-        device = Device.objects.filter(uuid=device_uuid, is_active=True).first()
+    if owned_object.owner_id != request.user.id:
+        return None, render(request, TEMPLATE_403,
+                            status=status.HTTP_403_FORBIDDEN)
 
-        if device is None:
-            return render(request, TEMPLATE_404, status=status.HTTP_404_NOT_FOUND)
+    return owned_object, None
 
-        if request.user != device.owner:
-            return render(request, TEMPLATE_403, status=status.HTTP_403_FORBIDDEN)
 
-        return None
+def check_owned_objects(model, request, object_uuids):
+    """
+    Checks if all of the objects exist and user should be allowed to see
+    them, loading only their owners, with one query per batch of uuids.
+    :param model: Model of the objects (Device or DeviceGroup).
+    :param request: Request of the user.
+    :param object_uuids: List of uuids of the objects.
+    :return: None or the error response.
+    """
+    object_uuids = set(object_uuids)
 
+    owner_ids = []
+    for batch in batches(list(object_uuids)):
+        owner_ids.extend(model.objects.filter(
+            uuid__in=batch, is_active=True
+        ).values_list('owner_id', flat=True))
 
-class DeviceGroupsPermissionMixin:
+    if len(owner_ids) != len(object_uuids):
+        return render(request, TEMPLATE_404, status=status.HTTP_404_NOT_FOUND)
+
+    if any(owner_id != request.user.id for owner_id in owner_ids):
+        return render(request, TEMPLATE_403, status=status.HTTP_403_FORBIDDEN)
+
+    return None
+
+
+def resolve_owned_object(model, url_kwarg, attribute):
+    """
+    Decorator of the `dispatch` method of the view, which loads the object
+    with uuid given in the url once per request and stores it as
+    an attribute of the view. Anonymous users are passed further, so they
+    are redirected to the login page by LoginRequiredMixin.
+    :param model: Model of the object (Device or DeviceGroup).
+    :param url_kwarg: Name of the url argument with the uuid.
+    :param attribute: Name of the view's attribute for the object.
     """
-    Mixin which implements method to check if device group exists and if so
-    if user should be allowed to see it.
+    def decorator(dispatch):
+        @wraps(dispatch)
+        def wrapper(view, request, *args, **kwargs):
+            if request.user.is_authenticated and url_kwarg in kwargs:
+                owned_object, response = get_owned_object(model, request,
+                                                          kwargs[url_kwarg])
+                if response is not None:
+                    return response
+
+                setattr(view, attribute, owned_object)
+
+            return dispatch(view, request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class DevicePermissionMixin:
+    """
+    Mixin which checks if device given in the url exists and if so
+    if user should be allowed to see it. Device is available to the view
+    as `device` attribute.
     """
 
-    @staticmethod
-    def validate_user_for_group(request, group_uuid):
-        group = DeviceGroup.objects.filter(uuid=group_uuid, is_active=True).first()
+    @resolve_owned_object(Device, 'device_uuid', 'device')
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
 
-        if group is None:
-            return render(request, TEMPLATE_404, status=status.HTTP_404_NOT_FOUND)
 
-        if request.user != group.owner:
-            return render(request, TEMPLATE_403, status=status.HTTP_403_FORBIDDEN)
+class DeviceGroupsPermissionMixin:
+    """
+    Mixin which checks if device group given in the url exists and if so
+    if user should be allowed to see it. Group is available to the view
+    as `group` attribute.
+    """
 
-        return None
+    @resolve_owned_object(DeviceGroup, 'group_uuid', 'group')
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
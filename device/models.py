@@ -1,18 +1,95 @@
+import math
+import os
+import tempfile
 import uuid
 
-from django.db import models
+from django.conf import settings
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models import Q, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 
-from device.utils import (checksum, uploaded_file_path,
-                          update_device, update_device_group)
+from device.delta import generate_delta, DeltaTooLarge
+from device.managers import (DeviceQuerySet, DeviceGroupQuerySet,
+                             VersionQuerySet)
+from device.storage import ContentAddressedStorage, UPLOADS_DIRECTORY
+from device.utils import (stream_checksum, uploaded_file_path,
+                          uploaded_delta_path, invalidate_check_in)
 
 
 User = get_user_model()
 
 
+class DirtyFieldsMixin:
+    """
+    Model mixin tracking fields changed since the object has been loaded
+    or saved. Only changed fields (and fields updated automatically, like
+    `auto_now` dates) are written when the object is saved again.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_values = dict(zip(field_names, values))
+        return instance
+
+    def _loaded_values(self):
+        deferred_fields = self.get_deferred_fields()
+        return {field.attname: getattr(self, field.attname)
+                for field in self._meta.concrete_fields
+                if field.attname not in deferred_fields}
+
+    @property
+    def dirty_fields(self):
+        """ Names (attnames) of the fields which have been changed. """
+        saved_values = getattr(self, '_saved_values', None)
+
+        # Fields of new object are compared with their defaults.
+        if saved_values is None:
+            return {field.attname for field in self._meta.concrete_fields
+                    if getattr(self, field.attname) != field.get_default()}
+
+        return {attname for attname, value in self._loaded_values().items()
+                if attname in saved_values and saved_values[attname] != value}
+
+    def save(self, *args, **kwargs):
+        is_update = (getattr(self, '_saved_values', None) is not None and
+                     not self._state.adding and
+                     not kwargs.get('force_insert') and
+                     kwargs.get('update_fields') is None and
+                     not args)
+
+        if is_update:
+            update_fields = self.dirty_fields
+            if update_fields:
+                update_fields.update(
+                    field.attname for field in self._meta.concrete_fields
+                    if getattr(field, 'auto_now', False))
+            kwargs['update_fields'] = update_fields
+
+        result = super().save(*args, **kwargs)
+
+        values = self._loaded_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or getattr(self, '_saved_values', None) is None:
+            self._saved_values = values
+        else:
+            for name in update_fields:
+                attname = self._meta.get_field(name).attname
+                self._saved_values[attname] = values.get(attname)
+
+        return result
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._saved_values = self._loaded_values()
+
+
 class Version(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     name = models.CharField(max_length=50)
@@ -23,31 +100,208 @@ class Version(models.Model):
     object_id = models.PositiveIntegerField(null=True)
     versioned_object = GenericForeignKey('content_type', 'object_id')
 
-    file = models.FileField(null=True, upload_to=uploaded_file_path)
+    file = models.FileField(null=True, upload_to=uploaded_file_path,
+                            storage=ContentAddressedStorage(),
+                            max_length=255, db_index=True)
     file_checksum = models.BinaryField(blank=True)
 
+    # Updated by the scrubber for all versions sharing the file.
+    file_verified_at = models.DateTimeField(null=True, blank=True,
+                                            db_index=True)
+    file_is_corrupted = models.BooleanField(default=False)
+
+    # Delta rebuilding this version's file from the file of the version
+    # with `delta_base_checksum`. Base checksum without the delta means
+    # the delta has been found not worth storing.
+    delta = models.FileField(null=True, blank=True,
+                             upload_to=uploaded_delta_path,
+                             storage=ContentAddressedStorage(),
+                             max_length=255, db_index=True)
+    delta_checksum = models.BinaryField(blank=True, null=True)
+    delta_base_checksum = models.BinaryField(blank=True, null=True)
+    delta_verified_at = models.DateTimeField(null=True, blank=True,
+                                             db_index=True)
+
     creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
     previous = models.ForeignKey('self', on_delete=models.SET_NULL,
                                  null=True, blank=True, related_name='+')
+    # Version of the group this version of the device has been copied from.
+    source = models.ForeignKey('self', on_delete=models.SET_NULL,
+                               null=True, blank=True, related_name='copies')
     next = models.ForeignKey('self', on_delete=models.SET_NULL,
                              null=True, blank=True, related_name='+')
 
+    # Position in the history of the versioned object, so history can be
+    # accessed without following the links version by version.
+    sequence = models.PositiveIntegerField(null=True, blank=True)
+    is_rolled_back = models.BooleanField(default=False)
+
+    objects = VersionQuerySet.as_manager()
+
     class Meta:
         ordering = ['-id']
         get_latest_by = 'timestamp'
+        # Versions published at the same time can't get the same number,
+        # the history is also looked up by this index.
+        unique_together = ('content_type', 'object_id', 'sequence')
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'timestamp'],
+                         name='device_version_object_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-    def generate_checksum(self):
-        file_checksum = checksum(self.file.file.name).digest()
-        self.file_checksum = file_checksum
+    def publish(self, versioned_object, creator, waves=None):
+        """
+        Saves this version as the newest version of the device or group.
+        Should be called inside of a transaction.
+        :param versioned_object: Device or DeviceGroup object.
+        :param creator: User publishing the version.
+        :param waves: List of (percentage, delay, success threshold) tuples
+        to roll the version of the group out in waves, instead of assigning
+        it to all of the members at once (see Rollout).
+        Delta from the previous version is built once the transaction
+        is committed.
+        """
+        old_version = versioned_object.version
+
+        self.creator = creator
+        self.versioned_object = versioned_object
+        self.previous = old_version
+        self.sequence = Version.objects.for_object(
+            versioned_object).next_sequence()
         self.save()
-        return self.file_checksum
 
+        if old_version is not None:
+            old_version.next = self
+            old_version.save()
+
+        versioned_object.last_updated = timezone.now()
+        if waves:
+            versioned_object.stage_version(self, waves)
+        else:
+            versioned_object.version = self
+        versioned_object.save()
+
+        if old_version is not None:
+            transaction.on_commit(self.build_delta_after_publish)
+
+    def build_delta_after_publish(self):
+        """
+        Builds delta of the version once it has been published, so
+        the devices can download it right away. Delta which can not be
+        built now, e.g. because the file is not readable, is left
+        to build_deltas command.
+        """
+        try:
+            self.build_delta()
+        except OSError:
+            pass
+
+    def ancestor(self, generations=1):
+        """
+        Returns version published given number of versions before this one.
+        :param generations: Number of versions to go back.
+        :return: Version or None if history is not that long.
+        """
+        if self.sequence is None:
+            return None
 
-class Device(models.Model):
+        return Version.objects.filter(
+            content_type_id=self.content_type_id,
+            object_id=self.object_id,
+            sequence=self.sequence - generations
+        ).first()
+
+    def linked_ancestors(self, max_depth=1000):
+        """
+        Returns versions preceding this one found by following `previous`
+        links with a single recursive query, e.g. for the versions without
+        sequence numbers.
+        :param max_depth: Maximum number of versions returned.
+        :return: RawQuerySet of versions, closest first.
+        """
+        table = self._meta.db_table
+        return Version.objects.raw(
+            f'WITH RECURSIVE chain(id, depth) AS ('
+            f'SELECT previous_id, 1 FROM {table} WHERE id = %s '
+            f'UNION ALL '
+            f'SELECT version.previous_id, chain.depth + 1 '
+            f'FROM {table} version JOIN chain ON version.id = chain.id '
+            f'WHERE chain.depth < %s'
+            f') '
+            f'SELECT {table}.* FROM {table} '
+            f'JOIN chain ON {table}.id = chain.id '
+            f'ORDER BY chain.depth',
+            [self.pk, max_depth]
+        )
+
+    def build_delta(self):
+        """
+        Builds delta from the file of the previous version to the file
+        of this version. Delta for the same pair of files is built once
+        and shared by all versions, e.g. all devices of a group.
+        :return: True if delta worth serving is available.
+        """
+        previous = self.previous
+        if previous is None or not previous.file or not self.file:
+            return False
+
+        base_checksum = bytes(previous.file_checksum)
+
+        built_version = Version.objects.filter(
+            delta_base_checksum=base_checksum,
+            file_checksum=self.file_checksum
+        ).exclude(pk=self.pk).first()
+
+        if built_version is not None:
+            self.delta = built_version.delta
+            self.delta_checksum = built_version.delta_checksum
+        else:
+            self.delta = None
+            self.delta_checksum = None
+
+            with tempfile.TemporaryFile() as delta_file:
+                try:
+                    generate_delta(previous.file.path, self.file.path,
+                                   delta_file)
+                except DeltaTooLarge:
+                    pass
+                else:
+                    delta_file.seek(0)
+                    self.delta_checksum = stream_checksum(delta_file).digest()
+                    self.delta.save('delta', File(delta_file), save=False)
+
+        self.delta_base_checksum = base_checksum
+        self.save(update_fields=['delta', 'delta_checksum',
+                                 'delta_base_checksum'])
+
+        return bool(self.delta)
+
+    def artifact_for(self, base):
+        """
+        Chooses the smallest artifact bringing device to this version.
+        :param base: Version currently installed on the device or None.
+        :return: Tuple of the file to be sent and its checksum.
+        """
+        if (base is not None and self.delta and base.file_checksum and
+                bytes(self.delta_base_checksum) == bytes(base.file_checksum)):
+            return self.delta, self.delta_checksum
+
+        return self.file, self.file_checksum
+
+    @property
+    def file_reference_count(self):
+        """ Number of versions sharing the stored file of this version. """
+        if not self.file:
+            return 0
+
+        return Version.objects.filter(file=self.file.name).count()
+
+
+class Device(DirtyFieldsMixin, models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     name = models.CharField(max_length=50)
     is_active = models.BooleanField(default=True)
@@ -63,24 +317,91 @@ class Device(models.Model):
     owner = models.ForeignKey(User, on_delete=models.SET_NULL,
                               related_name='devices', null=True)
 
+    # Version the device has reported to be running.
+    reported_version = models.ForeignKey(Version, on_delete=models.SET_NULL,
+                                         related_name='+',
+                                         null=True, blank=True)
+
+    objects = DeviceQuerySet.as_manager()
+
     class Meta:
         ordering = ['-id']
         get_latest_by = 'timestamp'
+        indexes = [
+            models.Index(fields=['owner', 'is_active', 'timestamp'],
+                         name='device_device_owner_idx'),
+            models.Index(fields=['owner', 'is_active', 'name'],
+                         name='device_device_name_idx'),
+            models.Index(fields=['owner', 'is_active', 'ip_address'],
+                         name='device_device_ip_address_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def _annotated_status(self, name):
+        """
+        Returns status annotated by DeviceQuerySet.with_update_status,
+        or None if it's missing or the version has changed since.
+        """
+        annotation = self.__dict__.get(f'_annotated_{name}')
+        if annotation is None:
+            return None
+
+        version_id, value = annotation
+        if version_id != self.version_id:
+            return None
+        return value
+
+    def _set_annotated_status(self, name, value):
+        # Stored with the version it's valid for, see _annotated_status.
+        self.__dict__[f'_annotated_{name}'] = (self.version_id, value)
+
     @property
     def is_up_to_date(self):
+        """
+        Checks if no version has been published after the current one.
+        Loaded by the query of the device if annotated by
+        DeviceQuerySet.with_update_status.
+        """
+        annotated = self._annotated_status('is_up_to_date')
+        if annotated is not None:
+            return annotated
+
         version = self.version
         if version is None:
             return True
 
-        if version.next is None or version.uuid == version.next.uuid:
+        if version.next_id is None or version.next_id == version.pk:
             return True
 
         return False
 
+    @is_up_to_date.setter
+    def is_up_to_date(self, value):
+        self._set_annotated_status('is_up_to_date', value)
+
+    @property
+    def versions_behind(self):
+        """
+        Number of versions published after the current one, see
+        is_up_to_date.
+        """
+        annotated = self._annotated_status('versions_behind')
+        if annotated is not None:
+            return annotated
+
+        version = self.version
+        if version is None or version.sequence is None:
+            return 0
+
+        return Version.objects.for_object(self).filter(
+            sequence__gt=version.sequence, is_rolled_back=False).count()
+
+    @versions_behind.setter
+    def versions_behind(self, value):
+        self._set_annotated_status('versions_behind', value)
+
     def raise_version(self):
         if self.is_up_to_date:
             return False
@@ -95,12 +416,28 @@ class Device(models.Model):
 
         return True
 
+    def notify(self):
+        """
+        Queues notification of the device about its version in database.
+        Notification is sent only once the transaction is committed.
+        """
+        return Notification.objects.create(device=self)
+
     def save(self, *args, **kwargs):
-        update_device(self.ip_address)
-        return super().save(*args, **kwargs)
+        dirty_fields = self.dirty_fields
+        version_changed = 'version_id' in dirty_fields
+        result = super().save(*args, **kwargs)
+
+        if version_changed:
+            self.notify()
+
+        if version_changed or 'is_active' in dirty_fields:
+            invalidate_check_in([self.uuid])
+
+        return result
 
 
-class DeviceGroup(models.Model):
+class DeviceGroup(DirtyFieldsMixin, models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     name = models.CharField(max_length=50)
     is_active = models.BooleanField(default=True)
@@ -114,8 +451,16 @@ class DeviceGroup(models.Model):
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     devices = models.ManyToManyField(Device, related_name='groups', blank=True)
 
+    objects = DeviceGroupQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'is_active', 'timestamp'],
+                         name='device_group_owner_idx'),
+        ]
+
     def __init__(self, *args, **kwargs):
-        self._updated_devices = []
+        self._published_version = None
         super().__init__(*args, **kwargs)
 
     @property
@@ -125,33 +470,539 @@ class DeviceGroup(models.Model):
     @version.setter
     def version(self, version):
         self._version = version
-        for device in self.devices.filter(is_active=True):
-            new_version = Version.objects.create(name=version.name,
-                                                 file=version.file,
-                                                 file_checksum=version.file_checksum)
-
-            last_version = device.version
+        self._published_version = version
+
+    def stage_version(self, version, waves):
+        """
+        Sets the version of the group, which is assigned to the members
+        in waves, starting with the first one right away.
+        :param version: Version of the group.
+        :param waves: List of (percentage, delay, success threshold) tuples.
+        :return: Rollout of the version.
+        """
+        self._version = version
+        self.halt_rollouts()
+
+        rollout = Rollout.objects.create(group=self, version=version)
+        RolloutWave.objects.bulk_create([
+            RolloutWave(rollout=rollout, position=position,
+                        percentage=percentage, delay=delay,
+                        success_threshold=success_threshold)
+            for position, (percentage, delay, success_threshold)
+            in enumerate(waves)
+        ])
+
+        rollout.advance()
+        return rollout
+
+    def halt_rollouts(self):
+        """
+        Halts rollouts in progress, which would keep assigning their older
+        version to the members once the group has got another one.
+        """
+        return self.rollouts.filter(status=Rollout.IN_PROGRESS).update(
+            status=Rollout.HALTED, next_wave_at=None)
+
+    def add_devices(self, devices):
+        """
+        Adds devices which are not members of the group yet. Members are
+        excluded by the database, so they are never loaded, and the new
+        ones are added with one insert.
+        :param devices: Queryset of the devices.
+        :return: Number of added devices.
+        """
+        Membership = self.devices.through
+        device_pks = list(devices.exclude(
+            pk__in=Membership.objects.filter(
+                devicegroup=self).values('device_id')
+        ).order_by().values_list('pk', flat=True))
+
+        Membership.objects.bulk_create([
+            Membership(devicegroup_id=self.pk, device_id=device_pk)
+            for device_pk in device_pks
+        ])
+        return len(device_pks)
+
+    def remove_devices(self, devices):
+        """
+        Removes devices from the group with one delete.
+        :param devices: Queryset of the devices.
+        :return: Number of removed devices.
+        """
+        removed_count, _ = self.devices.through.objects.filter(
+            devicegroup=self, device__in=devices.values('pk')
+        ).delete()
+        return removed_count
+
+    def notify(self):
+        """
+        Queues notification of the group about its version in database.
+        Notification is sent only once the transaction is committed.
+        """
+        return Notification.objects.create(group=self)
+
+    def rollback(self):
+        """
+        Moves the group and the members running its version back to their
+        previous versions, whose files are still stored. Members are updated
+        with a fixed number of queries, regardless of their number.
+        Should be called inside of a transaction.
+        :return: Number of devices moved back or None if the group has
+        no previous version.
+        """
+        version = self.version
+        if version is None or version.previous_id is None:
+            return None
 
-            if last_version:
-                new_version.previous = last_version
+        now = timezone.now()
+        devices = self.devices.filter(version__source=version)
+        moved_devices = list(devices.values_list('pk', 'uuid'))
+
+        devices.update(
+            version=Subquery(Version.objects.filter(
+                pk=OuterRef('version')
+            ).values('previous')[:1]),
+            last_updated=now
+        )
+
+        # Previous versions must not lead back to rolled back ones.
+        Version.objects.filter(
+            Q(next__source=version) | Q(pk=version.previous_id)
+        ).update(next=None)
+        Version.objects.filter(
+            Q(source=version) | Q(pk=version.pk)
+        ).update(is_rolled_back=True)
+
+        self.halt_rollouts()
+
+        Notification.objects.bulk_create([
+            Notification(device_id=device_pk) for device_pk, _ in moved_devices
+        ])
+        invalidate_check_in([device_uuid for _, device_uuid in moved_devices])
+
+        self._version = version.previous
+        self.last_updated = now
+        self.save()
 
-            device.version = new_version
-            self._updated_devices.append(device)
+        return len(moved_devices)
 
     def save(self, *args, **kwargs):
-        for device in self._updated_devices:
-            device.last_updated = timezone.now()
-            device.save()
+        version_changed = '_version_id' in self.dirty_fields
+        result = super().save(*args, **kwargs)
+
+        # Copies of the version are assigned to the active members
+        # in bulk, once the group itself has been saved.
+        if self._published_version is not None:
+            self.halt_rollouts()
+            self.devices.filter(is_active=True).assign_version(
+                self._published_version)
+            self._published_version = None
+
+        if version_changed:
+            self.notify()
+
+        return result
+
+
+class Rollout(models.Model):
+    """
+    Version of the group assigned to the members in waves. Next wave is
+    started by the scheduler (see advance_rollouts command) once the delay
+    of the previous one has passed and enough of the devices updated so far
+    have reported running the version. Otherwise rollout is halted.
+    """
+    IN_PROGRESS = 'in_progress'
+    COMPLETED = 'completed'
+    HALTED = 'halted'
+
+    STATUS_CHOICES = (
+        (IN_PROGRESS, 'In progress'),
+        (COMPLETED, 'Completed'),
+        (HALTED, 'Halted'),
+    )
+
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
+    group = models.ForeignKey(DeviceGroup, on_delete=models.CASCADE,
+                              related_name='rollouts')
+    version = models.ForeignKey(Version, on_delete=models.CASCADE,
+                                related_name='rollouts')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES,
+                              default=IN_PROGRESS)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    started_waves = models.PositiveIntegerField(default=0)
+    next_wave_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'{self.group} - {self.version}'
 
-            new_version = device.version
+    @property
+    def success_ratio(self):
+        """ Part of the updated devices running the version. """
+        updated_devices = Device.objects.filter(version__source=self.version,
+                                                is_active=True)
+
+        updated_count = updated_devices.count()
+        if updated_count == 0:
+            return 1.0
+
+        succeeded_count = updated_devices.filter(
+            reported_version__source=self.version).count()
+        return succeeded_count / updated_count
+
+    def halt(self):
+        if self.status != self.IN_PROGRESS:
+            return False
+
+        self.status = self.HALTED
+        self.next_wave_at = None
+        self.save(update_fields=['status', 'next_wave_at'])
+        return True
+
+    def advance(self):
+        """
+        Starts the next wave, unless the previous one has not succeeded.
+        Should be called inside of a transaction.
+        :return: Number of devices the version has been assigned to
+        or None if the rollout is not in progress anymore.
+        """
+        if self.status != self.IN_PROGRESS:
+            return None
+
+        waves = list(self.waves.all())
+
+        if self.started_waves:
+            previous_wave = waves[self.started_waves - 1]
+            if self.success_ratio < previous_wave.success_threshold:
+                self.halt()
+                return None
+
+        wave = waves[self.started_waves]
+        now = timezone.now()
+
+        members = self.group.devices.filter(is_active=True)
+        target_count = math.ceil(members.count() * wave.percentage / 100)
+        missing_count = target_count - members.filter(
+            version__source=self.version).count()
+
+        assigned_count = 0
+        if missing_count > 0:
+            pending = members.exclude(version__source=self.version)
+
+            # Devices drop out of the pending ones while being updated,
+            # so the wave is bounded by the primary key, not the count.
+            last_pk = pending.order_by('pk').values_list(
+                'pk', flat=True)[missing_count - 1:missing_count].first()
+            if last_pk is None:
+                pending_wave = pending
+            else:
+                pending_wave = pending.filter(pk__lte=last_pk)
 
-            old_version = new_version.previous
-            if old_version:
-                old_version.next = new_version
-                old_version.save()
+            assigned_count = pending_wave.assign_version(self.version)
 
-            new_version.versioned_object = device
-            new_version.save()
+        wave.started_at = now
+        wave.device_count = assigned_count
+        wave.save(update_fields=['started_at', 'device_count'])
+
+        self.started_waves += 1
+        if self.started_waves == len(waves):
+            self.status = self.COMPLETED
+            self.next_wave_at = None
+        else:
+            self.next_wave_at = now + wave.delay
+        self.save(update_fields=['started_waves', 'status', 'next_wave_at'])
+
+        return assigned_count
+
+
+class RolloutWave(models.Model):
+    rollout = models.ForeignKey(Rollout, on_delete=models.CASCADE,
+                                related_name='waves')
+    position = models.PositiveIntegerField()
+
+    # Part of the members (in percents) running the version after the wave.
+    percentage = models.PositiveSmallIntegerField()
+    # Time given to the devices of the wave before the next one is started.
+    delay = models.DurationField()
+    # Part of the updated devices which must report running the version
+    # for the next wave to be started.
+    success_threshold = models.FloatField(default=0)
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    device_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
+
+
+class Notification(models.Model):
+    """
+    Outbox of the notifications for the devices and groups. Notifications
+    are written in the same transaction as the change of the version, so
+    they are only sent if it is committed, and are sent later by a separate
+    worker (see drain_notifications command). Notification is deleted once
+    it has been delivered, so every one is delivered at least once.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE,
+                               related_name='notifications',
+                               null=True, blank=True)
+    group = models.ForeignKey(DeviceGroup, on_delete=models.CASCADE,
+                              related_name='notifications',
+                              null=True, blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now,
+                                           db_index=True)
+    # Token of the worker's lease, see drain_notifications command.
+    lease_token = models.UUIDField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+
+
+class SearchEntry(models.Model):
+    """
+    Searchable text of the active device, group or the version published
+    for one of them, owned by the owner of the device or group. Copies
+    of the group versions assigned to the members are not searchable.
+    Entries are indexed for full-text search (see device.search).
+    """
+    DEVICE = 'device'
+    GROUP = 'group'
+    VERSION = 'version'
+    KIND_CHOICES = (
+        (DEVICE, 'Device'),
+        (GROUP, 'Group'),
+        (VERSION, 'Version'),
+    )
+
+    # Fields changing the entry of the device or group when saved.
+    INDEXED_FIELDS = {'name', 'ip_address', 'is_active', 'owner', 'owner_id'}
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True,
+                              related_name='+')
+
+    name = models.CharField(max_length=50)
+    # Hex of the uuid, without dashes.
+    uuid = models.CharField(max_length=32)
+    ip_address = models.CharField(max_length=39, blank=True)
 
-        update_device_group(self.uuid)
-        return super().save(*args, **kwargs)
+    class Meta:
+        unique_together = ('kind', 'object_id')
+        indexes = [
+            models.Index(fields=['owner', 'name'],
+                         name='device_search_name_idx'),
+            models.Index(fields=['owner', 'uuid'],
+                         name='device_search_uuid_idx'),
+            models.Index(fields=['owner', 'ip_address'],
+                         name='device_search_ip_address_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.name}'
+
+    @classmethod
+    def index_object(cls, indexed_object):
+        """ Creates or updates the entry of the device or group. """
+        kind = cls.DEVICE if isinstance(indexed_object, Device) else cls.GROUP
+
+        if not indexed_object.is_active:
+            cls.remove_objects(kind, [indexed_object.pk])
+            return
+
+        cls.objects.update_or_create(
+            kind=kind, object_id=indexed_object.pk,
+            defaults={
+                'owner_id': indexed_object.owner_id,
+                'name': indexed_object.name,
+                'uuid': indexed_object.uuid.hex,
+                'ip_address': getattr(indexed_object, 'ip_address', ''),
+            })
+
+    @classmethod
+    def index_version(cls, version):
+        versioned_object = version.versioned_object
+        if versioned_object is None or version.source_id is not None:
+            return
+
+        cls.objects.create(kind=cls.VERSION, object_id=version.pk,
+                           owner_id=versioned_object.owner_id,
+                           name=version.name, uuid=version.uuid.hex)
+
+    @classmethod
+    def index_devices(cls, devices):
+        """
+        Replaces entries of the devices of the queryset, e.g. created
+        or updated in bulk, which doesn't send the signals. Entries
+        of the inactive devices are removed.
+        :param devices: Queryset of the devices.
+        """
+        entries = [
+            cls(kind=cls.DEVICE, object_id=pk, owner_id=owner_id, name=name,
+                uuid=device_uuid.hex, ip_address=ip_address)
+            for pk, owner_id, name, device_uuid, ip_address
+            in devices.filter(is_active=True).values_list(
+                'pk', 'owner_id', 'name', 'uuid', 'ip_address')
+        ]
+
+        cls.objects.filter(kind=cls.DEVICE,
+                           object_id__in=devices.values('pk')).delete()
+        cls.objects.bulk_create(entries)
+
+    @classmethod
+    def index_groups(cls, groups):
+        """ Replaces entries of the groups of the queryset. """
+        entries = [
+            cls(kind=cls.GROUP, object_id=pk, owner_id=owner_id, name=name,
+                uuid=group_uuid.hex)
+            for pk, owner_id, name, group_uuid
+            in groups.filter(is_active=True).values_list(
+                'pk', 'owner_id', 'name', 'uuid')
+        ]
+
+        cls.objects.filter(kind=cls.GROUP,
+                           object_id__in=groups.values('pk')).delete()
+        cls.objects.bulk_create(entries)
+
+    @classmethod
+    def remove_objects(cls, kind, object_ids):
+        """
+        Removes entries of the devices or groups, together with entries
+        of their versions, which shouldn't be found any more either.
+        """
+        model = Device if kind == cls.DEVICE else DeviceGroup
+        content_type = ContentType.objects.get_for_model(model)
+
+        cls.objects.filter(
+            Q(kind=kind, object_id__in=object_ids) |
+            Q(kind=cls.VERSION, object_id__in=Version.objects.filter(
+                content_type=content_type, object_id__in=object_ids
+            ).values('pk'))
+        ).delete()
+
+
+@receiver(post_delete, sender=Version)
+def delete_unreferenced_version_files(sender, instance, **kwargs):
+    """
+    Stored files are shared between versions, so the file is deleted
+    only once the last version referencing it is deleted.
+    """
+    field_files = [field_file for field_file in (instance.file, instance.delta)
+                   if field_file]
+
+    def delete_files():
+        for field_file in field_files:
+            name = field_file.name
+            is_referenced = Version.objects.filter(
+                Q(file=name) | Q(delta=name)
+            ).exists()
+
+            if not is_referenced:
+                field_file.storage.delete(name)
+
+    if field_files:
+        transaction.on_commit(delete_files)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=DeviceGroup)
+def index_saved_object(sender, instance, update_fields=None, **kwargs):
+    if (update_fields is not None and
+            not SearchEntry.INDEXED_FIELDS.intersection(update_fields)):
+        return
+
+    SearchEntry.index_object(instance)
+
+
+@receiver(post_save, sender=Version)
+def index_saved_version(sender, instance, created, **kwargs):
+    if created:
+        SearchEntry.index_version(instance)
+
+
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=DeviceGroup)
+def remove_deleted_object(sender, instance, **kwargs):
+    kind = SearchEntry.DEVICE if sender is Device else SearchEntry.GROUP
+    SearchEntry.remove_objects(kind, [instance.pk])
+
+
+@receiver(post_delete, sender=Version)
+def remove_deleted_version(sender, instance, **kwargs):
+    SearchEntry.objects.filter(kind=SearchEntry.VERSION,
+                               object_id=instance.pk).delete()
+
+
+class VersionUpload(models.Model):
+    """
+    Upload of the version file sent in chunks, which may be sent
+    in parallel and in any order. Received chunks are written in place
+    into the part file, so interrupted upload can be resumed by sending
+    only the missing chunks.
+    """
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
+    name = models.CharField(max_length=50)
+    size = models.BigIntegerField()
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    versioned_object = GenericForeignKey('content_type', 'object_id')
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, UPLOADS_DIRECTORY,
+                            f'{self.uuid}.part')
+
+    def create_part_file(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as part_file:
+            part_file.truncate(self.size)
+
+    def delete_part_file(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def missing_ranges(self):
+        """ List of (offset, size) tuples of data not received yet. """
+        missing = []
+        position = 0
+
+        chunks = self.chunks.order_by('offset').values_list('offset', 'size')
+        for offset, size in chunks:
+            if offset > position:
+                missing.append((position, offset - position))
+            position = max(position, offset + size)
+
+        if position < self.size:
+            missing.append((position, self.size - position))
+
+        return missing
+
+
+class VersionUploadChunk(models.Model):
+    upload = models.ForeignKey(VersionUpload, on_delete=models.CASCADE,
+                               related_name='chunks')
+    offset = models.BigIntegerField()
+    size = models.BigIntegerField()
+    checksum = models.BinaryField()
+
+    class Meta:
+        ordering = ['offset']
@@ -0,0 +1,162 @@
+"""
+Keyset pagination of the lists.
+
+Pages are not numbered. Instead, the page starts right after (or ends
+right before) the object given by the cursor. The cursor is the encoded
+(timestamp, id) of that object. Objects are then found by the index,
+however deep the page is, and the objects are never counted.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+CURSOR_PARAMETERS = ('after', 'before', 'last')
+
+
+def encode_cursor(obj):
+    """ Returns opaque cursor pointing at the object. """
+    data = json.dumps([obj.timestamp.isoformat(), obj.id])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (timestamp, id) the cursor is pointing at.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        timestamp, obj_id = json.loads(
+            base64.urlsafe_b64decode(cursor + padding).decode())
+        timestamp = parse_datetime(timestamp)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Malformed cursor.')
+
+    if timestamp is None or not isinstance(obj_id, int):
+        raise ValueError('Malformed cursor.')
+
+    return timestamp, obj_id
+
+
+class CursorPage:
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+        # Other parameters of the request, e.g. page size or search query,
+        # kept by the links of the pages, see paginate.
+        self.query_string = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1]) if self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0]) if self.object_list else None
+
+
+class CursorPaginator:
+    """
+    Paginates queryset ordered by (timestamp, id), which should be covered
+    by an index. Page is fetched with a single query, including one object
+    more than the page size to tell if there is a next page.
+    """
+
+    def __init__(self, queryset, per_page, descending=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.descending = descending
+
+    def ordering(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return [f'{prefix}timestamp', f'{prefix}id']
+
+    def following(self, cursor, reverse=False):
+        """ Filter of the objects after the cursor in the given order. """
+        timestamp, obj_id = cursor
+        lookup = 'lt' if self.descending != reverse else 'gt'
+        return (Q(**{f'timestamp__{lookup}': timestamp}) |
+                Q(timestamp=timestamp, **{f'id__{lookup}': obj_id}))
+
+    def fetch(self, cursor=None, reverse=False):
+        queryset = self.queryset.order_by(*self.ordering(reverse))
+        if cursor is not None:
+            queryset = queryset.filter(self.following(cursor, reverse))
+
+        objects = list(queryset[:self.per_page + 1])
+        return objects[:self.per_page], len(objects) > self.per_page
+
+    def get_page(self, after=None, before=None, last=False):
+        """
+        Returns the page following `after` cursor, preceding `before`
+        cursor, the last page or the first one if none of them is given.
+        Malformed cursors are ignored, so the first page is returned.
+        """
+        try:
+            after = decode_cursor(after) if after else None
+            before = decode_cursor(before) if before else None
+        except ValueError:
+            after = before = None
+            last = False
+
+        if before is not None or last:
+            objects, has_previous = self.fetch(before, reverse=True)
+            objects.reverse()
+            return CursorPage(objects, has_next=before is not None,
+                              has_previous=has_previous)
+
+        objects, has_next = self.fetch(after)
+        return CursorPage(objects, has_next=has_next,
+                          has_previous=after is not None)
+
+
+def paginate(request, queryset, descending=False):
+    """
+    Returns the page of the queryset requested with `after`, `before`
+    or `last` parameters. Page size may be given with `page_size`.
+    Links of the pages should start with `?{{ page.query_string }}`,
+    which keeps the other parameters of the request.
+    """
+    try:
+        per_page = int(request.GET.get('page_size', settings.PAGE_SIZE))
+    except ValueError:
+        per_page = settings.PAGE_SIZE
+    per_page = min(max(per_page, 1), settings.MAX_PAGE_SIZE)
+
+    paginator = CursorPaginator(queryset, per_page, descending=descending)
+    page = paginator.get_page(after=request.GET.get('after'),
+                              before=request.GET.get('before'),
+                              last='last' in request.GET)
+
+    parameters = request.GET.copy()
+    for name in CURSOR_PARAMETERS:
+        parameters.pop(name, None)
+    if parameters:
+        page.query_string = parameters.urlencode() + '&'
+
+    return page
@@ -0,0 +1,188 @@
+"""
+Notifying devices about new versions.
+
+Every device is sent a POST request to DEVICE_PUSH_URL. Requests are sent
+concurrently from an event loop with limited number of requests in flight.
+Each request has a timeout and failed requests are retried after
+a randomized, exponentially growing delay, so retries of many devices are
+spread in time. Connections are kept alive and reused by the following
+requests to the same host.
+"""
+import asyncio
+import ipaddress
+import random
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+
+class ConnectionPool:
+    """ Idle keep-alive connections by host and port. """
+
+    def __init__(self):
+        self.idle = {}
+
+    async def acquire(self, host, port):
+        connections = self.idle.get((host, port))
+
+        while connections:
+            reader, writer = connections.pop()
+            # Connection may have been closed by the device in the meantime.
+            if not reader.at_eof():
+                return reader, writer
+            writer.close()
+
+        return await asyncio.open_connection(host, port)
+
+    def release(self, host, port, connection):
+        self.idle.setdefault((host, port), []).append(connection)
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+def device_url(url_template, ip_address):
+    """
+    Formats url of the device, IPv6 addresses are put in brackets.
+    :param url_template: Url with `{ip_address}` placeholder.
+    :param ip_address: Address of the device.
+    :return: Tuple of host, port and path of the request.
+    """
+    if ipaddress.ip_address(ip_address).version == 6:
+        ip_address = f'[{ip_address}]'
+
+    url = urlsplit(url_template.format(ip_address=ip_address))
+    path = url.path or '/'
+    if url.query:
+        path = f'{path}?{url.query}'
+
+    return url.hostname, url.port or 80, path
+
+
+class PushEngine:
+    """
+    Sends notifications to the devices. Should be used from a coroutine
+    running in the event loop, see push_devices for the blocking version.
+    """
+
+    def __init__(self, url_template, concurrency, timeout, retries, backoff):
+        self.url_template = url_template
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pool = ConnectionPool()
+
+    async def request(self, host, port, path):
+        """ Sends the request and returns the status code of the response. """
+        reader, writer = await self.pool.acquire(host, port)
+
+        try:
+            writer.write(f'POST {path} HTTP/1.1\r\n'
+                         f'Host: {host}\r\n'
+                         f'Content-Length: 0\r\n'
+                         f'Connection: keep-alive\r\n\r\n'.encode('ascii'))
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError('Connection closed by the device.')
+            status_code = int(status_line.split()[1])
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            content_length = headers.get('content-length')
+            if content_length is not None:
+                await reader.readexactly(int(content_length))
+        except BaseException:
+            writer.close()
+            raise
+
+        # Connection can only be reused when the end of the response is known.
+        if (content_length is None or
+                headers.get('connection', '').lower() == 'close'):
+            writer.close()
+        else:
+            self.pool.release(host, port, (reader, writer))
+
+        return status_code
+
+    async def push(self, ip_address):
+        """
+        Notifies the device, retrying on errors of the connection
+        and of the device.
+        :return: True if the device has accepted the notification.
+        """
+        host, port, path = device_url(self.url_template, ip_address)
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    status_code = await asyncio.wait_for(
+                        self.request(host, port, path), self.timeout)
+            except (OSError, ValueError, IndexError,
+                    asyncio.TimeoutError, asyncio.IncompleteReadError):
+                pass
+            else:
+                if 200 <= status_code < 300:
+                    return True
+                if status_code < 500:
+                    return False
+
+            if attempt < self.retries:
+                await asyncio.sleep(
+                    random.uniform(0, self.backoff * 2 ** attempt))
+
+        return False
+
+    async def push_all(self, ip_addresses):
+        """ Returns list of addresses of the devices not notified. """
+        try:
+            results = await asyncio.gather(
+                *(self.push(ip_address) for ip_address in ip_addresses))
+        finally:
+            self.pool.close()
+
+        return [ip_address
+                for ip_address, result in zip(ip_addresses, results)
+                if not result]
+
+
+def push_devices(ip_addresses, url_template=None, concurrency=None,
+                 timeout=None, retries=None, backoff=None):
+    """
+    Notifies the devices, blocking until all of them are done.
+    Settings are used for the options which are not given.
+    :param ip_addresses: Iterable with the addresses of the devices.
+    :return: List of addresses of the devices not notified.
+    """
+    ip_addresses = list(ip_addresses)
+    if not ip_addresses:
+        return []
+
+    options = {
+        'url_template': url_template or settings.DEVICE_PUSH_URL,
+        'concurrency': concurrency or settings.DEVICE_PUSH_CONCURRENCY,
+        'timeout': timeout or settings.DEVICE_PUSH_TIMEOUT,
+        'retries': settings.DEVICE_PUSH_RETRIES if retries is None else retries,
+        'backoff': settings.DEVICE_PUSH_BACKOFF if backoff is None else backoff,
+    }
+
+    async def push():
+        # Engine is created in the running loop it uses.
+        return await PushEngine(**options).push_all(ip_addresses)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(push())
+    finally:
+        loop.close()
@@ -0,0 +1,190 @@
+"""
+Full-text search of the devices, groups and versions.
+
+Searchable text of every object is kept in SearchEntry table. On SQLite
+compiled with FTS5, entries are also indexed by contentless FTS5 table,
+which is kept in sync with the entries by triggers, so it's updated by
+every write of the entries, including bulk ones. Results are ranked with
+bm25, names weighing the most. Owner of the entry is indexed as a token,
+so only the user's entries are ranked.
+
+Without FTS5, entries are searched by prefixes of their name, uuid or ip
+address, compared as ranges in the indexes of the entries table.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from device.models import SearchEntry
+
+
+FTS_TABLE = 'device_searchentry_fts'
+ENTRY_TABLE = SearchEntry._meta.db_table
+
+# Greatest character, see DeviceQuerySet.search.
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+# Weights of the name, uuid, ip address and owner columns in the ranking.
+RANK = f'bm25({FTS_TABLE}, 10.0, 5.0, 5.0, 0.0)'
+
+
+def _fts_values(row):
+    """ Values of the FTS5 columns of the entry row, see fts_query. """
+    return (f"{row}.id, {row}.name, {row}.uuid, {row}.ip_address, "
+            f"'u' || coalesce({row}.owner_id, '')")
+
+
+INSTALL_FTS = [
+    f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+    f"name, uuid, ip_address, owner, content='')",
+
+    f'CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {ENTRY_TABLE} BEGIN '
+    f'INSERT INTO {FTS_TABLE} (rowid, name, uuid, ip_address, owner) '
+    f'VALUES ({_fts_values("new")}); END',
+
+    f'CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {ENTRY_TABLE} BEGIN '
+    f'INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, uuid, ip_address, '
+    f"owner) VALUES ('delete', {_fts_values('old')}); END",
+
+    f'CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON {ENTRY_TABLE} BEGIN '
+    f'INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, uuid, ip_address, '
+    f"owner) VALUES ('delete', {_fts_values('old')}); "
+    f'INSERT INTO {FTS_TABLE} (rowid, name, uuid, ip_address, owner) '
+    f'VALUES ({_fts_values("new")}); END',
+
+    f'INSERT INTO {FTS_TABLE} (rowid, name, uuid, ip_address, owner) '
+    f'SELECT {_fts_values(ENTRY_TABLE)} FROM {ENTRY_TABLE}',
+]
+
+UNINSTALL_FTS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+# Terms are separated by whitespace, must contain a letter or a digit and
+# can't contain quotes, which are used by FTS5 query syntax.
+TERM = re.compile(r'[^\s"]*\w[^\s"]*')
+
+
+def fts_supported(db_connection):
+    """ Checks if the database is SQLite compiled with FTS5. """
+    if db_connection.vendor != 'sqlite':
+        return False
+
+    with db_connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+def fts_installed(db_connection):
+    if db_connection.vendor != 'sqlite':
+        return False
+
+    with db_connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master "
+                       "WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def install_fts(db_connection):
+    """
+    Creates FTS5 index of the search entries, if the database supports it.
+    :return: True if the index has been created.
+    """
+    if not fts_supported(db_connection):
+        return False
+
+    with db_connection.cursor() as cursor:
+        for statement in UNINSTALL_FTS + INSTALL_FTS:
+            cursor.execute(statement)
+    return True
+
+
+def uninstall_fts(db_connection):
+    with db_connection.cursor() as cursor:
+        for statement in UNINSTALL_FTS:
+            cursor.execute(statement)
+
+
+def parse_terms(query):
+    """ Returns terms of the query, see TERM. """
+    return TERM.findall(query)[:settings.SEARCH_MAX_TERMS]
+
+
+def term_variants(term):
+    """
+    Returns ways the term may be written in the entries. Uuids are stored
+    without dashes, but dashes may also be a part of the name.
+    """
+    if '-' not in term:
+        return [term]
+
+    variants = [term]
+    uuid_hex = term.replace('-', '').lower()
+    if uuid_hex:
+        variants.append(uuid_hex)
+    return variants
+
+
+def fts_query(terms, owner):
+    """
+    Returns FTS5 query matching the entries of the owner which have all
+    of the terms as prefixes of their words.
+    """
+    conditions = []
+    for term in terms:
+        variants = ' OR '.join(f'"{variant}"*'
+                               for variant in term_variants(term))
+        conditions.append(f'({variants})')
+
+    return (f'owner : "u{owner.id}" AND '
+            f'{{name uuid ip_address}} : ({" AND ".join(conditions)})')
+
+
+def fts_search(terms, owner, limit):
+    return list(SearchEntry.objects.raw(
+        f'SELECT {ENTRY_TABLE}.* FROM {FTS_TABLE} '
+        f'JOIN {ENTRY_TABLE} ON {ENTRY_TABLE}.id = {FTS_TABLE}.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s ORDER BY {RANK} LIMIT %s',
+        [fts_query(terms, owner), limit]
+    ))
+
+
+def prefix_search(terms, owner, limit):
+    """ Fallback search of the prefixes of the whole values. """
+    entries = SearchEntry.objects.filter(owner=owner)
+
+    for term in terms:
+        condition = Q()
+        for field_name in ('name', 'uuid', 'ip_address'):
+            for variant in term_variants(term):
+                condition |= Q(**{
+                    f'{field_name}__gte': variant,
+                    f'{field_name}__lt': variant + PREFIX_UPPER_BOUND
+                })
+        entries = entries.filter(condition)
+
+    return list(entries.order_by('name', 'id')[:limit])
+
+
+def search(query, owner, limit):
+    """
+    Finds devices, groups and versions of the owner matching all terms
+    of the query, best matches first.
+    :param query: Terms separated by whitespace.
+    :param owner: User owning the objects.
+    :param limit: Maximum number of the results.
+    :return: List of SearchEntry objects.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return []
+
+    if settings.SEARCH_USE_FTS and fts_installed(connection):
+        return fts_search(terms, owner, limit)
+
+    return prefix_search(terms, owner, limit)
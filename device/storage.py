@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+BLOBS_DIRECTORY = 'blobs'
+UPLOADS_DIRECTORY = 'uploads'
+
+
+def blob_path(file_checksum):
+    """
+    Generates path of the blob with given content.
+    :param file_checksum: Digest of the blob's content.
+    :return: Path where blob with given content is stored.
+    """
+    hex_checksum = bytes(file_checksum).hex()
+    return f'{BLOBS_DIRECTORY}/{hex_checksum[:2]}/{hex_checksum}'
+
+
+class AssembledFile(File):
+    """
+    Complete file stored on the same file system as the media,
+    which can be moved into the storage instead of being copied.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage where names are derived from the content of
+    the files (see blob_path), so every distinct file is stored once
+    and saving a file which is stored already does not write anything,
+    unless the stored blob no longer matches its name, e.g. after it has
+    been found corrupted by the scrubber, in which case it's replaced.
+    Files are shared by all versions referencing them and are deleted
+    once the last of them is deleted.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Same name means the same content, so name is never changed.
+        return name
+
+    def is_intact(self, name):
+        """ Checks if the stored blob still matches its name. """
+        # Imported here, as utils generate the paths of the blobs.
+        from device.utils import checksum
+
+        try:
+            return checksum(self.path(name)).hexdigest() == \
+                os.path.basename(name)
+        except OSError:
+            return False
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+
+        if os.path.exists(full_path) and self.is_intact(name):
+            # Blob is used again, so it must not be collected as garbage
+            # before the version referencing it is saved.
+            os.utime(full_path)
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Finished uploads are moved into place with a rename. If the same
+        # blob is being saved concurrently it is simply replaced, as it has
+        # the same content.
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), full_path,
+                           allow_overwrite=True)
+        else:
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+            try:
+                with os.fdopen(file_descriptor, 'wb') as file:
+                    for chunk in content.chunks():
+                        file.write(chunk)
+                os.replace(temporary_path, full_path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+        return name
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+
+class DeviceStub:
+    """
+    HTTP server standing in for the devices in tests. It runs its own
+    event loop in a background thread, keeps connections alive and records
+    the request lines it has received.
+    """
+
+    def __init__(self, failures=0, delay=0, status_code=200):
+        self.failures = failures
+        self.delay = delay
+        self.status_code = status_code
+
+        self.requests = []
+        self.connection_count = 0
+        self.handlers = set()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.server = None
+        self.port = None
+
+    def __enter__(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, '127.0.0.1', 0, loop=self.loop),
+            self.loop
+        ).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, *args):
+        self.server.close()
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    @property
+    def url_template(self):
+        return f'http://{{ip_address}}:{self.port}/update'
+
+    async def shutdown(self):
+        await self.server.wait_closed()
+
+        for handler in self.handlers:
+            handler.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+    async def handle(self, reader, writer):
+        self.connection_count += 1
+        handler = asyncio.Task.current_task()
+        self.handlers.add(handler)
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+
+                while await reader.readline() not in (b'\r\n', b''):
+                    pass
+
+                self.requests.append(request_line.decode('ascii').strip())
+
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+                status_code = self.status_code
+                if self.failures:
+                    self.failures -= 1
+                    status_code = 503
+
+                writer.write(f'HTTP/1.1 {status_code} Status\r\n'
+                             f'Content-Length: 2\r\n\r\nok'.encode('ascii'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.handlers.discard(handler)
+            writer.close()
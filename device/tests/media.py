@@ -0,0 +1,34 @@
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+
+from device.models import Version
+from device.utils import hashing_function
+
+
+class MediaTestCase(TransactionTestCase):
+    """
+    Test case storing the media files in a temporary directory, which
+    is removed after every test. Versions are created for `device`,
+    which is set up by the test cases.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_version(self, content, with_checksum=True):
+        file_checksum = hashing_function(content).digest() if with_checksum else b''
+        return Version.objects.create(
+            versioned_object=self.device,
+            name='version',
+            file=SimpleUploadedFile('testfile.txt', content),
+            file_checksum=file_checksum
+        )
@@ -0,0 +1,331 @@
+import json
+from uuid import uuid4
+
+from django.db import connection
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.shortcuts import reverse
+
+from projektPZ import status
+
+from custom_auth.models import User, ApiToken
+
+from device.models import Device, DeviceGroup
+
+
+class ApiTestCase(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.other_user = User.objects.create_user(username='other',
+                                                   password='password')
+        self.client.force_login(self.owner)
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(
+            url, json.dumps(data), content_type='application/json')
+
+    def create_devices(self, count, owner=None):
+        Device.objects.bulk_create([
+            Device(name=f'device{index}', ip_address='127.0.0.1',
+                   owner=owner or self.owner)
+            for index in range(count)
+        ])
+        return list(Device.objects.filter(
+            owner=owner or self.owner).order_by('pk'))
+
+
+class ApiAuthenticationTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client(enforce_csrf_checks=True)
+        self.data = [{'name': 'device', 'ip_address': '10.0.0.1'}]
+
+    def test_token_authenticates_without_csrf_token(self):
+        _, key = ApiToken.create_for(self.owner)
+
+        response = self.client.post(
+            reverse('api_device_list'), json.dumps(self.data),
+            content_type='application/json', HTTP_AUTHORIZATION=f'Token {key}')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Device.objects.get().owner, self.owner)
+
+    def test_invalid_token_gets_unauthorized_response(self):
+        response = self.client.post(
+            reverse('api_device_list'), json.dumps(self.data),
+            content_type='application/json', HTTP_AUTHORIZATION='Token key')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('errors', response.json())
+        self.assertFalse(Device.objects.exists())
+
+    def test_session_without_csrf_token_gets_json_error(self):
+        self.client.force_login(self.owner)
+
+        response = self.send('post', reverse('api_device_list'), self.data)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIn('errors', response.json())
+        self.assertFalse(Device.objects.exists())
+
+    def test_session_with_csrf_token(self):
+        self.client.force_login(self.owner)
+        self.client.get(reverse('device_create'))
+        csrf_token = self.client.cookies['csrftoken'].value
+
+        response = self.client.post(
+            reverse('api_device_list'), json.dumps(self.data),
+            content_type='application/json', HTTP_X_CSRFTOKEN=csrf_token)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class DeviceApiTestCase(ApiTestCase):
+    def test_anonymous_user_gets_unauthorized_response(self):
+        self.client.logout()
+
+        response = self.client.get(reverse('api_device_list'))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('errors', response.json())
+
+    def test_list_returns_only_active_devices_of_the_user(self):
+        devices = self.create_devices(3)
+        self.create_devices(2, owner=self.other_user)
+        devices[0].delete()
+
+        response = self.client.get(reverse('api_device_list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({item['uuid'] for item in response.json()['results']},
+                         {str(device.uuid) for device in devices[1:]})
+
+    def test_bulk_create_creates_all_devices(self):
+        data = [{'name': f'device{index}', 'ip_address': '10.0.0.1'}
+                for index in range(250)]
+
+        response = self.send('post', reverse('api_device_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()['results']), 250)
+        self.assertEqual(Device.objects.filter(owner=self.owner).count(), 250)
+
+    def test_bulk_create_with_invalid_object_creates_nothing(self):
+        data = [{'name': 'device', 'ip_address': '10.0.0.1'},
+                {'name': 'device', 'ip_address': 'not an address'}]
+
+        response = self.send('post', reverse('api_device_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('1', response.json()['errors'])
+        self.assertFalse(Device.objects.exists())
+
+    def test_bulk_create_with_object_instead_of_array(self):
+        response = self.send('post', reverse('api_device_list'),
+                             {'name': 'device', 'ip_address': '10.0.0.1'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Device.objects.exists())
+
+    @override_settings(API_MAX_BULK_SIZE=2)
+    def test_bulk_create_with_too_many_objects(self):
+        data = [{'name': 'device', 'ip_address': '10.0.0.1'}] * 3
+
+        response = self.send('post', reverse('api_device_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Device.objects.exists())
+
+    @override_settings(API_BATCH_SIZE=10)
+    def test_bulk_create_query_count_depends_on_batches(self):
+        data = [{'name': f'device{index}', 'ip_address': '10.0.0.1'}
+                for index in range(50)]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.send('post', reverse('api_device_list'), data)
+
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT INTO "device_device"')]
+        self.assertEqual(len(inserts), 5)
+
+    def test_bulk_update_changes_given_fields(self):
+        devices = self.create_devices(3)
+        data = [{'uuid': str(devices[0].uuid), 'name': 'renamed'},
+                {'uuid': str(devices[1].uuid), 'ip_address': '10.0.0.2'}]
+
+        response = self.send('patch', reverse('api_device_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['updated'], 2)
+        for device in devices:
+            device.refresh_from_db()
+        self.assertEqual(devices[0].name, 'renamed')
+        self.assertEqual(devices[0].ip_address, '127.0.0.1')
+        self.assertEqual(devices[1].name, 'device1')
+        self.assertEqual(devices[1].ip_address, '10.0.0.2')
+        self.assertEqual(devices[2].name, 'device2')
+
+    def test_bulk_update_uses_one_query_per_batch(self):
+        devices = self.create_devices(60)
+        data = [{'uuid': str(device.uuid), 'name': 'renamed'}
+                for device in devices]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.send('patch', reverse('api_device_list'), data)
+
+        updates = [query for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Device.objects.filter(name='renamed').count(), 60)
+
+    def test_bulk_update_of_other_users_device_changes_nothing(self):
+        device, = self.create_devices(1)
+        other_device, = self.create_devices(1, owner=self.other_user)
+        data = [{'uuid': str(device.uuid), 'name': 'renamed'},
+                {'uuid': str(other_device.uuid), 'name': 'renamed'}]
+
+        response = self.send('patch', reverse('api_device_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Device.objects.filter(name='renamed').exists())
+
+    def test_bulk_update_with_duplicated_device(self):
+        device, = self.create_devices(1)
+        data = [{'uuid': str(device.uuid), 'name': 'first'},
+                {'uuid': str(device.uuid), 'name': 'second'}]
+
+        response = self.send('patch', reverse('api_device_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_deactivate_skips_other_users_devices(self):
+        devices = self.create_devices(3)
+        other_device, = self.create_devices(1, owner=self.other_user)
+        data = [str(device.uuid) for device in devices[:2]]
+        data.append(str(other_device.uuid))
+
+        response = self.send('post', reverse('api_device_deactivate'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['deactivated'], 2)
+        self.assertEqual(Device.objects.filter(is_active=True).count(), 2)
+
+    def test_bulk_deactivate_with_invalid_uuid(self):
+        self.create_devices(1)
+
+        response = self.send('post', reverse('api_device_deactivate'),
+                             ['not an uuid'])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Device.objects.filter(is_active=True).exists())
+
+    def test_details_of_other_users_device_are_forbidden(self):
+        device, = self.create_devices(1, owner=self.other_user)
+
+        response = self.client.get(reverse(
+            'api_device_details', kwargs={'device_uuid': device.uuid}))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_details_of_not_existing_device(self):
+        response = self.client.get(reverse(
+            'api_device_details', kwargs={'device_uuid': uuid4()}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class GroupApiTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = DeviceGroup.objects.create(name='group', owner=self.owner)
+        self.url = reverse('api_group_devices',
+                           kwargs={'group_uuid': self.group.uuid})
+
+    def test_bulk_create_creates_all_groups(self):
+        data = [{'name': f'group{index}'} for index in range(3)]
+
+        response = self.send('post', reverse('api_group_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(DeviceGroup.objects.filter(owner=self.owner).count(),
+                         4)
+
+    def test_bulk_update_renames_groups(self):
+        other_group = DeviceGroup.objects.create(name='other', owner=self.owner)
+        data = [{'uuid': str(self.group.uuid), 'name': 'renamed'}]
+
+        response = self.send('patch', reverse('api_group_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['updated'], 1)
+        self.group.refresh_from_db()
+        other_group.refresh_from_db()
+        self.assertEqual(self.group.name, 'renamed')
+        self.assertEqual(other_group.name, 'other')
+
+    def test_bulk_update_of_other_users_group_changes_nothing(self):
+        other_group = DeviceGroup.objects.create(name='group',
+                                                 owner=self.other_user)
+        data = [{'uuid': str(self.group.uuid), 'name': 'renamed'},
+                {'uuid': str(other_group.uuid), 'name': 'renamed'}]
+
+        response = self.send('patch', reverse('api_group_list'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(DeviceGroup.objects.filter(name='renamed').exists())
+
+    def test_bulk_deactivate_skips_other_users_groups(self):
+        other_group = DeviceGroup.objects.create(name='group',
+                                                 owner=self.other_user)
+        data = [str(self.group.uuid), str(other_group.uuid)]
+
+        response = self.send('post', reverse('api_group_deactivate'), data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['deactivated'], 1)
+        self.assertEqual(list(DeviceGroup.objects.filter(is_active=True)),
+                         [other_group])
+
+    def test_add_devices_adds_only_users_devices(self):
+        devices = self.create_devices(3)
+        other_device, = self.create_devices(1, owner=self.other_user)
+        data = [str(device.uuid) for device in devices]
+        data.append(str(other_device.uuid))
+
+        response = self.send('post', self.url, data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['added'], 3)
+        self.assertEqual(set(self.group.devices.all()), set(devices))
+
+    def test_remove_devices_removes_given_members(self):
+        devices = self.create_devices(3)
+        self.group.devices.add(*devices)
+
+        response = self.send('delete', self.url, [str(devices[0].uuid)])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(self.group.devices.all()), set(devices[1:]))
+
+    def test_list_devices_of_other_users_group_is_forbidden(self):
+        self.client.force_login(self.other_user)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_add_devices_query_count_does_not_depend_on_device_count(self):
+        query_counts = []
+        for count in (5, 50):
+            devices = self.create_devices(count)
+            data = [str(device.uuid) for device in devices]
+
+            with CaptureQueriesContext(connection) as queries:
+                self.send('post', self.url, data)
+
+            query_counts.append(len(queries.captured_queries))
+            self.group.devices.clear()
+            Device.objects.all().delete()
+
+        self.assertEqual(query_counts[0], query_counts[1])
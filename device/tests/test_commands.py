@@ -0,0 +1,406 @@
+import json
+import os
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from custom_auth.models import User
+from device.management.commands import drain_notifications
+from device.models import (Device, Version, VersionUpload, DeviceGroup,
+                           Rollout, Notification)
+from device.search import search, uninstall_fts
+from device.tests.device_stub import DeviceStub
+from device.tests.media import MediaTestCase
+from device.utils import hashing_function
+
+
+class CommandTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user',
+                                             password='password')
+        self.device = Device.objects.create(name='device',
+                                            owner=self.user,
+                                            ip_address='192.168.1.1')
+
+    def call_command(self, *args, **kwargs):
+        stdout = StringIO()
+        call_command(*args, stdout=stdout, stderr=StringIO(), **kwargs)
+        return stdout.getvalue()
+
+
+class VerifyChecksumsTestCase(CommandTestCase):
+    def test_backfill_missing_checksums(self):
+        version = self.create_version(b'example content', with_checksum=False)
+
+        self.call_command('verify_checksums', backfill=True, workers=1)
+
+        version = Version.objects.get(pk=version.pk)
+        self.assertEqual(bytes(version.file_checksum),
+                         hashing_function(b'example content').digest())
+
+    def test_verify_matching_files(self):
+        self.create_version(b'example content')
+        self.create_version(b'example content')
+
+        output = self.call_command('verify_checksums', workers=1)
+
+        self.assertIn('Verified 1 files', output)
+
+    def test_verify_corrupted_file(self):
+        version = self.create_version(b'example content')
+        with open(version.file.path, 'wb') as file:
+            file.write(b'corrupted content')
+
+        with self.assertRaises(CommandError):
+            self.call_command('verify_checksums', workers=1)
+
+
+class ScrubVersionsTestCase(CommandTestCase):
+    def test_scrub_records_verification(self):
+        version = self.create_version(b'example content')
+
+        self.call_command('scrub_versions')
+
+        version = Version.objects.get(pk=version.pk)
+        self.assertIsNotNone(version.file_verified_at)
+        self.assertFalse(version.file_is_corrupted)
+
+    def test_scrub_marks_corrupted_file_for_all_versions(self):
+        first_version = self.create_version(b'example content')
+        second_version = self.create_version(b'example content')
+        with open(first_version.file.path, 'wb') as file:
+            file.write(b'corrupted content')
+
+        self.call_command('scrub_versions')
+
+        self.assertTrue(Version.objects.get(pk=first_version.pk).file_is_corrupted)
+        self.assertTrue(Version.objects.get(pk=second_version.pk).file_is_corrupted)
+
+    def test_scrub_skips_files_without_checksum(self):
+        version = self.create_version(b'example content', with_checksum=False)
+
+        self.call_command('scrub_versions')
+
+        version = Version.objects.get(pk=version.pk)
+        self.assertIsNone(version.file_verified_at)
+        self.assertFalse(version.file_is_corrupted)
+
+    def create_delta_version(self):
+        base_content = os.urandom(100000)
+        base_version = self.create_version(base_content)
+        version = self.create_version(base_content + b'changed')
+        version.previous = base_version
+        version.save()
+        version.build_delta()
+        return version
+
+    def test_scrub_records_verification_of_deltas(self):
+        version = self.create_delta_version()
+
+        self.call_command('scrub_versions')
+
+        version = Version.objects.get(pk=version.pk)
+        self.assertTrue(version.delta)
+        self.assertIsNotNone(version.delta_verified_at)
+
+    def test_scrub_drops_corrupted_delta(self):
+        version = self.create_delta_version()
+        with open(version.delta.path, 'wb') as file:
+            file.write(b'corrupted delta')
+
+        self.call_command('scrub_versions')
+
+        version = Version.objects.get(pk=version.pk)
+        self.assertFalse(version.delta)
+        self.assertIsNone(version.delta_checksum)
+        self.assertIsNone(version.delta_base_checksum)
+
+        self.call_command('build_deltas')
+
+        version = Version.objects.get(pk=version.pk)
+        with version.delta.open('rb') as delta:
+            self.assertEqual(hashing_function(delta.read()).digest(),
+                             bytes(version.delta_checksum))
+
+    def test_scrub_resumes_with_least_recently_verified_files(self):
+        verified_version = self.create_version(b'example content')
+        self.call_command('scrub_versions')
+        verified_at = Version.objects.get(pk=verified_version.pk).file_verified_at
+
+        new_version = self.create_version(b'other content')
+        self.call_command('scrub_versions', batch_size=1)
+
+        self.assertEqual(Version.objects.get(pk=verified_version.pk).file_verified_at,
+                         verified_at)
+        self.assertIsNotNone(Version.objects.get(pk=new_version.pk).file_verified_at)
+
+
+class CollectMediaGarbageTestCase(CommandTestCase):
+    def write_media_file(self, name, age_hours=48):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'content')
+
+        modified_at = time.time() - age_hours * 60 * 60
+        os.utime(path, (modified_at, modified_at))
+        return path
+
+    def test_referenced_files_are_kept(self):
+        version = self.create_version(b'example content')
+        os.utime(version.file.path, (0, 0))
+
+        self.call_command('collect_media_garbage')
+
+        self.assertTrue(os.path.exists(version.file.path))
+
+    def test_referenced_deltas_are_kept(self):
+        base_content = os.urandom(100000)
+        base_version = self.create_version(base_content)
+        version = self.create_version(base_content + b'changed')
+        version.previous = base_version
+        version.save()
+        version.build_delta()
+        os.utime(version.delta.path, (0, 0))
+
+        self.call_command('collect_media_garbage')
+
+        self.assertTrue(os.path.exists(version.delta.path))
+
+    def test_unreferenced_files_are_deleted(self):
+        path = self.write_media_file('blobs/aa/orphan')
+
+        output = self.call_command('collect_media_garbage')
+
+        self.assertFalse(os.path.exists(path))
+        self.assertIn('Collected 1 files', output)
+
+    def test_recent_files_are_kept(self):
+        path = self.write_media_file('blobs/aa/orphan', age_hours=1)
+
+        self.call_command('collect_media_garbage')
+
+        self.assertTrue(os.path.exists(path))
+
+    def test_unreferenced_files_are_quarantined(self):
+        path = self.write_media_file('blobs/aa/orphan')
+
+        self.call_command('collect_media_garbage', quarantine=True)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.media_root, '.quarantine', 'blobs/aa/orphan')))
+
+    def test_part_files_of_unfinished_uploads_are_kept(self):
+        upload = VersionUpload.objects.create(name='version', size=7,
+                                              versioned_object=self.device,
+                                              owner=self.user)
+        path = self.write_media_file(f'uploads/{upload.uuid}.part')
+
+        self.call_command('collect_media_garbage')
+
+        self.assertTrue(os.path.exists(path))
+
+    def test_dry_run_does_not_delete(self):
+        path = self.write_media_file('blobs/aa/orphan')
+
+        self.call_command('collect_media_garbage', dry_run=True)
+
+        self.assertTrue(os.path.exists(path))
+
+
+class AdvanceRolloutsTestCase(CommandTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device_group = DeviceGroup.objects.create(name='device_group',
+                                                       owner=self.user)
+        self.device_group.devices.add(self.device)
+        self.device_group.devices.add(
+            Device.objects.create(name='device', owner=self.user,
+                                  ip_address='192.168.1.2'))
+
+        self.version = Version(name='new_version')
+        self.version.publish(self.device_group, self.user,
+                             waves=[(50, timedelta(minutes=5), 0),
+                                    (100, timedelta(minutes=5), 0)])
+        self.rollout = Rollout.objects.get(version=self.version)
+
+    def updated_count(self):
+        return Device.objects.filter(version__source=self.version).count()
+
+    def test_wave_is_not_started_before_delay(self):
+        self.call_command('advance_rollouts')
+
+        self.assertEqual(self.updated_count(), 1)
+
+    def test_wave_is_started_after_delay(self):
+        Rollout.objects.filter(pk=self.rollout.pk).update(
+            next_wave_at=timezone.now() - timedelta(seconds=1))
+
+        self.call_command('advance_rollouts')
+
+        self.assertEqual(self.updated_count(), 2)
+        self.assertEqual(Rollout.objects.get(pk=self.rollout.pk).status,
+                         Rollout.COMPLETED)
+
+    def test_halted_rollout_is_not_advanced(self):
+        self.rollout.halt()
+        Rollout.objects.filter(pk=self.rollout.pk).update(
+            next_wave_at=timezone.now() - timedelta(seconds=1))
+
+        self.call_command('advance_rollouts')
+
+        self.assertEqual(self.updated_count(), 1)
+
+
+class DrainNotificationsTestCase(CommandTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device.ip_address = '127.0.0.1'
+        self.device.save()
+
+    def test_delivered_notifications_are_deleted(self):
+        self.device.notify()
+        self.device.notify()
+
+        with DeviceStub() as stub:
+            with override_settings(DEVICE_PUSH_URL=stub.url_template):
+                self.call_command('drain_notifications')
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_failed_notifications_are_sent_again_later(self):
+        notification = self.device.notify()
+
+        with DeviceStub(status_code=404) as stub:
+            with override_settings(DEVICE_PUSH_URL=stub.url_template):
+                self.call_command('drain_notifications')
+                self.call_command('drain_notifications')
+
+        notification = Notification.objects.get(pk=notification.pk)
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+    def test_notifications_are_leased_by_one_worker(self):
+        self.device.notify()
+        first_worker = drain_notifications.Command()
+        second_worker = drain_notifications.Command()
+        now = timezone.now()
+
+        # Both workers select the due notification before leasing it.
+        notification_pks = first_worker.due_notification_pks(now, 10)
+        self.assertEqual(second_worker.due_notification_pks(now, 10),
+                         notification_pks)
+
+        self.assertEqual(len(first_worker.lease(notification_pks, now, 60)),
+                         1)
+        self.assertEqual(second_worker.lease(notification_pks, now, 60), [])
+
+    def test_group_notifications_are_delivered(self):
+        DeviceGroup.objects.create(name='device_group',
+                                   owner=self.user).notify()
+
+        self.call_command('drain_notifications')
+
+        self.assertFalse(Notification.objects.exists())
+
+
+class ImportDevicesTestCase(CommandTestCase):
+    def write_file(self, name, content):
+        path = os.path.join(self.media_root, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def imported_devices(self):
+        return Device.objects.exclude(pk=self.device.pk)
+
+    def test_import_csv(self):
+        path = self.write_file('devices.csv',
+                               'name,ip_address\n'
+                               'first,10.0.0.1\n'
+                               'second,10.0.0.2\n')
+
+        output = self.call_command('import_devices', path, owner='user')
+
+        self.assertIn('Imported 2 devices', output)
+        self.assertEqual(
+            set(self.imported_devices().values_list('name', 'ip_address')),
+            {('first', '10.0.0.1'), ('second', '10.0.0.2')})
+        self.assertFalse(self.imported_devices().exclude(
+            owner=self.user).exists())
+
+    def test_import_jsonl_in_batches(self):
+        lines = [json.dumps({'name': f'device{index}',
+                             'ip_address': '10.0.0.1'})
+                 for index in range(25)]
+        path = self.write_file('devices.jsonl', '\n'.join(lines))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.call_command('import_devices', path, batch_size=10)
+
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT INTO "device_device"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(self.imported_devices().count(), 25)
+
+    def test_invalid_rows_are_skipped(self):
+        path = self.write_file('devices.jsonl',
+                               '{"name": "valid", "ip_address": "10.0.0.1"}\n'
+                               '{"name": "invalid", "ip_address": "x"}\n'
+                               '[1, 2]\n'
+                               'not json\n')
+        stderr = StringIO()
+
+        call_command('import_devices', path, stdout=StringIO(), stderr=stderr)
+
+        self.assertEqual(list(self.imported_devices().values_list(
+            'name', flat=True)), ['valid'])
+        self.assertIn('Line 2', stderr.getvalue())
+        self.assertIn('Skipped 3 invalid rows', stderr.getvalue())
+
+    def test_devices_are_added_to_groups(self):
+        groups = [DeviceGroup.objects.create(name=f'group{index}',
+                                             owner=self.user)
+                  for index in range(2)]
+        path = self.write_file('devices.csv',
+                               'name,ip_address\n'
+                               'first,10.0.0.1\n'
+                               'second,10.0.0.2\n')
+
+        self.call_command('import_devices', path, owner='user',
+                          groups=[str(group.uuid) for group in groups])
+
+        for group in groups:
+            self.assertEqual(set(group.devices.all()),
+                             set(self.imported_devices()))
+
+    def test_group_of_other_user_is_rejected(self):
+        other_user = User.objects.create_user(username='other',
+                                              password='password')
+        group = DeviceGroup.objects.create(name='group', owner=other_user)
+        path = self.write_file('devices.csv', 'name,ip_address\n')
+
+        with self.assertRaises(CommandError):
+            self.call_command('import_devices', path, owner='user',
+                              groups=[str(group.uuid)])
+
+
+class RebuildSearchIndexTestCase(CommandTestCase):
+    def test_rebuilt_index_finds_existing_entries(self):
+        uninstall_fts(connection)
+
+        self.call_command('rebuild_search_index')
+
+        self.assertEqual([entry.object_id
+                          for entry in search('device', self.user, 10)],
+                         [self.device.pk])
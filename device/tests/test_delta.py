@@ -0,0 +1,89 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from device.delta import generate_delta, apply_delta, DeltaTooLarge
+
+
+class DeltaTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def round_trip(self, base_content, target_content, **kwargs):
+        base = self.write_file('base', base_content)
+        target = self.write_file('target', target_content)
+
+        delta = io.BytesIO()
+        generate_delta(base, target, delta, **kwargs)
+
+        delta.seek(0)
+        output = io.BytesIO()
+        apply_delta(base, delta, output)
+
+        return delta.getvalue(), output.getvalue()
+
+    def test_delta_rebuilds_file_with_inserted_data(self):
+        base_content = os.urandom(200000)
+        target_content = (base_content[:1000] + b'inserted' +
+                          base_content[1000:])
+
+        delta, output = self.round_trip(base_content, target_content)
+
+        self.assertEqual(output, target_content)
+        self.assertLess(len(delta), len(target_content) // 10)
+
+    def test_delta_rebuilds_file_with_removed_and_changed_data(self):
+        base_content = os.urandom(200000)
+        target_content = (base_content[:50000] + os.urandom(100) +
+                          base_content[60000:150000] + base_content[:5000])
+
+        delta, output = self.round_trip(base_content, target_content)
+
+        self.assertEqual(output, target_content)
+        self.assertLess(len(delta), len(target_content) // 10)
+
+    def test_blocks_are_found_at_every_shift(self):
+        base_content = os.urandom(20000)
+
+        for shift in range(1, 9):
+            target_content = os.urandom(shift) + base_content
+
+            delta, output = self.round_trip(base_content, target_content,
+                                            block_size=64)
+
+            self.assertEqual(output, target_content)
+            self.assertLess(len(delta), 200)
+
+    def test_delta_of_empty_files(self):
+        delta, output = self.round_trip(b'', b'')
+
+        self.assertEqual(output, b'')
+
+    def test_unrelated_files_are_not_worth_delta(self):
+        with self.assertRaises(DeltaTooLarge):
+            self.round_trip(os.urandom(100000), os.urandom(100000))
+
+    def test_unrelated_file_is_given_up_once_literals_exceed_limit(self):
+        base = self.write_file('base', os.urandom(100000))
+        target = self.write_file('target', b'\0' * 100000)
+
+        with self.assertRaises(DeltaTooLarge):
+            generate_delta(base, target, io.BytesIO(), max_literal_ratio=0.01)
+
+    def test_apply_rejects_not_delta_file(self):
+        base = self.write_file('base', b'content')
+
+        with self.assertRaises(ValueError):
+            apply_delta(base, io.BytesIO(b'not a delta'), io.BytesIO())
@@ -1,7 +1,17 @@
+import os
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction, IntegrityError
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from custom_auth.models import User
-from device.models import Device, Version, DeviceGroup
+from device.models import (Device, Version, DeviceGroup, Rollout,
+                           Notification)
+from device.tests.media import MediaTestCase
+from device.utils import hashing_function
 
 
 class DeviceTestCase(TransactionTestCase):
@@ -79,6 +89,113 @@ class DeviceTestCase(TransactionTestCase):
         self.assertTrue(result)
 
 
+    def test_save_writes_only_changed_fields(self):
+        device = Device.objects.get(pk=self.device.pk)
+        device.name = 'renamed'
+
+        with CaptureQueriesContext(connection) as queries:
+            device.save()
+
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "device_device"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"name"', updates[0])
+        self.assertIn('"last_edited"', updates[0])
+        self.assertNotIn('"ip_address"', updates[0])
+        self.assertEqual(Device.objects.get(pk=device.pk).name, 'renamed')
+
+    def test_save_without_changes_writes_nothing(self):
+        device = Device.objects.get(pk=self.device.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            device.save()
+
+        self.assertEqual(len(queries), 0)
+
+    def test_device_is_notified_only_when_version_changes(self):
+        self.device.name = 'renamed'
+        self.device.save()
+        self.device.is_active = False
+        self.device.save()
+
+        self.assertFalse(self.device.notifications.exists())
+
+        self.device.version = Version.objects.create(
+            versioned_object=self.device, name='new_version')
+        self.device.save()
+
+        self.assertEqual(self.device.notifications.count(), 1)
+
+    def test_device_is_not_notified_when_transaction_is_rolled_back(self):
+        try:
+            with transaction.atomic():
+                self.device.version = Version.objects.create(
+                    versioned_object=self.device, name='new_version')
+                self.device.save()
+                raise IntegrityError()
+        except IntegrityError:
+            pass
+
+        self.assertFalse(Notification.objects.exists())
+
+
+class VersionHistoryTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user',
+                                             password='password')
+        self.device = Device.objects.create(name='device',
+                                            owner=self.user,
+                                            ip_address='192.168.1.1')
+
+        self.versions = []
+        for number in range(4):
+            version = Version(name=f'version_{number}')
+            version.publish(self.device, self.user)
+            self.versions.append(version)
+
+    def test_versions_are_numbered_in_order_of_publishing(self):
+        self.assertEqual([version.sequence for version in self.versions],
+                         [1, 2, 3, 4])
+        self.assertEqual(Version.objects.for_object(self.device).head(),
+                         self.versions[-1])
+
+    def test_ancestor_takes_single_query(self):
+        with self.assertNumQueries(1):
+            ancestor = self.versions[3].ancestor(2)
+
+        self.assertEqual(ancestor, self.versions[1])
+        self.assertIsNone(self.versions[0].ancestor())
+
+    def test_versions_behind(self):
+        self.device.version = self.versions[1]
+        self.device.save()
+
+        with self.assertNumQueries(1):
+            versions_behind = self.device.versions_behind
+
+        self.assertEqual(versions_behind, 2)
+
+    def test_sequence_is_unique_for_the_object(self):
+        with self.assertRaises(IntegrityError):
+            Version.objects.create(versioned_object=self.device,
+                                   name='duplicate',
+                                   sequence=self.versions[-1].sequence)
+
+    def test_linked_ancestors(self):
+        ancestors = list(self.versions[3].linked_ancestors())
+
+        self.assertEqual(ancestors, self.versions[2::-1])
+
+    def test_group_copies_continue_history_of_devices(self):
+        group = DeviceGroup.objects.create(name='group', owner=self.user)
+        group.devices.add(self.device)
+
+        Version(name='group_version').publish(group, self.user)
+        device = Device.objects.get(pk=self.device.pk)
+
+        self.assertEqual(device.version.sequence, 5)
+        self.assertEqual(device.version.ancestor(), self.versions[-1])
+
 class DeviceGroupTestCase(TransactionTestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='user',
@@ -120,3 +237,462 @@ class DeviceGroupTestCase(TransactionTestCase):
         self.assertEqual(device_after_save.version.name, new_version.name)
         self.assertEqual(device_after_save.version.file_checksum,
                          new_version.file_checksum)
+
+    def test_add_group_version_links_device_versions(self):
+        device = Device.objects.create(name='device',
+                                       owner=self.user,
+                                       ip_address='192.168.1.1')
+        old_version = Version.objects.create(versioned_object=device,
+                                             name='old_version')
+        device.version = old_version
+        device.save()
+        self.device_group.devices.add(device)
+
+        new_version = Version.objects.create(versioned_object=self.device_group,
+                                             name='new_version')
+        self.device_group.version = new_version
+        self.device_group.save()
+
+        device_after_save = Device.objects.get(pk=device.pk)
+        old_version = Version.objects.get(pk=old_version.pk)
+
+        self.assertEqual(device_after_save.version.previous, old_version)
+        self.assertEqual(device_after_save.version.versioned_object, device)
+        self.assertEqual(old_version.next, device_after_save.version)
+        self.assertIsNotNone(device_after_save.last_updated)
+
+    def test_add_group_version_skips_inactive_devices(self):
+        device = Device.objects.create(name='device',
+                                       owner=self.user,
+                                       ip_address='192.168.1.1',
+                                       is_active=False)
+        self.device_group.devices.add(device)
+
+        new_version = Version.objects.create(versioned_object=self.device_group,
+                                             name='new_version')
+        self.device_group.version = new_version
+        self.device_group.save()
+
+        self.assertIsNone(Device.objects.get(pk=device.pk).version)
+
+    def test_add_group_version_query_count_does_not_depend_on_devices(self):
+        def count_queries(devices_count):
+            group = DeviceGroup.objects.create(name='group', owner=self.user)
+            for number in range(devices_count):
+                device = Device.objects.create(name='device',
+                                               owner=self.user,
+                                               ip_address='192.168.1.1')
+                device.version = Version.objects.create(versioned_object=device,
+                                                        name='old_version')
+                device.save()
+                group.devices.add(device)
+
+            new_version = Version.objects.create(versioned_object=group,
+                                                 name='new_version')
+            with CaptureQueriesContext(connection) as queries:
+                group.version = new_version
+                group.save()
+
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_assign_version_query_count_per_chunk(self):
+        devices = Device.objects.filter(owner=self.user)
+        chunk_size = devices.assign_chunk_size(Version, Notification)
+        Device.objects.bulk_create([
+            Device(name='device', owner=self.user, ip_address='192.168.1.1')
+            for number in range(chunk_size * 2 + 1)
+        ])
+        version = Version.objects.create(versioned_object=self.device_group,
+                                         name='new_version')
+        ContentType.objects.get_for_model(Device)
+
+        # Three chunks of four queries, as the devices have no previous
+        # versions to link, and the query finding no more devices.
+        with transaction.atomic(), self.assertNumQueries(3 * 4 + 1):
+            self.assertEqual(devices.assign_version(version),
+                             chunk_size * 2 + 1)
+
+    def test_add_group_version_notifies_devices(self):
+        for number in range(3):
+            self.device_group.devices.add(
+                Device.objects.create(name='device', owner=self.user,
+                                      ip_address='192.168.1.1'))
+
+        new_version = Version.objects.create(versioned_object=self.device_group,
+                                             name='new_version')
+
+        self.device_group.version = new_version
+        self.device_group.save()
+
+        self.assertEqual(
+            Notification.objects.filter(device__isnull=False).count(), 3)
+        self.assertEqual(self.device_group.notifications.count(), 1)
+
+class DeviceGroupRollbackTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user',
+                                             password='password')
+        self.device_group = DeviceGroup.objects.create(name='device_group',
+                                                       owner=self.user)
+
+        for number in range(3):
+            self.device_group.devices.add(
+                Device.objects.create(name='device', owner=self.user,
+                                      ip_address='192.168.1.1'))
+
+        self.old_version = Version(name='old_version')
+        self.old_version.publish(self.device_group, self.user)
+        self.new_version = Version(name='new_version')
+        self.new_version.publish(self.device_group, self.user)
+
+    def test_rollback_moves_devices_to_previous_versions(self):
+        old_copies = set(Version.objects.filter(source=self.old_version))
+
+        self.assertEqual(self.device_group.rollback(), 3)
+
+        devices = Device.objects.select_related('version')
+        self.assertEqual({device.version for device in devices}, old_copies)
+        for device in devices:
+            self.assertTrue(device.is_up_to_date)
+            self.assertEqual(device.versions_behind, 0)
+
+        device_group = DeviceGroup.objects.get(pk=self.device_group.pk)
+        self.assertEqual(device_group.version, self.old_version)
+        self.assertEqual(
+            Version.objects.for_object(device_group).head(), self.old_version)
+
+    def test_rollback_marks_versions_rolled_back(self):
+        self.device_group.rollback()
+
+        self.assertEqual(Version.objects.filter(is_rolled_back=True).count(), 4)
+        self.assertFalse(
+            Version.objects.filter(source=self.old_version,
+                                   is_rolled_back=True).exists())
+
+    def test_rollback_notifies_devices(self):
+        Notification.objects.all().delete()
+
+        self.device_group.rollback()
+
+        self.assertEqual(
+            Notification.objects.filter(device__isnull=False).count(), 3)
+
+    def test_rollback_query_count_does_not_depend_on_devices(self):
+        def count_queries(devices_count):
+            group = DeviceGroup.objects.create(name='group', owner=self.user)
+            for number in range(devices_count):
+                group.devices.add(
+                    Device.objects.create(name='device', owner=self.user,
+                                          ip_address='192.168.1.1'))
+            Version(name='old_version').publish(group, self.user)
+            Version(name='new_version').publish(group, self.user)
+
+            group = DeviceGroup.objects.get(pk=group.pk)
+            with CaptureQueriesContext(connection) as queries:
+                group.rollback()
+
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_rollback_without_previous_version(self):
+        device_group = DeviceGroup.objects.create(name='device_group',
+                                                  owner=self.user)
+        Version(name='version').publish(device_group, self.user)
+
+        self.assertIsNone(device_group.rollback())
+
+class UpdateStatusTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user',
+                                             password='password')
+        self.group = DeviceGroup.objects.create(name='group', owner=self.user)
+
+        # Never updated, up to date, one and two versions behind.
+        self.devices = [Device.objects.create(name=f'device_{number}',
+                                              owner=self.user,
+                                              ip_address='192.168.1.1')
+                        for number in range(4)]
+        self.group.devices.add(*self.devices[1:])
+
+        for number in range(3):
+            Version(name=f'version_{number}').publish(self.group, self.user)
+
+        for device, sequence in zip(self.devices[1:], (3, 2, 1)):
+            device.version = Version.objects.for_object(device).get(
+                sequence=sequence)
+            device.save()
+
+    def test_annotations_match_properties(self):
+        with self.assertNumQueries(1):
+            annotated = {device.pk: (device.is_up_to_date,
+                                     device.versions_behind)
+                         for device in Device.objects.with_update_status()}
+
+        self.assertEqual(annotated, {
+            device.pk: (device.is_up_to_date, device.versions_behind)
+            for device in Device.objects.all()
+        })
+        self.assertEqual([annotated[device.pk] for device in self.devices],
+                         [(True, 0), (True, 0), (False, 1), (False, 2)])
+
+    def test_annotations_are_not_used_once_version_changes(self):
+        device = Device.objects.with_update_status().get(
+            pk=self.devices[3].pk)
+
+        self.assertTrue(device.raise_version())
+
+        self.assertFalse(device.is_up_to_date)
+        self.assertEqual(device.versions_behind, 1)
+
+        device.version = Version.objects.for_object(device).get(sequence=3)
+
+        self.assertTrue(device.is_up_to_date)
+        self.assertEqual(device.versions_behind, 0)
+
+    def test_rolled_back_versions_are_not_counted(self):
+        self.group.rollback()
+
+        annotated = {device.pk: (device.is_up_to_date,
+                                 device.versions_behind)
+                     for device in Device.objects.with_update_status()}
+
+        self.assertEqual(annotated, {
+            device.pk: (device.is_up_to_date, device.versions_behind)
+            for device in Device.objects.all()
+        })
+
+    def test_group_update_counts(self):
+        self.devices[3].is_active = False
+        self.devices[3].save()
+        empty_group = DeviceGroup.objects.create(name='empty', owner=self.user)
+
+        with self.assertNumQueries(1):
+            groups = {group.pk: (group.device_count, group.up_to_date_count,
+                                 group.outdated_count)
+                      for group in DeviceGroup.objects.with_update_counts()}
+
+        self.assertEqual(groups, {self.group.pk: (2, 1, 1),
+                                  empty_group.pk: (0, 0, 0)})
+
+
+class RolloutTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user',
+                                             password='password')
+        self.device_group = DeviceGroup.objects.create(name='device_group',
+                                                       owner=self.user)
+
+        for number in range(10):
+            device = Device.objects.create(name='device',
+                                           owner=self.user,
+                                           ip_address='192.168.1.1')
+            self.device_group.devices.add(device)
+
+        self.version = Version(name='new_version')
+
+    def updated_devices(self):
+        return Device.objects.filter(version__source=self.version)
+
+    def publish(self, waves):
+        self.version.publish(self.device_group, self.user, waves=waves)
+        return Rollout.objects.get(version=self.version)
+
+    def test_first_wave_is_started_on_publish(self):
+        rollout = self.publish([(10, timedelta(minutes=5), 0),
+                                (100, timedelta(minutes=5), 0)])
+
+        self.assertEqual(self.updated_devices().count(), 1)
+        self.assertEqual(rollout.status, Rollout.IN_PROGRESS)
+        self.assertEqual(rollout.started_waves, 1)
+        self.assertIsNotNone(rollout.next_wave_at)
+        self.assertEqual(
+            DeviceGroup.objects.get(pk=self.device_group.pk).version,
+            self.version
+        )
+
+    def test_waves_reach_their_percentage_of_devices(self):
+        rollout = self.publish([(10, timedelta(0), 0),
+                                (50, timedelta(0), 0),
+                                (100, timedelta(0), 0)])
+
+        self.assertEqual(rollout.advance(), 4)
+        self.assertEqual(self.updated_devices().count(), 5)
+
+        self.assertEqual(rollout.advance(), 5)
+        self.assertEqual(self.updated_devices().count(), 10)
+        self.assertEqual(rollout.status, Rollout.COMPLETED)
+        self.assertIsNone(rollout.advance())
+
+    def test_rollout_is_halted_below_success_threshold(self):
+        rollout = self.publish([(20, timedelta(0), 0.5),
+                                (100, timedelta(0), 0.5)])
+
+        self.assertIsNone(rollout.advance())
+        self.assertEqual(rollout.status, Rollout.HALTED)
+        self.assertEqual(self.updated_devices().count(), 2)
+
+    def test_rollout_continues_when_devices_report_version(self):
+        rollout = self.publish([(20, timedelta(0), 0.5),
+                                (100, timedelta(0), 0.5)])
+
+        device = self.updated_devices().first()
+        device.reported_version = device.version
+        device.save()
+
+        self.assertEqual(rollout.advance(), 8)
+        self.assertEqual(rollout.status, Rollout.COMPLETED)
+
+    def test_new_rollout_halts_previous_one(self):
+        rollout = self.publish([(10, timedelta(0), 0),
+                                (100, timedelta(0), 0)])
+
+        Version(name='newer_version').publish(self.device_group, self.user,
+                                              waves=[(100, timedelta(0), 0)])
+
+        rollout = Rollout.objects.get(pk=rollout.pk)
+        self.assertEqual(rollout.status, Rollout.HALTED)
+
+    def test_version_published_without_waves_halts_rollout(self):
+        rollout = self.publish([(25, timedelta(0), 0),
+                                (100, timedelta(0), 0)])
+
+        newer_version = Version(name='newer_version')
+        newer_version.publish(self.device_group, self.user)
+
+        rollout = Rollout.objects.get(pk=rollout.pk)
+        self.assertEqual(rollout.status, Rollout.HALTED)
+        self.assertIsNone(rollout.next_wave_at)
+        self.assertIsNone(rollout.advance())
+        self.assertEqual(
+            Device.objects.filter(version__source=newer_version).count(), 10)
+
+
+class VersionFileStorageTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user',
+                                             password='password')
+        self.device = Device.objects.create(name='device',
+                                            owner=self.user,
+                                            ip_address='192.168.1.1')
+
+    def test_identical_files_are_stored_once(self):
+        first_version = self.create_version(b'example content')
+        second_version = self.create_version(b'example content')
+
+        self.assertEqual(first_version.file.name, second_version.file.name)
+        self.assertEqual(first_version.file_reference_count, 2)
+        self.assertTrue(os.path.exists(first_version.file.path))
+
+    def test_different_files_are_stored_separately(self):
+        first_version = self.create_version(b'example content')
+        second_version = self.create_version(b'other content')
+
+        self.assertNotEqual(first_version.file.name, second_version.file.name)
+        self.assertEqual(first_version.file_reference_count, 1)
+
+    def test_file_is_kept_while_referenced(self):
+        first_version = self.create_version(b'example content')
+        second_version = self.create_version(b'example content')
+
+        first_version.delete()
+
+        self.assertTrue(os.path.exists(second_version.file.path))
+
+    def test_file_is_deleted_with_last_reference(self):
+        version = self.create_version(b'example content')
+        path = version.file.path
+
+        version.delete()
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_corrupted_blob_is_replaced_when_uploaded_again(self):
+        corrupted_version = self.create_version(b'example content')
+        with open(corrupted_version.file.path, 'wb') as file:
+            file.write(b'corrupted content')
+
+        version = self.create_version(b'example content')
+
+        self.assertEqual(version.file.name, corrupted_version.file.name)
+        with open(version.file.path, 'rb') as file:
+            self.assertEqual(file.read(), b'example content')
+
+    def test_group_copies_keep_corrupted_flag(self):
+        group = DeviceGroup.objects.create(name='group', owner=self.user)
+        group.devices.add(self.device)
+        version = self.create_version(b'example content')
+        version.file_is_corrupted = True
+        version.save()
+
+        group.devices.all().assign_version(version)
+
+        copy = Version.objects.get(source=version)
+        self.assertTrue(copy.file_is_corrupted)
+
+    def test_build_delta_from_previous_version(self):
+        base_content = os.urandom(100000)
+        target_content = base_content[:500] + b'changed' + base_content[500:]
+
+        old_version = self.create_version(base_content)
+        new_version = self.create_version(target_content)
+        new_version.previous = old_version
+        new_version.save()
+
+        is_built = new_version.build_delta()
+        artifact, artifact_checksum = new_version.artifact_for(old_version)
+
+        self.assertTrue(is_built)
+        self.assertEqual(artifact, new_version.delta)
+        self.assertLess(artifact.size, new_version.file.size)
+        self.assertEqual(bytes(artifact_checksum),
+                         hashing_function(artifact.read()).digest())
+
+    def test_delta_is_built_once_version_is_published(self):
+        base_content = os.urandom(100000)
+        old_version = self.create_version(base_content)
+        old_version.publish(self.device, self.user)
+        new_version = Version(
+            name='version',
+            file=SimpleUploadedFile('testfile.txt', base_content + b'changed'),
+            file_checksum=hashing_function(base_content + b'changed').digest())
+
+        with transaction.atomic():
+            new_version.publish(self.device, self.user)
+            self.assertIsNone(Version.objects.get(
+                pk=new_version.pk).delta_base_checksum)
+
+        new_version = Version.objects.get(pk=new_version.pk)
+        self.assertTrue(new_version.delta)
+        self.assertEqual(bytes(new_version.delta_base_checksum),
+                         bytes(old_version.file_checksum))
+
+    def test_full_file_is_served_for_other_base(self):
+        base_content = os.urandom(100000)
+        target_content = base_content[:500] + b'changed' + base_content[500:]
+
+        old_version = self.create_version(base_content)
+        other_version = self.create_version(b'other content')
+        new_version = self.create_version(target_content)
+        new_version.previous = old_version
+        new_version.save()
+        new_version.build_delta()
+
+        artifact, _ = new_version.artifact_for(other_version)
+
+        self.assertEqual(artifact, new_version.file)
+
+    def test_not_worth_delta_is_not_stored(self):
+        old_version = self.create_version(os.urandom(10000))
+        new_version = self.create_version(os.urandom(10000))
+        new_version.previous = old_version
+        new_version.save()
+
+        is_built = new_version.build_delta()
+
+        self.assertFalse(is_built)
+        self.assertFalse(new_version.delta)
+        self.assertIsNotNone(new_version.delta_base_checksum)
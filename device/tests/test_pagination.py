@@ -0,0 +1,100 @@
+from django.test import TransactionTestCase, RequestFactory
+from django.utils import timezone
+
+from custom_auth.models import User
+from device.models import Device
+from device.pagination import (CursorPaginator, encode_cursor, decode_cursor,
+                               paginate)
+
+
+class CursorPaginatorTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user',
+                                             password='password')
+        for number in range(12):
+            Device.objects.create(name=f'device_{number}', owner=self.user,
+                                  ip_address='192.168.1.1')
+
+        # Objects with the same timestamp are ordered by id.
+        Device.objects.filter(pk__lte=6).update(timestamp=timezone.now())
+
+        self.devices = list(Device.objects.order_by('timestamp', 'id'))
+        self.paginator = CursorPaginator(Device.objects.all(), 5)
+
+    def test_first_page(self):
+        page = self.paginator.get_page()
+
+        self.assertEqual(list(page), self.devices[:5])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_pages_are_walked_forward_and_back(self):
+        first_page = self.paginator.get_page()
+        second_page = self.paginator.get_page(after=first_page.next_cursor)
+        third_page = self.paginator.get_page(after=second_page.next_cursor)
+
+        self.assertEqual(list(second_page), self.devices[5:10])
+        self.assertEqual(list(third_page), self.devices[10:])
+        self.assertFalse(third_page.has_next())
+        self.assertTrue(third_page.has_previous())
+
+        previous_page = self.paginator.get_page(before=third_page.previous_cursor)
+        self.assertEqual(list(previous_page), self.devices[5:10])
+        self.assertTrue(previous_page.has_previous())
+
+        first_page = self.paginator.get_page(before=previous_page.previous_cursor)
+        self.assertEqual(list(first_page), self.devices[:5])
+        self.assertFalse(first_page.has_previous())
+
+    def test_last_page(self):
+        page = self.paginator.get_page(last=True)
+
+        self.assertEqual(list(page), self.devices[7:])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_descending_order(self):
+        paginator = CursorPaginator(Device.objects.all(), 5, descending=True)
+
+        first_page = paginator.get_page()
+        second_page = paginator.get_page(after=first_page.next_cursor)
+
+        self.assertEqual(list(first_page), self.devices[:-6:-1])
+        self.assertEqual(list(second_page), self.devices[-6:-11:-1])
+
+    def test_page_takes_single_query(self):
+        cursor = encode_cursor(self.devices[5])
+
+        with self.assertNumQueries(1):
+            page = self.paginator.get_page(after=cursor)
+            list(page)
+
+    def test_malformed_cursor_returns_first_page(self):
+        page = self.paginator.get_page(after='malformed')
+
+        self.assertEqual(list(page), self.devices[:5])
+
+    def test_cursor_round_trip(self):
+        device = self.devices[3]
+
+        self.assertEqual(decode_cursor(encode_cursor(device)),
+                         (device.timestamp, device.id))
+
+    def test_page_size_parameter(self):
+        request = RequestFactory().get('/', {'page_size': 3})
+
+        self.assertEqual(len(paginate(request, Device.objects.all())), 3)
+
+    def test_links_keep_other_parameters(self):
+        request = RequestFactory().get('/', {'page_size': 3, 'q': 'a b',
+                                             'after': 'cursor'})
+
+        page = paginate(request, Device.objects.all())
+
+        self.assertEqual(page.query_string, 'page_size=3&q=a+b&')
+
+    def test_links_without_other_parameters(self):
+        request = RequestFactory().get('/', {'last': ''})
+
+        self.assertEqual(paginate(request, Device.objects.all()).query_string,
+                         '')
@@ -0,0 +1,71 @@
+from django.test import SimpleTestCase
+
+from device.push import push_devices, device_url
+from device.tests.device_stub import DeviceStub
+
+
+class PushDevicesTestCase(SimpleTestCase):
+    def push(self, stub, ip_addresses, **kwargs):
+        options = {'concurrency': 10, 'timeout': 1, 'retries': 2,
+                   'backoff': 0.01}
+        options.update(kwargs)
+        return push_devices(ip_addresses, url_template=stub.url_template,
+                            **options)
+
+    def test_devices_are_notified(self):
+        with DeviceStub() as stub:
+            failed = self.push(stub, ['127.0.0.1'] * 3)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(stub.requests, ['POST /update HTTP/1.1'] * 3)
+
+    def test_connections_are_reused(self):
+        with DeviceStub() as stub:
+            failed = self.push(stub, ['127.0.0.1'] * 100, concurrency=5)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(stub.requests), 100)
+        self.assertLessEqual(stub.connection_count, 5)
+
+    def test_failed_requests_are_retried(self):
+        with DeviceStub(failures=2) as stub:
+            failed = self.push(stub, ['127.0.0.1'])
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_devices_not_notified_are_returned(self):
+        with DeviceStub(failures=10) as stub:
+            failed = self.push(stub, ['127.0.0.1'])
+
+        self.assertEqual(failed, ['127.0.0.1'])
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        with DeviceStub(status_code=404) as stub:
+            failed = self.push(stub, ['127.0.0.1'])
+
+        self.assertEqual(failed, ['127.0.0.1'])
+        self.assertEqual(len(stub.requests), 1)
+
+    def test_slow_device_times_out(self):
+        with DeviceStub(delay=1) as stub:
+            failed = self.push(stub, ['127.0.0.1'], timeout=0.1, retries=0)
+
+        self.assertEqual(failed, ['127.0.0.1'])
+
+    def test_unreachable_device(self):
+        with DeviceStub() as stub:
+            url_template = stub.url_template
+
+        failed = push_devices(['127.0.0.1'], url_template=url_template,
+                              timeout=1, retries=1, backoff=0.01)
+
+        self.assertEqual(failed, ['127.0.0.1'])
+
+    def test_device_url(self):
+        self.assertEqual(device_url('http://{ip_address}:8080/update',
+                                    '192.168.1.1'),
+                         ('192.168.1.1', 8080, '/update'))
+        self.assertEqual(device_url('http://{ip_address}/update?v=1', '::1'),
+                         ('::1', 80, '/update?v=1'))
@@ -0,0 +1,101 @@
+import re
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.shortcuts import reverse
+
+from projektPZ import status
+
+from custom_auth.models import User
+
+from device.models import Device, DeviceGroup, Version
+
+
+class QueryPlanTestCase(TransactionTestCase):
+    """
+    Checks plans of the queries made by the list and detail views, which
+    must find their rows using indexes instead of scanning whole tables.
+    """
+    # "SCAN device_device" or "SCAN TABLE device_device" in older SQLite,
+    # also full scans of the covering indexes.
+    FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)')
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.client.force_login(self.owner)
+
+        self.device = Device.objects.create(name='device', owner=self.owner,
+                                            ip_address='192.168.1.1')
+        self.group = DeviceGroup.objects.create(name='group', owner=self.owner)
+        self.group.devices.add(self.device)
+
+        for versioned_object in (self.device, self.group):
+            version = Version(name='version')
+            version.publish(versioned_object, self.owner)
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        return [step for step in plan if self.FULL_SCAN.match(step)]
+
+    def assertNoFullScans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            self.assertEqual(self.full_scans(query['sql']), [],
+                             msg=f'{url}: {query["sql"]}')
+
+    def test_device_views(self):
+        for url_name in ('device_details', 'device_version_list',
+                         'device_check_in'):
+            self.assertNoFullScans(reverse(
+                url_name, kwargs={'device_uuid': self.device.uuid}))
+
+    def test_group_views(self):
+        for url_name in ('group_details', 'group_version_list',
+                         'group_added', 'group_available'):
+            self.assertNoFullScans(reverse(
+                url_name, kwargs={'group_uuid': self.group.uuid}))
+
+    def test_available_devices_search(self):
+        self.assertNoFullScans(reverse(
+            'group_available', kwargs={'group_uuid': self.group.uuid}
+        ) + '?q=dev')
+
+    def test_list_views(self):
+        for url_name in ('device_list', 'group_list', 'api_device_list',
+                         'api_group_list', 'dashboard'):
+            self.assertNoFullScans(reverse(url_name))
+
+    def test_paginated_list_views(self):
+        response = self.client.get(reverse('api_device_list'),
+                                   {'page_size': 1})
+        Device.objects.create(name='second', owner=self.owner,
+                              ip_address='192.168.1.2')
+
+        self.assertNoFullScans(
+            reverse('device_list') + f'?after={response.json()["next"]}')
+        self.assertNoFullScans(reverse('device_list') + '?last')
+
+    def test_lists_are_read_in_index_order(self):
+        for queryset in (
+                Device.objects.filter(owner=self.owner, is_active=True),
+                DeviceGroup.objects.filter(owner=self.owner, is_active=True),
+                Version.objects.for_object(self.device)):
+            sql, params = queryset.order_by(
+                'timestamp', 'id')[:5].query.sql_with_params()
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+
+            self.assertNotIn('TEMP B-TREE', plan)
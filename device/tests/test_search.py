@@ -0,0 +1,159 @@
+import json
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.shortcuts import reverse
+
+from projektPZ import status
+
+from custom_auth.models import User
+
+from device.models import Device, DeviceGroup, Version, SearchEntry
+from device.search import search, fts_installed, fts_query
+
+
+class SearchTestCase(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.other_user = User.objects.create_user(username='other',
+                                                   password='password')
+
+        self.device = Device.objects.create(name='Kitchen sensor',
+                                            owner=self.owner,
+                                            ip_address='192.168.1.15')
+        self.group = DeviceGroup.objects.create(name='Thermostats',
+                                                owner=self.owner)
+        Device.objects.create(name='Kitchen sensor', owner=self.other_user,
+                              ip_address='192.168.1.16')
+
+    def search(self, query):
+        return {(entry.kind, entry.object_id)
+                for entry in search(query, self.owner, limit=20)}
+
+    def test_fts_index_is_installed(self):
+        self.assertTrue(fts_installed(connection))
+
+    def test_search_by_word_prefix_of_the_name(self):
+        self.assertEqual(self.search('sens'),
+                         {(SearchEntry.DEVICE, self.device.pk)})
+        self.assertEqual(self.search('KITCH'),
+                         {(SearchEntry.DEVICE, self.device.pk)})
+
+    def test_search_by_ip_address_and_uuid(self):
+        self.assertEqual(self.search('192.168.1.1'),
+                         {(SearchEntry.DEVICE, self.device.pk)})
+        self.assertEqual(self.search(str(self.group.uuid)[:13]),
+                         {(SearchEntry.GROUP, self.group.pk)})
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('kitchen sensor'),
+                         {(SearchEntry.DEVICE, self.device.pk)})
+        self.assertEqual(self.search('kitchen thermostats'), set())
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"kitchen" OR NEAR(* -'), set())
+        self.assertEqual(self.search('-'), set())
+
+    def test_renamed_device_is_found_by_new_name(self):
+        self.device.name = 'Garage camera'
+        self.device.save()
+
+        self.assertEqual(self.search('kitchen'), set())
+        self.assertEqual(self.search('garage'),
+                         {(SearchEntry.DEVICE, self.device.pk)})
+
+    def test_published_versions_are_found(self):
+        version = Version(name='firmware')
+        version.publish(self.group, self.owner)
+        self.group.devices.add(self.device)
+        group_version = Version(name='release')
+        group_version.publish(self.group, self.owner)
+
+        self.assertEqual(self.search('firmware'),
+                         {(SearchEntry.VERSION, version.pk)})
+        # Copies assigned to the members are not indexed.
+        self.assertEqual(self.search('release'),
+                         {(SearchEntry.VERSION, group_version.pk)})
+
+    def test_deactivated_group_and_its_versions_are_not_found(self):
+        version = Version(name='firmware')
+        version.publish(self.group, self.owner)
+
+        self.group.is_active = False
+        self.group.save()
+
+        self.assertEqual(self.search('thermostats'), set())
+        self.assertEqual(self.search('firmware'), set())
+
+    def test_name_matches_are_ranked_first(self):
+        named = Device.objects.create(name=self.device.uuid.hex[:8],
+                                      owner=self.owner,
+                                      ip_address='10.0.0.1')
+
+        entries = search(self.device.uuid.hex[:8], self.owner, limit=20)
+
+        self.assertEqual([entry.object_id for entry in entries],
+                         [named.pk, self.device.pk])
+
+    def test_owner_is_matched_exactly(self):
+        self.assertIn(f'owner : "u{self.owner.id}"',
+                      fts_query(['sensor'], self.owner))
+
+    @override_settings(SEARCH_USE_FTS=False)
+    def test_fallback_searches_prefixes_of_the_values(self):
+        self.assertEqual(self.search('Kitchen'),
+                         {(SearchEntry.DEVICE, self.device.pk)})
+        self.assertEqual(self.search('sensor'), set())
+        self.assertEqual(self.search('192.168.1.1'),
+                         {(SearchEntry.DEVICE, self.device.pk)})
+        self.assertEqual(self.search(str(self.group.uuid)[:13]),
+                         {(SearchEntry.GROUP, self.group.pk)})
+
+
+class SearchApiTestCase(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.client.force_login(self.owner)
+
+    def search(self, query):
+        response = self.client.get(reverse('api_search'), {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()['results']
+
+    def test_search_returns_urls_of_the_objects(self):
+        device = Device.objects.create(name='sensor', owner=self.owner,
+                                       ip_address='10.0.0.1')
+
+        result, = self.search('sensor')
+
+        self.assertEqual(result['kind'], SearchEntry.DEVICE)
+        self.assertEqual(result['uuid'], str(device.uuid))
+        self.assertEqual(result['url'], reverse(
+            'device_details', kwargs={'device_uuid': device.uuid}))
+
+    def test_devices_created_in_bulk_are_found(self):
+        data = [{'name': f'sensor{index}', 'ip_address': '10.0.0.1'}
+                for index in range(3)]
+        self.client.post(reverse('api_device_list'), json.dumps(data),
+                         content_type='application/json')
+
+        self.assertEqual(len(self.search('sensor')), 3)
+
+    def test_devices_deactivated_in_bulk_are_not_found(self):
+        device = Device.objects.create(name='sensor', owner=self.owner,
+                                       ip_address='10.0.0.1')
+
+        self.client.post(reverse('api_device_deactivate'),
+                         json.dumps([str(device.uuid)]),
+                         content_type='application/json')
+
+        self.assertEqual(self.search('sensor'), [])
+
+    def test_anonymous_user_gets_unauthorized_response(self):
+        self.client.logout()
+
+        response = self.client.get(reverse('api_search'), {'q': 'sensor'})
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
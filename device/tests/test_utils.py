@@ -0,0 +1,80 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from device.utils import (checksum, stream_checksum, checksum_files,
+                          hashing_function, parse_range)
+
+
+class ChecksumTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_checksum_of_file_larger_than_chunk(self):
+        content = os.urandom(10000)
+        path = self.write_file('file', content)
+
+        file_checksum = checksum(path, chunk_size=4096)
+
+        self.assertEqual(file_checksum.digest(),
+                         hashing_function(content).digest())
+
+    def test_checksum_of_empty_file(self):
+        path = self.write_file('file', b'')
+
+        self.assertEqual(checksum(path).digest(),
+                         hashing_function(b'').digest())
+
+    def test_stream_checksum(self):
+        content = os.urandom(10000)
+
+        file_checksum = stream_checksum(io.BytesIO(content), chunk_size=4096)
+
+        self.assertEqual(file_checksum.digest(),
+                         hashing_function(content).digest())
+
+    def test_checksum_files_in_parallel(self):
+        first = self.write_file('first', b'first content')
+        second = self.write_file('second', b'second content')
+        missing = os.path.join(self.directory, 'missing')
+
+        digests = list(checksum_files([first, second, missing], workers=2))
+
+        self.assertEqual(digests, [
+            (first, hashing_function(b'first content').digest()),
+            (second, hashing_function(b'second content').digest()),
+            (missing, None)
+        ])
+
+
+class ParseRangeTestCase(SimpleTestCase):
+    def test_range_with_both_ends(self):
+        self.assertEqual(parse_range('bytes=10-19', 100), (10, 10))
+
+    def test_open_range(self):
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 10))
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range('bytes=-30', 100), (70, 30))
+
+    def test_range_past_end_of_file_is_truncated(self):
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 10))
+
+    def test_multiple_ranges_are_ignored(self):
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+
+    def test_not_satisfiable_range(self):
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
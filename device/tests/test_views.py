@@ -1,14 +1,23 @@
+import os
+from datetime import timedelta
+from unittest import mock
 from uuid import uuid4
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TransactionTestCase
+from django.db import connection, IntegrityError
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.shortcuts import reverse
 
 from projektPZ import status
 
 from custom_auth.models import User
 
-from device.models import Device, Version, DeviceGroup
+from device.models import (Device, Version, DeviceGroup, VersionUpload,
+                           Rollout)
+from device.tests.media import MediaTestCase
+from device.utils import hashing_function
 
 
 class DeviceCreateTestCase(TransactionTestCase):
@@ -35,6 +44,22 @@ class DeviceCreateTestCase(TransactionTestCase):
         self.assertEqual(device.name, device_name)
         self.assertRedirects(response, reverse('device_list'))
 
+    def test_create_device_ignores_internal_fields(self):
+        version = Version.objects.create(name='version')
+
+        response = self.client.post(reverse('device_create'), {
+            'name': 'device',
+            'ip_address': '192.168.1.1',
+            'reported_version': version.pk,
+            'is_active': ''
+        })
+
+        device = Device.objects.get(name='device')
+
+        self.assertRedirects(response, reverse('device_list'))
+        self.assertIsNone(device.reported_version)
+        self.assertTrue(device.is_active)
+
     def test_create_device_with_empty_string_name(self):
         device_name = ''
         ip_address = '192.168.1.1'
@@ -81,6 +106,25 @@ class DeviceTestCase(TransactionTestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_device_is_loaded_once(self):
+        self.client.force_login(self.device_owner)
+
+        # Session, user and device.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('device_details',
+                                               kwargs={'device_uuid': self.device.uuid}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_anonymous_user_is_redirected_to_login(self):
+        url = reverse('device_details', kwargs={'device_uuid': self.device.uuid})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertRedirects(response, f'/login/?next={url}',
+                             fetch_redirect_response=False)
+
     def test_not_owner_is_redirected_to_device_list_site(self):
         not_owner = User.objects.create_user(username='not_owner', password='password')
 
@@ -418,6 +462,22 @@ class CreateDeviceVersionTestCase(TransactionTestCase):
         self.assertIsNotNone(version_created)
         self.assertEqual(version_created.versioned_object.id, self.device.id)
 
+    def test_post_computes_checksum_while_uploading(self):
+        self.client.force_login(self.device_owner)
+        version_name = 'version'
+        content = b'example content'
+        version_file = SimpleUploadedFile('testfile.txt', content)
+
+        self.client.post(
+            reverse('device_version_create', kwargs={'device_uuid': self.device.uuid}),
+            data={'name': version_name, 'file': version_file}
+        )
+
+        version_created = Version.objects.get(name=version_name)
+
+        self.assertEqual(bytes(version_created.file_checksum),
+                         hashing_function(content).digest())
+
     def test_post_with_existing_older_version(self):
         old_version_name = 'test'
         old_version = Version.objects.create(versioned_object=self.device,
@@ -448,6 +508,57 @@ class CreateDeviceVersionTestCase(TransactionTestCase):
         self.assertEqual(old_version.uuid, new_version.previous.uuid)
         self.assertIsNotNone(device.version)
 
+    def post_version(self, **fields):
+        """ Creates version with the internal fields sent in the form. """
+        self.client.force_login(self.device_owner)
+        data = {'name': 'version',
+                'file': SimpleUploadedFile('testfile.txt', b'content')}
+        data.update(fields)
+
+        response = self.client.post(
+            reverse('device_version_create',
+                    kwargs={'device_uuid': self.device.uuid}),
+            data=data)
+
+        self.assertRedirects(response,
+                             reverse('device_version_list',
+                                     kwargs={'device_uuid': self.device.uuid}))
+        return Version.objects.get(name='version')
+
+    def test_post_ignores_delta_fields(self):
+        version = self.post_version(
+            delta=SimpleUploadedFile('delta.bin', b'delta'),
+            delta_checksum='checksum', delta_base_checksum='checksum')
+
+        self.assertFalse(version.delta)
+        self.assertIsNone(version.delta_checksum)
+        self.assertIsNone(version.delta_base_checksum)
+
+    def test_post_ignores_integrity_fields(self):
+        version = self.post_version(file_is_corrupted='on',
+                                    file_verified_at='2019-01-01 00:00')
+
+        self.assertFalse(version.file_is_corrupted)
+        self.assertIsNone(version.file_verified_at)
+
+    def test_post_ignores_source_version(self):
+        other_version = Version.objects.create(versioned_object=self.device,
+                                               name='other')
+
+        version = self.post_version(source=other_version.pk)
+
+        self.assertIsNone(version.source)
+
+    def test_post_ignores_sequence(self):
+        version = self.post_version(sequence=100)
+
+        self.assertEqual(version.sequence, 1)
+
+    def test_post_ignores_rolled_back_flag(self):
+        version = self.post_version(is_rolled_back='on')
+
+        self.assertFalse(version.is_rolled_back)
+
 
 class DeviceGroupTestCase(TransactionTestCase):
     def setUp(self):
@@ -625,6 +736,15 @@ class DeviceGroupCreateTestCase(TransactionTestCase):
         self.assertEqual(new_device_group.name, new_group_name)
         self.assertEqual(new_device_group.is_active, True)
 
+    def test_create_group_ignores_version(self):
+        version = Version.objects.create(name='version')
+
+        self.client.force_login(self.owner)
+        self.client.post(reverse('group_create'),
+                         data={'name': 'new', '_version': version.pk})
+
+        self.assertIsNone(DeviceGroup.objects.get(owner=self.owner).version)
+
     def test_create_group_with_too_long_name(self):
         new_group_name = 'x' * 100
 
@@ -658,6 +778,39 @@ class DeviceGroupAvailableDeviceTestCase(TransactionTestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def get_available(self, **params):
+        self.client.force_login(self.owner)
+        response = self.client.get(
+            reverse('group_available', kwargs={'group_uuid': self.device_group.uuid}),
+            params
+        )
+        return set(response.context['devices'])
+
+    def test_available_devices_exclude_members_and_inactive_devices(self):
+        member = Device.objects.create(name='member', owner=self.owner,
+                                       ip_address='192.168.1.2')
+        self.device_group.devices.add(member)
+        Device.objects.create(name='inactive', owner=self.owner,
+                              ip_address='192.168.1.3', is_active=False)
+        not_owner = User.objects.create(username='user', password='password')
+        Device.objects.create(name='other', owner=not_owner,
+                              ip_address='192.168.1.4')
+
+        self.assertEqual(self.get_available(), {self.device})
+
+    def test_search_available_devices_by_name_prefix(self):
+        sensor = Device.objects.create(name='sensor', owner=self.owner,
+                                       ip_address='10.0.0.1')
+
+        self.assertEqual(self.get_available(q='sens'), {sensor})
+        self.assertEqual(self.get_available(q='ensor'), set())
+
+    def test_search_available_devices_by_ip_address_prefix(self):
+        Device.objects.create(name='sensor', owner=self.owner,
+                              ip_address='10.0.0.1')
+
+        self.assertEqual(self.get_available(q='192.168.'), {self.device})
+
     def test_get_group_details_not_as_owner(self):
         not_owner = User.objects.create(username='user', password='password')
 
@@ -919,6 +1072,195 @@ class DeviceGroupAddDeviceTestCase(TransactionTestCase):
         self.assertIsNone(device)
 
 
+class DeviceGroupBulkMembershipTestCase(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.device_group = DeviceGroup.objects.create(name='device_group',
+                                                       owner=self.owner)
+        self.client.force_login(self.owner)
+
+    def create_devices(self, count, name='device', owner=None):
+        Device.objects.bulk_create([
+            Device(name=f'{name}{index}', ip_address='192.168.1.1',
+                   owner=owner or self.owner)
+            for index in range(count)
+        ])
+        return list(Device.objects.filter(name__startswith=name,
+                                          owner=owner or self.owner))
+
+    def post(self, url_name, data):
+        return self.client.post(
+            reverse(url_name, kwargs={'group_uuid': self.device_group.uuid}),
+            data=data)
+
+    def test_add_many_devices_by_uuids(self):
+        devices = self.create_devices(3)
+        self.device_group.devices.add(devices[0])
+
+        response = self.post('group_add', {
+            'device_uuid': [device.uuid for device in devices]})
+
+        self.assertRedirects(response, reverse(
+            'group_added', kwargs={'group_uuid': self.device_group.uuid}))
+        self.assertEqual(set(self.device_group.devices.all()), set(devices))
+
+    def test_add_devices_by_search_query(self):
+        sensors = self.create_devices(2, name='sensor')
+        self.create_devices(2, name='camera')
+        self.create_devices(1, name='old sensor')
+
+        self.post('group_add', {'q': 'sensor'})
+
+        self.assertEqual(set(self.device_group.devices.all()), set(sensors))
+
+    def test_bulk_form_keeps_search_query(self):
+        self.create_devices(2, name='sensor')
+
+        response = self.client.get(
+            reverse('group_available',
+                    kwargs={'group_uuid': self.device_group.uuid}),
+            {'q': 'sensor'})
+
+        self.assertContains(response,
+                            '<input type="hidden" name="q" value="sensor">')
+
+    def test_add_all_devices_skips_other_users_devices(self):
+        devices = self.create_devices(3)
+        other_user = User.objects.create_user(username='other',
+                                              password='password')
+        self.create_devices(2, name='other', owner=other_user)
+
+        self.post('group_add', {'all': 'on'})
+
+        self.assertEqual(set(self.device_group.devices.all()), set(devices))
+
+    def test_add_many_devices_with_one_not_owned_adds_nothing(self):
+        devices = self.create_devices(2)
+        other_user = User.objects.create_user(username='other',
+                                              password='password')
+        other_device, = self.create_devices(1, name='other', owner=other_user)
+
+        response = self.post('group_add', {
+            'device_uuid': [devices[0].uuid, other_device.uuid]})
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(self.device_group.devices.exists())
+
+    def test_add_without_chosen_devices(self):
+        response = self.post('group_add', {})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_remove_devices_by_search_query(self):
+        sensors = self.create_devices(2, name='sensor')
+        cameras = self.create_devices(2, name='camera')
+        self.device_group.devices.add(*sensors, *cameras)
+
+        self.post('group_remove', {'q': 'sensor'})
+
+        self.assertEqual(set(self.device_group.devices.all()), set(cameras))
+
+    def test_remove_with_empty_query_removes_nothing(self):
+        devices = self.create_devices(2)
+        self.device_group.devices.add(*devices)
+
+        response = self.post('group_remove', {'q': ''})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.device_group.devices.count(), 2)
+
+    def test_add_query_count_does_not_depend_on_device_count(self):
+        self.create_devices(150, name='members')
+        self.device_group.add_devices(Device.objects.all())
+        self.create_devices(10, name='sensor')
+
+        # Session, user, group, the transaction, anti-join and insert.
+        with self.assertNumQueries(6):
+            self.post('group_add', {'all': 'on'})
+
+        self.assertEqual(self.device_group.devices.count(), 160)
+
+
+class DashboardTestCase(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.client.force_login(self.owner)
+
+        self.devices = [Device.objects.create(name=f'device_{number}',
+                                              owner=self.owner,
+                                              ip_address='192.168.1.1')
+                        for number in range(3)]
+        self.group = DeviceGroup.objects.create(name='group', owner=self.owner)
+        self.group.devices.add(*self.devices[:2])
+
+        Version(name='old_version').publish(self.group, self.owner)
+        Version(name='new_version').publish(self.group, self.owner)
+
+        # First member is left a version behind.
+        device = Device.objects.get(pk=self.devices[0].pk)
+        device.version = device.version.previous
+        device.save()
+
+    def get_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_counts_of_up_to_date_and_outdated_devices(self):
+        response, _ = self.get_queries()
+
+        self.assertEqual(response.context['totals'], {
+            'device_count': 3, 'up_to_date_count': 2, 'outdated_count': 1
+        })
+        group, = response.context['groups']
+        self.assertEqual((group.device_count, group.up_to_date_count,
+                          group.outdated_count), (2, 1, 1))
+
+    def test_query_count_does_not_depend_on_groups(self):
+        _, query_count = self.get_queries()
+
+        for number in range(3):
+            group = DeviceGroup.objects.create(name=f'group_{number}',
+                                               owner=self.owner)
+            group.devices.add(*self.devices)
+
+        self.assertEqual(self.get_queries()[1], query_count)
+
+    def test_device_list_query_count_does_not_depend_on_devices(self):
+        def device_list_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('device_list'))
+            self.assertContains(response, '1 version behind')
+            return len(queries)
+
+        query_count = device_list_queries()
+        device = Device.objects.get(pk=self.devices[1].pk)
+        device.version = device.version.previous
+        device.save()
+
+        self.assertEqual(device_list_queries(), query_count)
+
+    def test_device_list_links_keep_page_size(self):
+        response = self.client.get(reverse('device_list'), {'page_size': 2})
+
+        page = response.context['devices']
+        self.assertEqual(len(page), 2)
+        self.assertContains(
+            response, f'href="?page_size=2&amp;after={page.next_cursor}"')
+
+    def test_anonymous_user_is_redirected_to_login(self):
+        self.client.logout()
+
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertRedirects(response,
+                             f"{reverse('login')}?next={reverse('dashboard')}")
+
+
 class GroupVersionTestCase(TransactionTestCase):
     def setUp(self):
         self.owner = User.objects.create_user(username='owner',
@@ -1115,3 +1457,460 @@ class CreateGroupVersionTestCase(TransactionTestCase):
         self.assertEqual(new_version.uuid, old_version.next.uuid)
         self.assertEqual(old_version.uuid, new_version.previous.uuid)
         self.assertIsNotNone(device_group.version)
+
+
+    def test_post_with_rollout_waves(self):
+        device = Device.objects.create(name='device', owner=self.owner,
+                                       ip_address='192.168.1.1')
+        self.device_group.devices.add(device)
+
+        self.client.force_login(self.owner)
+        version_file = SimpleUploadedFile('testfile.txt',
+                                          b'example content')
+
+        response = self.client.post(
+            reverse('group_version_create',
+                    kwargs={'group_uuid': self.device_group.uuid}),
+            data={'name': 'version', 'file': version_file,
+                  'waves': '50,100', 'wave_delay': 10}
+        )
+
+        rollout = Rollout.objects.get(group=self.device_group)
+
+        self.assertRedirects(response,
+                             reverse('group_version_list',
+                                     kwargs={'group_uuid': self.device_group.uuid})
+                             )
+        self.assertEqual(list(rollout.waves.values_list('percentage', flat=True)),
+                         [50, 100])
+        self.assertEqual(rollout.started_waves, 1)
+        self.assertIsNotNone(Device.objects.get(pk=device.pk).version)
+
+    def test_post_with_values_of_every_wave(self):
+        self.client.force_login(self.owner)
+        version_file = SimpleUploadedFile('testfile.txt',
+                                          b'example content')
+
+        self.client.post(
+            reverse('group_version_create',
+                    kwargs={'group_uuid': self.device_group.uuid}),
+            data={'name': 'version', 'file': version_file,
+                  'waves': '10,50,100', 'wave_delay': '5,30,0',
+                  'success_threshold': '0.9,0.5,0'}
+        )
+
+        rollout = Rollout.objects.get(group=self.device_group)
+        self.assertEqual(
+            list(rollout.waves.order_by('position').values_list(
+                'percentage', 'delay', 'success_threshold')),
+            [(10, timedelta(minutes=5), 0.9),
+             (50, timedelta(minutes=30), 0.5),
+             (100, timedelta(minutes=0), 0)])
+
+    def test_post_with_wrong_number_of_wave_values(self):
+        self.client.force_login(self.owner)
+        version_file = SimpleUploadedFile('testfile.txt',
+                                          b'example content')
+
+        response = self.client.post(
+            reverse('group_version_create',
+                    kwargs={'group_uuid': self.device_group.uuid}),
+            data={'name': 'version', 'file': version_file,
+                  'waves': '50,100', 'wave_delay': '5,30,60'}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Rollout.objects.exists())
+
+    def test_post_with_invalid_rollout_waves(self):
+        self.client.force_login(self.owner)
+        version_file = SimpleUploadedFile('testfile.txt',
+                                          b'example content')
+
+        response = self.client.post(
+            reverse('group_version_create',
+                    kwargs={'group_uuid': self.device_group.uuid}),
+            data={'name': 'version', 'file': version_file,
+                  'waves': '50,10'}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(DeviceGroup.objects.get(pk=self.device_group.pk).version)
+
+    def test_halt_rollout(self):
+        version = Version(name='version')
+        version.publish(self.device_group, self.owner,
+                        waves=[(50, timedelta(0), 0), (100, timedelta(0), 0)])
+        rollout = Rollout.objects.get(version=version)
+
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse('group_rollout_halt',
+                    kwargs={'group_uuid': self.device_group.uuid,
+                            'rollout_uuid': rollout.uuid})
+        )
+
+        self.assertRedirects(response,
+                             reverse('group_version_list',
+                                     kwargs={'group_uuid': self.device_group.uuid})
+                             )
+        self.assertEqual(Rollout.objects.get(pk=rollout.pk).status,
+                         Rollout.HALTED)
+
+    def test_rollback_group_version(self):
+        old_version = Version(name='old_version')
+        old_version.publish(self.device_group, self.owner)
+        Version(name='new_version').publish(self.device_group, self.owner)
+
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse('group_version_rollback',
+                    kwargs={'group_uuid': self.device_group.uuid})
+        )
+
+        self.assertRedirects(response,
+                             reverse('group_version_list',
+                                     kwargs={'group_uuid': self.device_group.uuid})
+                             )
+        self.assertEqual(
+            DeviceGroup.objects.get(pk=self.device_group.pk).version,
+            old_version
+        )
+
+    def test_rollback_without_previous_version(self):
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse('group_version_rollback',
+                    kwargs={'group_uuid': self.device_group.uuid})
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+class VersionUploadTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.device = Device.objects.create(name='device',
+                                            owner=self.owner,
+                                            ip_address='192.168.1.1')
+        self.content = b'first chunk|second chunk'
+
+        self.client.force_login(self.owner)
+
+    def start_upload(self):
+        response = self.client.post(
+            reverse('device_version_upload',
+                    kwargs={'device_uuid': self.device.uuid}),
+            data={'name': 'version', 'size': len(self.content)}
+        )
+        return response.json()
+
+    def put_chunk(self, upload, offset, data):
+        return self.client.put(f'{upload["url"]}?offset={offset}', data=data,
+                               content_type='application/octet-stream')
+
+    def test_upload_chunks_in_any_order_and_finalize(self):
+        upload = self.start_upload()
+
+        self.put_chunk(upload, 12, self.content[12:])
+        self.put_chunk(upload, 0, self.content[:12])
+        response = self.client.post(upload['finalize_url'])
+
+        device = Device.objects.get(pk=self.device.pk)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(device.version.name, 'version')
+        self.assertEqual(bytes(device.version.file_checksum),
+                         hashing_function(self.content).digest())
+        self.assertEqual(device.version.file.read(), self.content)
+        self.assertFalse(VersionUpload.objects.exists())
+
+    def test_status_lists_missing_ranges(self):
+        upload = self.start_upload()
+
+        self.put_chunk(upload, 12, self.content[12:])
+        response = self.client.get(upload['url'])
+
+        self.assertEqual(response.json()['missing'], [[0, 12]])
+
+    def test_finalize_with_missing_chunks(self):
+        upload = self.start_upload()
+
+        self.put_chunk(upload, 0, self.content[:12])
+        response = self.client.post(upload['finalize_url'])
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIsNone(Device.objects.get(pk=self.device.pk).version)
+
+    def test_finalize_can_be_retried_after_integrity_error(self):
+        upload = self.start_upload()
+        self.put_chunk(upload, 0, self.content)
+
+        publish = Version.publish
+
+        def failing_publish(version, *args, **kwargs):
+            publish(version, *args, **kwargs)
+            raise IntegrityError()
+
+        with mock.patch.object(Version, 'publish', failing_publish):
+            response = self.client.post(upload['finalize_url'])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(Device.objects.get(pk=self.device.pk).version)
+
+        response = self.client.post(upload['finalize_url'])
+
+        device = Device.objects.get(pk=self.device.pk)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(device.version.file.read(), self.content)
+
+    def test_finalize_without_part_file(self):
+        upload = self.start_upload()
+        self.put_chunk(upload, 0, self.content)
+        VersionUpload.objects.get().delete_part_file()
+
+        response = self.client.post(upload['finalize_url'])
+
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertFalse(VersionUpload.objects.exists())
+
+    def test_chunk_outside_of_file(self):
+        upload = self.start_upload()
+
+        response = self.put_chunk(upload, len(self.content), b'data')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_for_upload_of_other_user(self):
+        upload = self.start_upload()
+        not_owner = User.objects.create_user(username='not_owner',
+                                             password='password')
+
+        self.client.force_login(not_owner)
+        response = self.put_chunk(upload, 0, self.content[:12])
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class VersionDownloadTestCase(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.device = Device.objects.create(name='device',
+                                            owner=self.owner,
+                                            ip_address='192.168.1.1')
+        self.content = b'example content'
+        self.version = self.create_version(self.content)
+        self.url = reverse('version_download',
+                           kwargs={'version_uuid': self.version.uuid})
+        self.etag = f'"{hashing_function(self.content).hexdigest()}"'
+
+    def test_download_as_owner(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_download_as_device(self):
+        response = self.client.get(self.url,
+                                   HTTP_X_DEVICE_UUID=str(self.device.uuid))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_download_without_access(self):
+        not_owner = User.objects.create_user(username='not_owner',
+                                             password='password')
+
+        self.client.force_login(not_owner)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_download_as_unknown_device(self):
+        response = self.client.get(self.url, HTTP_X_DEVICE_UUID=str(uuid4()))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_not_modified_for_matching_etag(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_request(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=8-')
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[8:])
+        self.assertEqual(response['Content-Range'],
+                         f'bytes 8-{len(self.content) - 1}/{len(self.content)}')
+
+    def test_range_is_ignored_for_changed_file(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=8-',
+                                   HTTP_IF_RANGE='"other"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_not_satisfiable_range(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-200')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_416_RANGE_NOT_SATISFIABLE)
+
+    def test_corrupted_file_is_not_sent(self):
+        self.version.file_is_corrupted = True
+        self.version.save()
+
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @override_settings(VERSION_DOWNLOAD_OFFLOAD='X-Accel-Redirect')
+    def test_download_offloaded_to_web_server(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/internal-media/' + self.version.file.name)
+        self.assertEqual(response.content, b'')
+
+    def test_delta_is_sent_to_device_with_base_version(self):
+        base_content = os.urandom(100000)
+        base_version = self.create_version(base_content)
+        new_version = self.create_version(base_content + b'changed')
+        new_version.previous = base_version
+        new_version.save()
+        new_version.build_delta()
+
+        self.client.force_login(self.owner)
+        response = self.client.get(
+            reverse('version_download',
+                    kwargs={'version_uuid': new_version.uuid}),
+            {'from': str(base_version.uuid)}
+        )
+
+        self.assertEqual(response['X-Version-Artifact'], 'delta')
+        self.assertLess(len(b''.join(response.streaming_content)),
+                        len(base_content))
+
+
+class DeviceCheckInTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.owner = User.objects.create_user(username='owner',
+                                              password='password')
+        self.device = Device.objects.create(name='device',
+                                            owner=self.owner,
+                                            ip_address='192.168.1.1')
+        self.url = reverse('device_check_in',
+                           kwargs={'device_uuid': self.device.uuid})
+
+    def set_version(self, name='version'):
+        version = Version.objects.create(versioned_object=self.device,
+                                         name=name,
+                                         file_checksum=b'\x01\x02')
+        self.device.version = version
+        self.device.save()
+        return version
+
+    def test_check_in_without_version(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'version': None})
+
+    def test_check_in_returns_assigned_version(self):
+        version = self.set_version()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['version'], {
+            'uuid': str(version.uuid),
+            'name': 'version',
+            'checksum': '0102',
+            'download_url': reverse('version_download',
+                                    kwargs={'version_uuid': version.uuid})
+        })
+        self.assertEqual(response['ETag'], f'"{version.uuid.hex}"')
+
+    def test_unchanged_device_is_answered_from_cache(self):
+        self.set_version()
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_version_change_invalidates_cache(self):
+        self.set_version()
+        etag = self.client.get(self.url)['ETag']
+
+        new_version = self.set_version('new_version')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['version']['uuid'],
+                         str(new_version.uuid))
+
+    def test_group_version_invalidates_cache(self):
+        group = DeviceGroup.objects.create(name='group', owner=self.owner)
+        group.devices.add(self.device)
+        etag = self.client.get(self.url)['ETag']
+
+        group.version = Version.objects.create(versioned_object=group,
+                                               name='group_version')
+        group.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['version']['name'], 'group_version')
+
+    def test_reported_version_is_recorded(self):
+        version = self.set_version()
+
+        self.client.get(self.url, {'current': str(version.uuid)})
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {'current': str(version.uuid)})
+
+        self.assertEqual(Device.objects.get(pk=self.device.pk).reported_version,
+                         version)
+
+    def test_version_of_other_device_is_not_recorded(self):
+        other_device = Device.objects.create(name='device', owner=self.owner,
+                                             ip_address='192.168.1.2')
+        version = Version.objects.create(versioned_object=other_device,
+                                         name='version')
+
+        self.client.get(self.url, {'current': str(version.uuid)})
+
+        self.assertIsNone(Device.objects.get(pk=self.device.pk).reported_version)
+
+    def test_check_in_of_not_existing_device(self):
+        response = self.client.get(reverse('device_check_in',
+                                           kwargs={'device_uuid': uuid4()}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deactivated_device_is_not_found(self):
+        self.client.get(self.url)
+        self.device.is_active = False
+        self.device.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
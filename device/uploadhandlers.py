@@ -0,0 +1,47 @@
+from django.core.files.uploadhandler import (MemoryFileUploadHandler,
+                                             TemporaryFileUploadHandler)
+
+from device.utils import hashing_function
+
+
+class ChecksumUploadHandlerMixin:
+    """
+    Mixin for upload handlers which feeds every chunk it stores into
+    the hashing function, so the checksum of the uploaded file is known
+    as soon as the upload is complete and the file never has to be read
+    back from the disk. Checksum is available as `checksum` attribute
+    of the uploaded file.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Handler may stop other handlers when creating new file,
+        # so the hasher has to be ready before that happens.
+        self.file_checksum = hashing_function()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+
+        # Chunk is only consumed if it is not passed to the next handler.
+        if data is None:
+            self.file_checksum.update(raw_data)
+
+        return data
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+
+        if uploaded_file is not None:
+            uploaded_file.checksum = self.file_checksum.digest()
+
+        return uploaded_file
+
+
+class ChecksumMemoryFileUploadHandler(ChecksumUploadHandlerMixin,
+                                      MemoryFileUploadHandler):
+    pass
+
+
+class ChecksumTemporaryFileUploadHandler(ChecksumUploadHandlerMixin,
+                                         TemporaryFileUploadHandler):
+    pass
@@ -1,5 +1,10 @@
 from django.urls import path
 
+from device.api import (
+    DeviceCollectionApiView, DeviceDeactivateApiView, DeviceApiView,
+    DeviceVersionsApiView, GroupCollectionApiView, GroupDeactivateApiView,
+    GroupApiView, GroupVersionsApiView, GroupDevicesApiView, SearchApiView
+)
 from device.views import (
     DeviceDetailsView, DeviceListView, DeviceCreateView, DeviceDeleteView,
     DeviceVersionCreateView, DeviceVersionListView,
@@ -7,11 +12,16 @@ from device.views import (
     DeviceGroupAddDeviceView, DeviceGroupRemoveDeviceView,
     DeviceGroupAddedDeviceView, DeviceGroupAvailableDeviceView,
     DeviceGroupListView, DeviceGroupDetailsView,
-    GroupVersionCreateView, GroupVersionListView
+    GroupVersionCreateView, GroupVersionListView, GroupRolloutHaltView,
+    GroupVersionRollbackView,
+    DeviceVersionUploadView, GroupVersionUploadView,
+    VersionUploadView, VersionUploadFinalizeView, VersionDownloadView,
+    DeviceCheckInView, DashboardView
 )
 
 
 urlpatterns = [
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('devices/', DeviceListView.as_view(), name='device_list'),
     path('devices/create/', DeviceCreateView.as_view(), name='device_create'),
     path('devices/<uuid:device_uuid>/',
@@ -44,4 +54,42 @@ urlpatterns = [
          GroupVersionCreateView.as_view(), name='group_version_create'),
     path('groups/<uuid:group_uuid>/versions/',
          GroupVersionListView.as_view(), name='group_version_list'),
+    path('groups/<uuid:group_uuid>/versions/rollback/',
+         GroupVersionRollbackView.as_view(), name='group_version_rollback'),
+    path('groups/<uuid:group_uuid>/rollouts/<uuid:rollout_uuid>/halt/',
+         GroupRolloutHaltView.as_view(), name='group_rollout_halt'),
+
+    path('devices/<uuid:device_uuid>/versions/uploads/',
+         DeviceVersionUploadView.as_view(), name='device_version_upload'),
+    path('groups/<uuid:group_uuid>/versions/uploads/',
+         GroupVersionUploadView.as_view(), name='group_version_upload'),
+    path('uploads/<uuid:upload_uuid>/',
+         VersionUploadView.as_view(), name='version_upload'),
+    path('uploads/<uuid:upload_uuid>/finalize/',
+         VersionUploadFinalizeView.as_view(), name='version_upload_finalize'),
+
+    path('versions/<uuid:version_uuid>/download/',
+         VersionDownloadView.as_view(), name='version_download'),
+    path('devices/<uuid:device_uuid>/check-in/',
+         DeviceCheckInView.as_view(), name='device_check_in'),
+
+    path('api/devices/',
+         DeviceCollectionApiView.as_view(), name='api_device_list'),
+    path('api/devices/deactivate/',
+         DeviceDeactivateApiView.as_view(), name='api_device_deactivate'),
+    path('api/devices/<uuid:device_uuid>/',
+         DeviceApiView.as_view(), name='api_device_details'),
+    path('api/devices/<uuid:device_uuid>/versions/',
+         DeviceVersionsApiView.as_view(), name='api_device_versions'),
+    path('api/groups/',
+         GroupCollectionApiView.as_view(), name='api_group_list'),
+    path('api/groups/deactivate/',
+         GroupDeactivateApiView.as_view(), name='api_group_deactivate'),
+    path('api/groups/<uuid:group_uuid>/',
+         GroupApiView.as_view(), name='api_group_details'),
+    path('api/groups/<uuid:group_uuid>/devices/',
+         GroupDevicesApiView.as_view(), name='api_group_devices'),
+    path('api/groups/<uuid:group_uuid>/versions/',
+         GroupVersionsApiView.as_view(), name='api_group_versions'),
+    path('api/search/', SearchApiView.as_view(), name='api_search'),
 ]
@@ -1,37 +1,246 @@
+import mmap
+import os
+import re
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import sha3_512 as hashing_function
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from device.push import push_devices
+from device.storage import blob_path
+
+
+CHECKSUM_CHUNK_SIZE = 8 * 1024 * 1024
+
 
 def uploaded_file_path(instance, filename):
     """
-    Generates unique path for the uploaded file to be used.
+    Generates path for the uploaded file to be used. Files with known
+    checksum are stored under the path derived from their content,
+    so identical files uploaded many times share a single blob.
     :param instance: Version object.
     :param filename: Name of the file to be used.
     :return: Path where file should be saved.
     """
+    if instance.file_checksum:
+        return blob_path(instance.file_checksum)
+
     return f'{instance.versioned_object.uuid}/{uuid.uuid4()}_{filename}'
 
 
-def checksum(file_name, chunk_size=4096):
+def uploaded_delta_path(instance, filename):
+    """
+    Generates path for the delta of the version, deltas are stored
+    next to the full files under the path derived from their content.
+    :param instance: Version object.
+    :param filename: Name of the file to be used.
+    :return: Path where delta should be saved.
+    """
+    return blob_path(instance.delta_checksum)
+
+
+def checksum(file_name, chunk_size=CHECKSUM_CHUNK_SIZE,
+             max_bytes_per_second=None):
     """
-    Generates checksum for given file.
+    Generates checksum for given file. File is mapped to memory,
+    so it is hashed without being copied to Python objects.
     :param file_name: Name of the file for which checksum is to be generated.
-    :param chunk_size: Size of chunks to be loaded to memory at a time.
+    :param chunk_size: Size of chunks to be hashed at a time.
+    :param max_bytes_per_second: Limit of the reading speed, if any.
     :return: Checksum of the file (check hashing_function is this file).
     """
     file_checksum = hashing_function()
+    start = time.monotonic()
+
     with open(file_name, 'rb') as file:
-        for chunk in iter(lambda: file.read(chunk_size), b''):
-            file_checksum.update(chunk)
+        if os.fstat(file.fileno()).st_size == 0:
+            return file_checksum
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset in range(0, len(view), chunk_size):
+                    with view[offset:offset + chunk_size] as chunk:
+                        file_checksum.update(chunk)
+
+                    if max_bytes_per_second:
+                        read = min(offset + chunk_size, len(view))
+                        delay = (start + read / max_bytes_per_second -
+                                 time.monotonic())
+                        if delay > 0:
+                            time.sleep(delay)
+
+    return file_checksum
+
+
+def stream_checksum(file, chunk_size=CHECKSUM_CHUNK_SIZE):
+    """
+    Generates checksum for the content of an open file.
+    :param file: Binary file object read from its current position.
+    :param chunk_size: Size of chunks to be loaded to memory at a time.
+    :return: Checksum of the file (check hashing_function is this file).
+    """
+    file_checksum = hashing_function()
+
+    # Single buffer is reused for all the chunks.
+    buffer = bytearray(chunk_size)
+    with memoryview(buffer) as view:
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+            file_checksum.update(view[:size])
 
     return file_checksum
 
 
-def update_device(ip_address):
-    """ Mocks updating device based on the versions in database. """
-    print(ip_address)
+def _file_digest(file_name):
+    try:
+        return checksum(file_name).digest()
+    except OSError:
+        return None
+
+
+def checksum_files(file_names, workers=None):
+    """
+    Generates checksums of many files in parallel processes.
+    :param file_names: Iterable with names of the files.
+    :param workers: Number of processes, number of CPUs by default.
+    :return: Iterator of (file name, digest) tuples in the order of given
+    names. Digest is None if the file could not be read.
+    """
+    file_names = list(file_names)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        digests = executor.map(_file_digest, file_names)
+        yield from zip(file_names, digests)
+
+
+def uploaded_file_checksum(uploaded_file):
+    """
+    Returns checksum of the uploaded file.
+    Checksum computed by the upload handlers while the file was streamed
+    in is used if available, otherwise uploaded chunks are hashed.
+    :param uploaded_file: UploadedFile object.
+    :return: Digest of the file (check hashing_function is this file).
+    """
+    file_checksum = getattr(uploaded_file, 'checksum', None)
+    if file_checksum is not None:
+        return file_checksum
+
+    file_checksum = hashing_function()
+    for chunk in uploaded_file.chunks():
+        file_checksum.update(chunk)
+
+    return file_checksum.digest()
+
+
+RANGE_HEADER_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parses HTTP Range header with a single byte range.
+    :param header: Value of the Range header.
+    :param size: Size of the requested file.
+    :return: Tuple of the first byte and length of the range or None
+    if the header should be ignored and the whole file sent.
+    :raises ValueError: If the range can not be satisfied.
+    """
+    match = RANGE_HEADER_REGEX.match(header.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        start = size - int(last) if int(last) else size
+        start = max(start, 0)
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+
+    if start >= size or start > end:
+        raise ValueError('Range can not be satisfied.')
+
+    return start, end - start + 1
+
+
+class FileRange:
+    """
+    File object limited to the range of the file. Underlying file
+    descriptor is exposed, so the servers can still send the range
+    with sendfile.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def update_devices(ip_addresses):
+    """
+    Notifies the devices about their versions in database, all at once.
+    Notifications are only printed if DEVICE_PUSH_URL is not set.
+    :param ip_addresses: Iterable with the addresses of the devices.
+    :return: List of addresses of the devices not notified.
+    """
+    if settings.DEVICE_PUSH_URL is None:
+        for ip_address in ip_addresses:
+            print(ip_address)
+        return []
+
+    return push_devices(ip_addresses)
 
 
 def update_device_group(group_uuid):
     """ Mocks updating device group based on the versions in database. """
     print(group_uuid)
+
+
+def check_in_cache_key(device_uuid):
+    return f'device-check-in:{device_uuid}'
+
+
+def invalidate_check_in(device_uuids):
+    """
+    Removes cached check-in responses of the devices, once the transaction
+    changing them is committed, so outdated data is not cached again.
+    :param device_uuids: Iterable with the uuids of the devices.
+    """
+    keys = [check_in_cache_key(device_uuid) for device_uuid in device_uuids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def batches(items, batch_size=None):
+    """
+    Splits list into batches, by default small enough to be used
+    as parameters of one query.
+    """
+    batch_size = batch_size or settings.API_BATCH_SIZE
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
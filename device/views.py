@@ -1,41 +1,46 @@
 import json
-
-from django.http import JsonResponse
-from django.shortcuts import render, redirect
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import (JsonResponse, HttpResponse, FileResponse,
+                         HttpResponseNotModified)
+from django.shortcuts import render, redirect, reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.contenttypes.models import ContentType
 from django.views import View
+from django.db.models import Count
 from django.db import transaction, IntegrityError
-from django.utils import timezone
-from django.core.paginator import Paginator
+from django.utils.http import http_date, parse_etags, quote_etag
 
+from projektPZ import TEMPLATE_404
 from projektPZ import status
 
-from device.models import Device, Version, DeviceGroup
+from device.models import (Device, Version, DeviceGroup, Rollout,
+                           VersionUpload, VersionUploadChunk)
 from device.forms import (DeviceForm, VersionForm, DeviceEditForm,
-                          DeviceGroupForm, DeviceGroupDeviceForm)
-from device.mixins import DevicePermissionMixin, DeviceGroupsPermissionMixin
+                          DeviceGroupForm, DeviceGroupDevicesForm,
+                          VersionUploadForm, RolloutForm)
+from device.managers import up_to_date_condition
+from device.mixins import (DevicePermissionMixin, DeviceGroupsPermissionMixin,
+                           check_owned_objects)
+from device.pagination import paginate
+from device.storage import AssembledFile
+from device.utils import (checksum, hashing_function, uploaded_file_checksum,
+                          parse_range, FileRange, check_in_cache_key)
 
 
 class DeviceDetailsView(DevicePermissionMixin, LoginRequiredMixin, View):
     TEMPLATE = 'device/device_details.html'
 
     def get(self, request, device_uuid):
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
-        if response is not None:
-            return response
-
-        device = Device.objects.get(uuid=device_uuid, is_active=True)
+        device = self.device
         return render(request, self.TEMPLATE, context={'device': device})
 
     def post(self, request, device_uuid):
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
-        if response is not None:
-            return response
-
-        device = Device.objects.get(uuid=device_uuid, is_active=True)
+        device = self.device
         device_form = DeviceEditForm(request.POST)
 
         if device_form.is_valid():
@@ -57,12 +62,10 @@ class DeviceListView(LoginRequiredMixin, View):
     TEMPLATE = 'device/device_list.html'
 
     def get(self, request):
-        devices = Device.objects.filter(owner=request.user,
-                                        is_active=True).order_by('timestamp')
+        devices = Device.objects.filter(
+            owner=request.user, is_active=True).with_update_status()
 
-        paginator = Paginator(devices, 5)
-        page = request.GET.get('page', 1)
-        paginated_devices = paginator.get_page(page)
+        paginated_devices = paginate(request, devices)
 
         return render(request, self.TEMPLATE, context={'devices': paginated_devices})
 
@@ -95,12 +98,7 @@ class DeviceCreateView(LoginRequiredMixin, View):
 
 class DeviceDeleteView(DevicePermissionMixin, LoginRequiredMixin, View):
     def post(self, request, device_uuid):
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
-        if response is not None:
-            return response
-
-        device = Device.objects.get(uuid=device_uuid, is_active=True)
+        device = self.device
         device.is_active = False
         device.save()
 
@@ -113,21 +111,11 @@ class DeviceVersionCreateView(DevicePermissionMixin, LoginRequiredMixin, View):
                                'Contact the service administrator.')
 
     def get(self, request, device_uuid):
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
-        if response is not None:
-            return response
-
         context = {'device_uuid': device_uuid}
         return render(request, self.TEMPLATE, context=context)
 
     def post(self, request, device_uuid):
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
-        if response is not None:
-            return response
-
-        device = Device.objects.get(uuid=device_uuid, is_active=True)
+        device = self.device
         version_form = VersionForm(data=request.POST, files=request.FILES)
 
         if version_form.is_valid() is False:
@@ -141,26 +129,14 @@ class DeviceVersionCreateView(DevicePermissionMixin, LoginRequiredMixin, View):
                           status=status.HTTP_400_BAD_REQUEST)
 
         new_version = version_form.save(commit=False)
-        old_version = device.version
 
-        new_version.creator = request.user
-        new_version.versioned_object = device
-        new_version.previous = old_version
+        # Checksum has been computed while the file was uploaded.
+        new_version.file_checksum = uploaded_file_checksum(
+            version_form.cleaned_data['file'])
 
         try:
             with transaction.atomic():
-                new_version.save()
-
-                # Add checksum for already created file.
-                new_version.generate_checksum()
-
-                if old_version is not None:
-                    old_version.next = new_version
-                    old_version.save()
-
-                device.last_updated = timezone.now()
-                device.version = new_version
-                device.save()
+                new_version.publish(device, request.user)
 
         except IntegrityError:
             # If any integrity error is raised inform the user but
@@ -185,22 +161,13 @@ class GroupVersionCreateView(DeviceGroupsPermissionMixin,
                                'Contact the service administrator.')
 
     def get(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
         context = {'group_uuid': group_uuid}
         return render(request, self.TEMPLATE, context=context)
 
     def post(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
+        group = self.group
         version_form = VersionForm(data=request.POST, files=request.FILES)
+        rollout_form = RolloutForm(data=request.POST)
 
         if version_form.is_valid() is False:
             context = {
@@ -212,27 +179,26 @@ class GroupVersionCreateView(DeviceGroupsPermissionMixin,
                           context=context,
                           status=status.HTTP_400_BAD_REQUEST)
 
+        if rollout_form.is_valid() is False:
+            context = {
+                'errors': json.loads(rollout_form.errors.as_json()),
+                'group_uuid': group.uuid
+            }
+
+            return render(request, self.TEMPLATE,
+                          context=context,
+                          status=status.HTTP_400_BAD_REQUEST)
+
         new_version = version_form.save(commit=False)
-        old_version = group.version
 
-        new_version.creator = request.user
-        new_version.versioned_object = group
-        new_version.previous = old_version
+        # Checksum has been computed while the file was uploaded.
+        new_version.file_checksum = uploaded_file_checksum(
+            version_form.cleaned_data['file'])
 
         try:
             with transaction.atomic():
-                new_version.save()
-
-                # Add checksum for already created file.
-                new_version.generate_checksum()
-
-                if old_version is not None:
-                    old_version.next = new_version
-                    old_version.save()
-
-                group.last_updated = timezone.now()
-                group.version = new_version
-                group.save()
+                new_version.publish(group, request.user,
+                                    waves=rollout_form.get_waves())
 
         except IntegrityError:
             # If any integrity error is raised inform the user but
@@ -254,20 +220,13 @@ class DeviceVersionListView(DevicePermissionMixin, LoginRequiredMixin, View):
     TEMPLATE = 'device/device_version_list.html'
 
     def get(self, request, device_uuid):
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
-        if response is not None:
-            return response
-
-        device = Device.objects.get(uuid=device_uuid, is_active=True)
+        device = self.device
 
         device_content_type = ContentType.objects.get_for_model(device)
         versions = Version.objects.filter(object_id=device.id,
                                           content_type=device_content_type)
 
-        paginator = Paginator(versions, 5)
-        page = request.GET.get('page', 1)
-        paginated_versions = paginator.get_page(page)
+        paginated_versions = paginate(request, versions, descending=True)
 
         context = {
             'versions': paginated_versions,
@@ -281,38 +240,60 @@ class GroupVersionListView(DeviceGroupsPermissionMixin,
     TEMPLATE = 'device/group_version_list.html'
 
     def get(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
+        group = self.group
 
         group_content_type = ContentType.objects.get_for_model(group)
         versions = Version.objects.filter(object_id=group.id,
                                           content_type=group_content_type)
 
-        paginator = Paginator(versions, 5)
-        page = request.GET.get('page', 1)
-        paginated_versions = paginator.get_page(page)
+        paginated_versions = paginate(request, versions, descending=True)
+
+        rollouts = group.rollouts.filter(
+            status=Rollout.IN_PROGRESS).select_related('version')
 
         context = {
             'versions': paginated_versions,
+            'rollouts': rollouts,
             'group': group
         }
         return render(request, self.TEMPLATE, context=context)
 
 
+class DashboardView(LoginRequiredMixin, View):
+    """
+    Numbers of the user's devices which are up to date and outdated,
+    in total and per group.
+    """
+    TEMPLATE = 'device/dashboard.html'
+
+    def get(self, request):
+        totals = Device.objects.filter(
+            owner=request.user, is_active=True
+        ).aggregate(
+            device_count=Count('pk'),
+            up_to_date_count=Count('pk', filter=up_to_date_condition())
+        )
+        totals['outdated_count'] = (totals['device_count'] -
+                                    totals['up_to_date_count'])
+
+        groups = DeviceGroup.objects.filter(
+            owner=request.user, is_active=True
+        ).with_update_counts().order_by('name', 'id')
+
+        context = {
+            'totals': totals,
+            'groups': groups
+        }
+        return render(request, self.TEMPLATE, context=context)
+
+
 class DeviceGroupListView(LoginRequiredMixin, View):
     TEMPLATE = 'device/group_list.html'
 
     def get(self, request):
-        groups = DeviceGroup.objects.filter(owner=request.user,
-                                            is_active=True).order_by('timestamp')
+        groups = DeviceGroup.objects.filter(owner=request.user, is_active=True)
 
-        paginator = Paginator(groups, 5)
-        page = request.GET.get('page', 1)
-        paginated_groups = paginator.get_page(page)
+        paginated_groups = paginate(request, groups)
 
         context = {'groups': paginated_groups}
         return render(request, self.TEMPLATE, context=context)
@@ -348,23 +329,13 @@ class DeviceGroupDetailsView(DeviceGroupsPermissionMixin, LoginRequiredMixin, Vi
     TEMPLATE = 'device/group_details.html'
 
     def get(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
+        group = self.group
 
         context = {'group': group}
         return render(request, self.TEMPLATE, context=context)
 
     def post(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
+        group = self.group
 
         group_form = DeviceGroupForm(request.POST)
 
@@ -383,19 +354,21 @@ class DeviceGroupDetailsView(DeviceGroupsPermissionMixin, LoginRequiredMixin, Vi
                           status=status.HTTP_400_BAD_REQUEST)
 
 
-class DeviceGroupAddDeviceView(DeviceGroupsPermissionMixin,
-                               DevicePermissionMixin,
-                               LoginRequiredMixin, View):
+class DeviceGroupMembershipView(DeviceGroupsPermissionMixin,
+                                LoginRequiredMixin, View):
+    """
+    Base of the views adding devices to or removing them from the group.
+    Devices are chosen by repeated `device_uuid` parameter, by search
+    query `q` or with `all`. Only active devices of the group's owner are taken.
+    Subclasses set `change` to the DeviceGroup method applied to the group
+    and every batch of the devices.
+    """
+    change = None
 
     def post(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
+        group = self.group
 
-        group_form = DeviceGroupDeviceForm(request.POST)
+        group_form = DeviceGroupDevicesForm(request.POST)
 
         # If anyone used the endpoint directly
         if group_form.is_valid() is False:
@@ -405,52 +378,27 @@ class DeviceGroupAddDeviceView(DeviceGroupsPermissionMixin,
 
             return JsonResponse(data=data, status=status.HTTP_400_BAD_REQUEST)
 
-        device_uuid = group_form.cleaned_data.get('device_uuid')
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
+        response = check_owned_objects(Device, request,
+                                       group_form.cleaned_data['device_uuid'])
         if response is not None:
             return response
 
-        device = Device.objects.get(uuid=device_uuid, is_active=True)
-        if device not in group.devices.all():
-            group.devices.add(device)
+        owned_devices = Device.objects.filter(owner_id=request.user.id,
+                                              is_active=True)
 
-        return redirect('group_added', group_uuid=group_uuid)
-
-
-class DeviceGroupRemoveDeviceView(DeviceGroupsPermissionMixin,
-                                  DevicePermissionMixin,
-                                  LoginRequiredMixin, View):
-
-    def post(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
-
-        group_form = DeviceGroupDeviceForm(request.POST)
+        with transaction.atomic():
+            for devices in group_form.select_devices(owned_devices):
+                self.change(group, devices)
 
-        # If anyone used the endpoint directly
-        if group_form.is_valid() is False:
-            data = {
-                'errors': json.loads(group_form.errors.as_json())
-            }
+        return redirect('group_added', group_uuid=group_uuid)
 
-            return JsonResponse(data=data, status=status.HTTP_400_BAD_REQUEST)
 
-        device_uuid = group_form.cleaned_data.get('device_uuid')
-        response = self.validate_user_for_device(request=request,
-                                                 device_uuid=device_uuid)
-        if response is not None:
-            return response
+class DeviceGroupAddDeviceView(DeviceGroupMembershipView):
+    change = staticmethod(DeviceGroup.add_devices)
 
-        device = Device.objects.get(uuid=device_uuid, is_active=True)
-        if device in group.devices.all():
-            group.devices.remove(device)
 
-        return redirect('group_added', group_uuid=group_uuid)
+class DeviceGroupRemoveDeviceView(DeviceGroupMembershipView):
+    change = staticmethod(DeviceGroup.remove_devices)
 
 
 class DeviceGroupAddedDeviceView(DeviceGroupsPermissionMixin,
@@ -458,21 +406,19 @@ class DeviceGroupAddedDeviceView(DeviceGroupsPermissionMixin,
     TEMPLATE = 'device/group_added_devices.html'
 
     def get(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
+        group = self.group
+        devices = group.devices.filter(is_active=True).with_update_status()
 
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
-        devices = group.devices.exclude(is_active=False)
+        query = request.GET.get('q', '').strip()
+        if query:
+            devices = devices.search(query)
 
-        paginator = Paginator(devices, 5)
-        page = request.GET.get('page', 1)
-        paginated_devices = paginator.get_page(page)
+        paginated_devices = paginate(request, devices, descending=True)
 
         context = {
             'devices': paginated_devices,
-            'group': group
+            'group': group,
+            'query': query
         }
         return render(request, self.TEMPLATE, context=context)
 
@@ -482,21 +428,21 @@ class DeviceGroupAvailableDeviceView(DeviceGroupsPermissionMixin,
     TEMPLATE = 'device/group_available_devices.html'
 
     def get(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
+        group = self.group
+        devices = Device.objects.filter(
+            owner_id=group.owner_id, is_active=True
+        ).outside_group(group)
 
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
-        devices = Device.objects.exclude(groups=group).exclude(is_active=False).filter(owner=group.owner)
+        query = request.GET.get('q', '').strip()
+        if query:
+            devices = devices.search(query)
 
-        paginator = Paginator(devices, 5)
-        page = request.GET.get('page', 1)
-        paginated_devices = paginator.get_page(page)
+        paginated_devices = paginate(request, devices, descending=True)
 
         context = {
             'devices': paginated_devices,
-            'group': group
+            'group': group,
+            'query': query
         }
         return render(request, self.TEMPLATE, context=context)
 
@@ -505,13 +451,484 @@ class DeviceGroupDeleteView(DeviceGroupsPermissionMixin,
                             LoginRequiredMixin, View):
 
     def post(self, request, group_uuid):
-        response = self.validate_user_for_group(request=request,
-                                                group_uuid=group_uuid)
-        if response is not None:
-            return response
-
-        group = DeviceGroup.objects.get(uuid=group_uuid, is_active=True)
+        group = self.group
         group.is_active = False
         group.save()
 
         return redirect('group_list')
+
+
+class GroupRolloutHaltView(DeviceGroupsPermissionMixin,
+                           LoginRequiredMixin, View):
+
+    def post(self, request, group_uuid, rollout_uuid):
+        rollout = self.group.rollouts.filter(uuid=rollout_uuid).first()
+        if rollout is None:
+            return render(request, TEMPLATE_404,
+                          status=status.HTTP_404_NOT_FOUND)
+
+        rollout.halt()
+
+        return redirect('group_version_list', group_uuid=group_uuid)
+
+
+class GroupVersionRollbackView(DeviceGroupsPermissionMixin,
+                               LoginRequiredMixin, View):
+    NO_PREVIOUS_VERSION_MESSAGE = 'Group has no previous version.'
+
+    def post(self, request, group_uuid):
+        with transaction.atomic():
+            # Group is loaded again to be locked for the rollback.
+            group = DeviceGroup.objects.select_for_update().select_related(
+                '_version').get(pk=self.group.pk)
+            moved_count = group.rollback()
+
+        if moved_count is None:
+            return JsonResponse({
+                'errors': {
+                    'data': [{'message': self.NO_PREVIOUS_VERSION_MESSAGE}]
+                }
+            }, status=status.HTTP_409_CONFLICT)
+
+        return redirect('group_version_list', group_uuid=group.uuid)
+
+
+class VersionUploadStartView(LoginRequiredMixin, View):
+    """
+    Starts chunked upload of the version file. Chunks are then sent with
+    PUT to the upload's url with their offset and the upload is finished
+    by the request to the finalize url, which publishes the version.
+    """
+
+    @staticmethod
+    def upload_data(upload):
+        return {
+            'uuid': upload.uuid,
+            'name': upload.name,
+            'size': upload.size,
+            'chunk_size': settings.VERSION_UPLOAD_CHUNK_SIZE,
+            'missing': upload.missing_ranges,
+            'url': reverse('version_upload',
+                           kwargs={'upload_uuid': upload.uuid}),
+            'finalize_url': reverse('version_upload_finalize',
+                                    kwargs={'upload_uuid': upload.uuid})
+        }
+
+    def start_upload(self, request, versioned_object):
+        upload_form = VersionUploadForm(request.POST)
+
+        if upload_form.is_valid() is False:
+            data = {
+                'errors': json.loads(upload_form.errors.as_json())
+            }
+            return JsonResponse(data=data, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = VersionUpload.objects.create(
+            name=upload_form.cleaned_data['name'],
+            size=upload_form.cleaned_data['size'],
+            versioned_object=versioned_object,
+            owner=request.user
+        )
+        upload.create_part_file()
+
+        return JsonResponse(data=self.upload_data(upload),
+                            status=status.HTTP_201_CREATED)
+
+
+class DeviceVersionUploadView(DevicePermissionMixin, VersionUploadStartView):
+
+    def post(self, request, device_uuid):
+        device = self.device
+        return self.start_upload(request, device)
+
+
+class GroupVersionUploadView(DeviceGroupsPermissionMixin,
+                             VersionUploadStartView):
+
+    def post(self, request, group_uuid):
+        group = self.group
+        return self.start_upload(request, group)
+
+
+class VersionUploadView(LoginRequiredMixin, View):
+    READ_SIZE = 1024 * 1024
+    NOT_FOUND_MESSAGE = 'Upload does not exist.'
+    INVALID_OFFSET_MESSAGE = 'Chunk offset is invalid.'
+    INCOMPLETE_CHUNK_MESSAGE = 'Chunk has not been received completely.'
+
+    @staticmethod
+    def error_response(message, status_code):
+        data = {
+            'errors': {
+                'data': [{
+                    'message': message
+                }]
+            }
+        }
+        return JsonResponse(data=data, status=status_code)
+
+    def get(self, request, upload_uuid):
+        upload = VersionUpload.objects.filter(uuid=upload_uuid,
+                                              owner_id=request.user.id).first()
+        if upload is None:
+            return self.error_response(self.NOT_FOUND_MESSAGE,
+                                       status.HTTP_404_NOT_FOUND)
+
+        return JsonResponse(data=VersionUploadStartView.upload_data(upload))
+
+    def put(self, request, upload_uuid):
+        upload = VersionUpload.objects.filter(uuid=upload_uuid,
+                                              owner_id=request.user.id).first()
+        if upload is None:
+            return self.error_response(self.NOT_FOUND_MESSAGE,
+                                       status.HTTP_404_NOT_FOUND)
+
+        content_length = request.META.get('CONTENT_LENGTH')
+        if not content_length:
+            return self.error_response(self.INCOMPLETE_CHUNK_MESSAGE,
+                                       status.HTTP_411_LENGTH_REQUIRED)
+
+        try:
+            offset = int(request.GET['offset'])
+            size = int(content_length)
+        except (KeyError, ValueError):
+            return self.error_response(self.INVALID_OFFSET_MESSAGE,
+                                       status.HTTP_400_BAD_REQUEST)
+
+        if offset < 0 or size < 0 or offset + size > upload.size:
+            return self.error_response(self.INVALID_OFFSET_MESSAGE,
+                                       status.HTTP_400_BAD_REQUEST)
+
+        # Chunk is written in place as it is received, so chunks sent
+        # in parallel never wait for each other.
+        chunk_checksum = hashing_function()
+        position = offset
+        end = offset + size
+
+        file_descriptor = os.open(upload.path, os.O_WRONLY)
+        try:
+            while position < end:
+                data = request.read(min(self.READ_SIZE, end - position))
+                if not data:
+                    break
+
+                os.pwrite(file_descriptor, data, position)
+                chunk_checksum.update(data)
+                position += len(data)
+        finally:
+            os.close(file_descriptor)
+
+        if position != end:
+            return self.error_response(self.INCOMPLETE_CHUNK_MESSAGE,
+                                       status.HTTP_400_BAD_REQUEST)
+
+        chunk = VersionUploadChunk.objects.create(
+            upload=upload,
+            offset=offset,
+            size=size,
+            checksum=chunk_checksum.digest()
+        )
+
+        data = {
+            'offset': chunk.offset,
+            'size': chunk.size,
+            'checksum': chunk_checksum.hexdigest()
+        }
+        return JsonResponse(data=data, status=status.HTTP_201_CREATED)
+
+
+class VersionUploadFinalizeView(LoginRequiredMixin, View):
+    INCOMPLETE_UPLOAD_MESSAGE = 'Upload has missing chunks.'
+    MISSING_FILE_MESSAGE = ('File of the upload is missing. '
+                            'Upload the version again.')
+    INTEGRITY_ERROR_MESSAGE = ('Integrity error has been encountered. '
+                               'Contact the service administrator.')
+
+    def post(self, request, upload_uuid):
+        upload = VersionUpload.objects.filter(uuid=upload_uuid,
+                                              owner_id=request.user.id).first()
+        if upload is None:
+            return VersionUploadView.error_response(
+                VersionUploadView.NOT_FOUND_MESSAGE, status.HTTP_404_NOT_FOUND)
+
+        versioned_object = upload.versioned_object
+        if versioned_object is None or versioned_object.is_active is False:
+            return VersionUploadView.error_response(
+                VersionUploadView.NOT_FOUND_MESSAGE, status.HTTP_404_NOT_FOUND)
+
+        missing_ranges = upload.missing_ranges
+        if missing_ranges:
+            data = {
+                'errors': {
+                    'data': [{
+                        'message': self.INCOMPLETE_UPLOAD_MESSAGE
+                    }]
+                },
+                'missing': missing_ranges
+            }
+            return JsonResponse(data=data, status=status.HTTP_409_CONFLICT)
+
+        if not os.path.exists(upload.path):
+            upload.delete()
+            return VersionUploadView.error_response(
+                self.MISSING_FILE_MESSAGE, status.HTTP_410_GONE)
+
+        new_version = Version(name=upload.name,
+                              file_checksum=checksum(upload.path).digest())
+
+        with open(upload.path, 'rb') as part_file:
+            # Part file is moved into the storage, not copied.
+            new_version.file = AssembledFile(part_file, name=upload.name)
+
+            try:
+                with transaction.atomic():
+                    new_version.publish(versioned_object, request.user)
+                    upload.delete()
+
+            except IntegrityError:
+                self.restore_part_file(upload, new_version)
+                return VersionUploadView.error_response(
+                    self.INTEGRITY_ERROR_MESSAGE, status.HTTP_400_BAD_REQUEST)
+
+        upload.delete_part_file()
+
+        data = {
+            'uuid': new_version.uuid,
+            'checksum': bytes(new_version.file_checksum).hex()
+        }
+        return JsonResponse(data=data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def restore_part_file(upload, version):
+        """
+        Part file is moved into the storage even if the transaction is
+        rolled back afterwards. It's copied back, as the stored file may be
+        shared already, so finalizing the upload may be retried.
+        """
+        if os.path.exists(upload.path) or not version.file:
+            return
+
+        shutil.copyfile(version.file.path, upload.path)
+
+
+class VersionDownloadView(View):
+    """
+    Download of the version file for the devices and their owners.
+    Devices identify themselves with the X-Device-UUID header. Device
+    sending uuid of its current version in `from` parameter gets the
+    delta instead of the full file if one is available.
+
+    Files are sent by the web server if VERSION_DOWNLOAD_OFFLOAD is set,
+    otherwise they are passed to the WSGI server's file wrapper, which
+    uses sendfile where supported.
+    """
+    DEVICE_UUID_HEADER = 'HTTP_X_DEVICE_UUID'
+    X_ACCEL_REDIRECT = 'X-Accel-Redirect'
+    X_SENDFILE = 'X-Sendfile'
+
+    def has_access(self, request, version):
+        versioned_object = version.versioned_object
+
+        if versioned_object is None:
+            return False
+
+        if request.user.is_authenticated:
+            return versioned_object.owner_id == request.user.id
+
+        try:
+            device_uuid = uuid.UUID(request.META.get(self.DEVICE_UUID_HEADER, ''))
+        except ValueError:
+            return False
+
+        return (isinstance(versioned_object, Device) and
+                versioned_object.is_active and
+                versioned_object.uuid == device_uuid)
+
+    @staticmethod
+    def get_base_version(request):
+        try:
+            base_uuid = uuid.UUID(request.GET.get('from', ''))
+        except ValueError:
+            return None
+
+        return Version.objects.filter(uuid=base_uuid).first()
+
+    def get(self, request, version_uuid):
+        version = Version.objects.filter(uuid=version_uuid).first()
+
+        if version is None or not version.file or \
+                not self.has_access(request, version):
+            return render(request, TEMPLATE_404,
+                          status=status.HTTP_404_NOT_FOUND)
+
+        # Corrupted file must never be sent to the devices.
+        if version.file_is_corrupted:
+            return HttpResponse(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        artifact, artifact_checksum = version.artifact_for(
+            self.get_base_version(request))
+        is_delta = artifact == version.delta
+
+        etag = quote_etag(bytes(artifact_checksum).hex())
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        response = self.file_response(request, artifact, etag)
+
+        filename = f'{version.name}.delta' if is_delta else version.name
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version.timestamp.timestamp())
+        response['Cache-Control'] = 'private'
+        response['X-Version-Artifact'] = 'delta' if is_delta else 'full'
+
+        return response
+
+    def file_response(self, request, artifact, etag):
+        offload = settings.VERSION_DOWNLOAD_OFFLOAD
+
+        # Web server sends the file and handles the ranges on its own.
+        if offload == self.X_ACCEL_REDIRECT:
+            response = HttpResponse(content_type='application/octet-stream')
+            response[offload] = (settings.VERSION_DOWNLOAD_INTERNAL_URL +
+                                 artifact.name)
+            return response
+
+        if offload == self.X_SENDFILE:
+            response = HttpResponse(content_type='application/octet-stream')
+            response[offload] = artifact.path
+            return response
+
+        size = artifact.size
+        byte_range = None
+
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+
+        if range_header and (if_range is None or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(
+                    status=status.HTTP_416_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        file = open(artifact.path, 'rb')
+
+        if byte_range is None:
+            response = FileResponse(file,
+                                    content_type='application/octet-stream')
+        else:
+            start, length = byte_range
+            response = FileResponse(FileRange(file, start, length),
+                                    content_type='application/octet-stream',
+                                    status=status.HTTP_206_PARTIAL_CONTENT)
+            response['Content-Length'] = length
+            response['Content-Range'] = \
+                f'bytes {start}-{start + length - 1}/{size}'
+
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+class DeviceCheckInView(View):
+    """
+    Check-in of the device asking which version it should run. Device may
+    report the version it is running in `current` parameter.
+
+    Responses are cached until the version of the device changes, so
+    unchanged devices (sending If-None-Match header with the ETag of
+    the previous response) are answered without querying the database.
+    """
+    NOT_FOUND_MESSAGE = 'Device does not exist.'
+
+    def get(self, request, device_uuid):
+        try:
+            reported_uuid = str(uuid.UUID(request.GET.get('current', '')))
+        except ValueError:
+            reported_uuid = None
+
+        cache_key = check_in_cache_key(device_uuid)
+        check_in = cache.get(cache_key)
+
+        if check_in is None or (reported_uuid is not None and
+                                reported_uuid != check_in['reported']):
+            check_in = self.check_in(device_uuid, reported_uuid)
+
+            if check_in is None:
+                return JsonResponse({
+                    'errors': {
+                        'data': [{'message': self.NOT_FOUND_MESSAGE}]
+                    }
+                }, status=status.HTTP_404_NOT_FOUND)
+
+            cache.set(cache_key, check_in,
+                      settings.DEVICE_CHECK_IN_CACHE_TIMEOUT)
+
+        etag = check_in['etag']
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(check_in['data'])
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def check_in(device_uuid, reported_uuid):
+        """
+        Records version reported by the device and returns its check-in
+        data to be cached or None if the device does not exist.
+        """
+        device = Device.objects.filter(
+            uuid=device_uuid, is_active=True
+        ).select_related('version', 'reported_version').first()
+
+        if device is None:
+            return None
+
+        reported_version = device.reported_version
+        if reported_version is not None and reported_uuid is None:
+            reported_uuid = str(reported_version.uuid)
+
+        elif (reported_uuid is not None and
+              (reported_version is None or
+               str(reported_version.uuid) != reported_uuid)):
+            # Only versions of the device itself can be reported.
+            version = Version.objects.filter(
+                uuid=reported_uuid,
+                content_type=ContentType.objects.get_for_model(device),
+                object_id=device.pk
+            ).first()
+
+            if version is not None:
+                Device.objects.filter(pk=device.pk).update(
+                    reported_version=version)
+
+        version = device.version
+        if version is None:
+            return {
+                'etag': quote_etag('none'),
+                'data': {'version': None},
+                'reported': reported_uuid
+            }
+
+        return {
+            'etag': quote_etag(version.uuid.hex),
+            'data': {
+                'version': {
+                    'uuid': version.uuid,
+                    'name': version.name,
+                    'checksum': bytes(version.file_checksum).hex(),
+                    'download_url': reverse('version_download',
+                                            kwargs={'version_uuid': version.uuid}),
+                }
+            },
+            'reported': reported_uuid
+        }
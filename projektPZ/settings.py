@@ -137,6 +137,66 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Checksums of uploaded files are computed while they are streamed in.
+FILE_UPLOAD_HANDLERS = [
+    'device.uploadhandlers.ChecksumMemoryFileUploadHandler',
+    'device.uploadhandlers.ChecksumTemporaryFileUploadHandler',
+]
+
+# Size of the chunks suggested to clients of the chunked version uploads.
+VERSION_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Sending of the version files may be offloaded to the web server with
+# 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache, lighttpd).
+VERSION_DOWNLOAD_OFFLOAD = None
+
+# Internal nginx location serving MEDIA_ROOT, used with X-Accel-Redirect.
+VERSION_DOWNLOAD_INTERNAL_URL = '/internal-media/'
+
+# Number of objects on the pages of the lists, may be changed with
+# `page_size` parameter up to MAX_PAGE_SIZE.
+PAGE_SIZE = 5
+MAX_PAGE_SIZE = 100
+
+# Maximum number of objects in the request to the bulk API endpoints
+# and number of objects written by one query.
+API_MAX_BULK_SIZE = 1000
+API_BATCH_SIZE = 100
+
+# Search uses FTS5 index when SQLite supports it, otherwise (or if disabled)
+# prefixes of the names, uuids and ip addresses are searched.
+SEARCH_USE_FTS = True
+SEARCH_RESULTS = 20
+SEARCH_MAX_TERMS = 10
+
+# Devices are notified about new versions with a POST request to this url,
+# e.g. 'http://{ip_address}:8080/update'. Notifications are only printed
+# if it is not set.
+DEVICE_PUSH_URL = None
+
+DEVICE_PUSH_CONCURRENCY = 200
+DEVICE_PUSH_TIMEOUT = 5
+DEVICE_PUSH_RETRIES = 3
+DEVICE_PUSH_BACKOFF = 0.5
+
+# Seconds before undelivered notification is sent again, doubled with every
+# failed attempt (see drain_notifications command).
+NOTIFICATION_RETRY_DELAY = 10
+NOTIFICATION_MAX_RETRY_DELAY = 3600
+
+# Check-in responses are cached, so unchanged devices are answered without
+# querying the database. Cache shared by all of the processes (e.g.
+# memcached) should be used in production.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cached responses are removed when the devices change. Timeout bounds how
+# long response read concurrently with the change may be served.
+DEVICE_CHECK_IN_CACHE_TIMEOUT = 10 * 60
+
 
 # Custom User
 
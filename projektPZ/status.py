@@ -2,7 +2,18 @@
 Status codes in a more mistake-resistant form.
 """
 HTTP_200_OK = 200
+HTTP_201_CREATED = 201
+HTTP_206_PARTIAL_CONTENT = 206
+
+HTTP_304_NOT_MODIFIED = 304
 
 HTTP_400_BAD_REQUEST = 400
+HTTP_401_UNAUTHORIZED = 401
 HTTP_404_NOT_FOUND = 404
 HTTP_403_FORBIDDEN = 403
+HTTP_409_CONFLICT = 409
+HTTP_410_GONE = 410
+HTTP_411_LENGTH_REQUIRED = 411
+HTTP_416_RANGE_NOT_SATISFIABLE = 416
+
+HTTP_503_SERVICE_UNAVAILABLE = 503